@@ -3,22 +3,44 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask, send_from_directory, jsonify
+from werkzeug.exceptions import NotFound
 from flask_cors import CORS
 from src.models.user import db
 from src.models.wallpaper import Wallpaper
 from src.models.report import Report
 from src.models.analytics import AnalyticsEvent, AdPerformance
+from src.models.tag import Tag
+from src.models.blob import ImageBlob
+from src.models.color import WallpaperColor
+from src.models.rollup import AnalyticsRollupHourly, AnalyticsRollupDaily
+from src.models.trending import TrendingScore
 from src.routes.user import user_bp
 from src.routes.auth import auth_bp
 from src.routes.dashboard import dashboard_bp
-from src.routes.wallpapers import wallpapers_bp
 from src.routes.users import users_bp
 from src.routes.reports import reports_bp
 from src.routes.analytics import analytics_bp
+from src.routes.renditions import renditions_bp
+from src.routes.files import files_bp
+from src.utils.migrations import run_migrations
+from src.utils.counters import counter_buffer
+from src.utils.trending import trending
+from src.utils.event_queue import event_queue
+from src.utils.image_tasks import image_processor
+from src.utils.renditions import rendition_cache
+from src.utils.similarity import similarity_index
+from src.utils.storage import storage
+from src.utils.rollups import rollup_scheduler
+from src.utils.event_archive import event_archive
+from src.routes.wallpapers_enhanced import wallpapers_enhanced_bp, UPLOAD_FOLDER
+from src.utils.file_handler import MAX_FILE_SIZE, UploadRequest
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+# Spool large uploads next to where they are stored, so saving one is a link, not a copy
+UploadRequest.spool_folder = UPLOAD_FOLDER
+app.request_class = UploadRequest
 
 # Enable CORS for all routes
 CORS(app)
@@ -26,17 +48,35 @@ CORS(app)
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(auth_bp)
 app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
-app.register_blueprint(wallpapers_bp)
+app.register_blueprint(wallpapers_enhanced_bp)
 app.register_blueprint(users_bp, url_prefix='/api')
 app.register_blueprint(reports_bp, url_prefix='/api')
 app.register_blueprint(analytics_bp)
+app.register_blueprint(renditions_bp)
+app.register_blueprint(files_bp)
 
 # uncomment if you need to use database
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Reject oversized request bodies while they are received; leaves headroom for multipart framing and form fields
+app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE + 1024 * 1024
 db.init_app(app)
 with app.app_context():
-    db.create_all()
+    # Creates missing tables too, under a lock shared by every worker
+    run_migrations(db.engine)
+counter_buffer.init_app(app)
+trending.init_app(app)
+event_queue.init_app(app)
+storage.init_app(app, UPLOAD_FOLDER)
+rendition_cache.init_app(app, UPLOAD_FOLDER)
+image_processor.init_app(app, UPLOAD_FOLDER)
+similarity_index.init_app(app)
+event_archive.init_app(app)
+rollup_scheduler.init_app(app)
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': 'File size too large (max 16MB)'}), 413
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -45,14 +85,19 @@ def serve(path):
     if static_folder_path is None:
             return "Static folder not configured", 404
 
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
+    # send_from_directory already 404s on a missing file; fall back to the SPA entry point then
+    if path != "":
+        try:
+            return send_from_directory(static_folder_path, path)
+        except NotFound:
+            pass
+    try:
+        response = send_from_directory(static_folder_path, 'index.html')
+    except NotFound:
+        return "index.html not found", 404
+    # Always revalidate the entry point so a deploy is picked up immediately
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 
 if __name__ == '__main__':
@@ -2,6 +2,12 @@ from datetime import datetime
 from .user import db
 
 class AnalyticsEvent(db.Model):
+    __table_args__ = (
+        db.Index('ix_analytics_event_wallpaper_type_created', 'wallpaper_id', 'event_type', 'created_at'),
+        db.Index('ix_analytics_event_type_created', 'event_type', 'created_at'),
+        db.Index('ix_analytics_event_created_at', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     event_type = db.Column(db.String(50), nullable=False)  # download, view, like, search, etc.
     wallpaper_id = db.Column(db.Integer, db.ForeignKey('wallpaper.id'))
@@ -11,6 +17,8 @@ class AnalyticsEvent(db.Model):
     user_agent = db.Column(db.Text)
     event_metadata = db.Column(db.Text)  # JSON string for additional data
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # When the row was written; created_at is client/request time and may be much older
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     wallpaper = db.relationship('Wallpaper', backref=db.backref('analytics_events', lazy=True))
@@ -33,6 +41,11 @@ class AnalyticsEvent(db.Model):
         }
 
 class AdPerformance(db.Model):
+    __table_args__ = (
+        db.Index('ix_ad_performance_date', 'date'),
+        db.Index('ix_ad_performance_ad_id_date', 'ad_id', 'date'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     ad_id = db.Column(db.String(100), nullable=False)
     ad_name = db.Column(db.String(200), nullable=False)
@@ -0,0 +1,32 @@
+from datetime import datetime
+from .user import db
+
+class ImageBlob(db.Model):
+    """A stored original, shared by every wallpaper uploaded with the same bytes"""
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), unique=True, nullable=False)  # sha256 hex of the original
+    filename = db.Column(db.String(255), unique=True, nullable=False)
+    thumbnail_filename = db.Column(db.String(255))
+    resolution = db.Column(db.String(20))
+    file_size = db.Column(db.Integer)
+    phash = db.Column(db.String(16))
+    palette = db.Column(db.Text)
+    ref_count = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ImageBlob {self.content_hash[:12]} x{self.ref_count}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'content_hash': self.content_hash,
+            'filename': self.filename,
+            'thumbnail_filename': self.thumbnail_filename,
+            'resolution': self.resolution,
+            'file_size': self.file_size,
+            'phash': self.phash,
+            'palette': self.palette,
+            'ref_count': self.ref_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
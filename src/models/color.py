@@ -0,0 +1,30 @@
+from .user import db
+
+class WallpaperColor(db.Model):
+    """One palette colour of a wallpaper, in CIELAB, filed under its Lab bin for colour search"""
+    __table_args__ = (
+        db.Index('ix_wallpaper_color_bin_wallpaper_id', 'bin', 'wallpaper_id'),
+    )
+    
+    wallpaper_id = db.Column(db.Integer, db.ForeignKey('wallpaper.id', ondelete='CASCADE'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)  # 0 = most dominant
+    bin = db.Column(db.Integer, nullable=False)
+    l = db.Column(db.Float, nullable=False)
+    a = db.Column(db.Float, nullable=False)
+    b = db.Column(db.Float, nullable=False)
+    weight = db.Column(db.Float, nullable=False)  # share of the image's pixels
+    
+    # Relationships
+    wallpaper = db.relationship('Wallpaper', backref=db.backref(
+        'colors', lazy=True, cascade='all, delete-orphan', order_by='WallpaperColor.position'
+    ))
+    
+    def __repr__(self):
+        return f'<WallpaperColor {self.wallpaper_id}:{self.position}>'
+    
+    def to_dict(self):
+        return {
+            'position': self.position,
+            'lab': [round(self.l, 2), round(self.a, 2), round(self.b, 2)],
+            'weight': self.weight
+        }
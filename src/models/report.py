@@ -2,6 +2,12 @@ from datetime import datetime
 from .user import db
 
 class Report(db.Model):
+    __table_args__ = (
+        db.Index('ix_report_status_created_at', 'status', 'created_at'),
+        db.Index('ix_report_wallpaper_id', 'wallpaper_id'),
+        db.Index('ix_report_reporter_id', 'reporter_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     wallpaper_id = db.Column(db.Integer, db.ForeignKey('wallpaper.id'), nullable=False)
     reporter_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -0,0 +1,75 @@
+from datetime import datetime
+from .user import db
+
+class _RollupColumns:
+    # One row per (slice, event type, period); see utils/rollups.py for the dimensions
+    dimension = db.Column(db.String(20), primary_key=True)  # all, category, wallpaper, premium
+    dimension_key = db.Column(db.String(100), primary_key=True)  # '' for all, else category / wallpaper id / '0' or '1'
+    event_type = db.Column(db.String(50), primary_key=True)  # '*' counts every type
+    period_start = db.Column(db.DateTime, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    unique_actors = db.Column(db.Integer)  # estimated distinct users (or anonymous sessions); daily all/category '*' rows only
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'dimension': self.dimension,
+            'dimension_key': self.dimension_key,
+            'event_type': self.event_type,
+            'period_start': self.period_start.isoformat() if self.period_start else None,
+            'count': self.count,
+            'unique_actors': self.unique_actors
+        }
+
+class AnalyticsRollupHourly(_RollupColumns, db.Model):
+    __tablename__ = 'analytics_rollup_hourly'
+    __table_args__ = (
+        # Rebuilding a period deletes by period_start
+        db.Index('ix_analytics_rollup_hourly_period_start', 'period_start'),
+    )
+    
+    def __repr__(self):
+        return f'<AnalyticsRollupHourly {self.dimension}:{self.dimension_key} {self.event_type} {self.period_start}>'
+
+class AnalyticsRollupDaily(_RollupColumns, db.Model):
+    __tablename__ = 'analytics_rollup_daily'
+    __table_args__ = (
+        db.Index('ix_analytics_rollup_daily_period_start', 'period_start'),
+    )
+    
+    def __repr__(self):
+        return f'<AnalyticsRollupDaily {self.dimension}:{self.dimension_key} {self.event_type} {self.period_start}>'
+
+class AnalyticsSketch(db.Model):
+    """HyperLogLog sketch of the distinct actors or sessions seen in one day, for one slice"""
+    __tablename__ = 'analytics_sketch'
+    
+    metric = db.Column(db.String(20), primary_key=True)  # actors, sessions
+    dimension = db.Column(db.String(20), primary_key=True)  # all, category
+    dimension_key = db.Column(db.String(100), primary_key=True)
+    day = db.Column(db.DateTime, primary_key=True)
+    registers = db.Column(db.LargeBinary, nullable=False)  # HyperLogLog.to_bytes()
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AnalyticsSketch {self.metric} {self.dimension}:{self.dimension_key} {self.day}>'
+
+class RollupState(db.Model):
+    """Progress of the incremental rollup job over analytics_event"""
+    __tablename__ = 'analytics_rollup_state'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)  # watermark: every event up to here is merged
+    rebuild_through = db.Column(db.Integer)  # events up to here are merged regardless of the late window
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<RollupState {self.name} {self.last_event_id}>'
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'last_event_id': self.last_event_id,
+            'rebuild_through': self.rebuild_through,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
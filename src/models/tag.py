@@ -0,0 +1,27 @@
+from datetime import datetime
+from .user import db
+
+# Association table; the (tag_id, wallpaper_id) index is the inverted index used for tag filters and counts
+wallpaper_tags = db.Table(
+    'wallpaper_tag',
+    db.Column('wallpaper_id', db.Integer, db.ForeignKey('wallpaper.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_wallpaper_tag_tag_id_wallpaper_id', 'tag_id', 'wallpaper_id')
+)
+
+class Tag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)  # normalized: stripped, lowercase
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    wallpapers = db.relationship('Wallpaper', secondary=wallpaper_tags, backref=db.backref('tag_set', lazy=True))
+    
+    def __repr__(self):
+        return f'<Tag {self.name}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name
+        }
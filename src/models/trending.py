@@ -0,0 +1,15 @@
+from datetime import datetime
+from .user import db
+
+class TrendingScore(db.Model):
+    """Forward-decayed trending score of a wallpaper, overall and within its category; see utils/trending.py"""
+    __tablename__ = 'trending_score'
+    
+    category = db.Column(db.String(100), primary_key=True)  # '' ranks every wallpaper
+    wallpaper_id = db.Column(db.Integer, db.ForeignKey('wallpaper.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False, default=0)
+    epoch = db.Column(db.Integer, nullable=False)  # landmark the score is relative to
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<TrendingScore {self.category}:{self.wallpaper_id} {self.score}>'
@@ -2,6 +2,20 @@ from datetime import datetime
 from .user import db
 
 class Wallpaper(db.Model):
+    __table_args__ = (
+        # Listing: status/category filters sorted by created_at, plus (created_at, id) for cursor paging
+        db.Index('ix_wallpaper_status_created_at', 'status', 'created_at'),
+        db.Index('ix_wallpaper_category_status_created_at', 'category', 'status', 'created_at'),
+        db.Index('ix_wallpaper_created_at_id', 'created_at', 'id'),
+        db.Index('ix_wallpaper_featured', 'featured'),
+        db.Index('ix_wallpaper_uploaded_by', 'uploaded_by'),
+        # Size filters: min_width (and min_height), orientation, size_class
+        db.Index('ix_wallpaper_width_height', 'width', 'height'),
+        db.Index('ix_wallpaper_height', 'height'),
+        db.Index('ix_wallpaper_aspect_ratio', 'aspect_ratio'),
+        db.Index('ix_wallpaper_size_class', 'size_class'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
@@ -10,6 +24,10 @@ class Wallpaper(db.Model):
     category = db.Column(db.String(100), nullable=False)
     tags = db.Column(db.Text)  # JSON string of tags
     resolution = db.Column(db.String(50))  # e.g., "1920x1080"
+    width = db.Column(db.Integer)  # parsed from resolution, see utils/dimensions.py
+    height = db.Column(db.Integer)
+    aspect_ratio = db.Column(db.Float)  # width / height
+    size_class = db.Column(db.String(10))  # sd, hd, fhd, qhd, 4k, 5k, 8k
     file_size = db.Column(db.Integer)  # in bytes
     downloads = db.Column(db.Integer, default=0)
     views = db.Column(db.Integer, default=0)
@@ -17,6 +35,12 @@ class Wallpaper(db.Model):
     status = db.Column(db.String(20), default='pending')  # pending, approved, rejected
     featured = db.Column(db.Boolean, default=False)
     premium = db.Column(db.Boolean, default=False)
+    processing_status = db.Column(db.String(20), default='ready', server_default='ready')  # processing, ready, failed
+    processing_attempts = db.Column(db.Integer, default=0, server_default='0')
+    processing_error = db.Column(db.Text)
+    processing_claimed_at = db.Column(db.DateTime)  # when a worker last took the job; see utils/image_tasks.py
+    phash = db.Column(db.String(16))  # 64-bit dHash as hex, for near-duplicate lookups
+    palette = db.Column(db.Text)  # JSON list of dominant colours with their pixel share
     uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -37,6 +61,10 @@ class Wallpaper(db.Model):
             'category': self.category,
             'tags': self.tags,
             'resolution': self.resolution,
+            'width': self.width,
+            'height': self.height,
+            'aspect_ratio': self.aspect_ratio,
+            'size_class': self.size_class,
             'file_size': self.file_size,
             'downloads': self.downloads,
             'views': self.views,
@@ -44,9 +72,77 @@ class Wallpaper(db.Model):
             'status': self.status,
             'featured': self.featured,
             'premium': self.premium,
+            'processing_status': self.processing_status,
+            'palette': self.palette,
             'uploaded_by': self.uploaded_by,
             'uploader': self.uploader.username if self.uploader else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+
+# Single row of catalog counters, kept current by the Wallpaper mapper events below
+class WallpaperStats(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    total_wallpapers = db.Column(db.Integer, nullable=False, default=0)
+    pending_wallpapers = db.Column(db.Integer, nullable=False, default=0)
+    approved_wallpapers = db.Column(db.Integer, nullable=False, default=0)
+    featured_wallpapers = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<WallpaperStats {self.total_wallpapers}>'
+    
+    def to_dict(self):
+        return {
+            'total_wallpapers': self.total_wallpapers,
+            'pending_wallpapers': self.pending_wallpapers,
+            'approved_wallpapers': self.approved_wallpapers,
+            'featured_wallpapers': self.featured_wallpapers
+        }
+
+STATS_ROW_ID = 1
+
+def _stats_deltas(status=None, featured=False, sign=1):
+    deltas = {'total_wallpapers': 0, 'pending_wallpapers': 0, 'approved_wallpapers': 0, 'featured_wallpapers': 0}
+    if status in ('pending', 'approved'):
+        deltas[f'{status}_wallpapers'] += sign
+    if featured:
+        deltas['featured_wallpapers'] += sign
+    return deltas
+
+def _apply_stats_deltas(connection, deltas):
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    table = WallpaperStats.__table__
+    values = {k: table.c[k] + v for k, v in deltas.items()}
+    values['updated_at'] = datetime.utcnow()
+    connection.execute(table.update().where(table.c.id == STATS_ROW_ID).values(values))
+
+@db.event.listens_for(Wallpaper, 'after_insert')
+def _stats_after_insert(mapper, connection, target):
+    deltas = _stats_deltas(target.status, target.featured)
+    deltas['total_wallpapers'] += 1
+    _apply_stats_deltas(connection, deltas)
+
+@db.event.listens_for(Wallpaper, 'after_delete')
+def _stats_after_delete(mapper, connection, target):
+    deltas = _stats_deltas(target.status, target.featured, sign=-1)
+    deltas['total_wallpapers'] -= 1
+    _apply_stats_deltas(connection, deltas)
+
+@db.event.listens_for(Wallpaper, 'after_update')
+def _stats_after_update(mapper, connection, target):
+    state = db.inspect(target)
+    status = state.attrs.status.history
+    featured = state.attrs.featured.history
+    if not status.has_changes() and not featured.has_changes():
+        return
+
+    old_status = status.deleted[0] if status.deleted else target.status
+    old_featured = featured.deleted[0] if featured.deleted else target.featured
+    deltas = _stats_deltas(old_status, old_featured, sign=-1)
+    for key, value in _stats_deltas(target.status, target.featured).items():
+        deltas[key] += value
+    _apply_stats_deltas(connection, deltas)
@@ -1,258 +1,60 @@
 from flask import Blueprint, jsonify, request
 from datetime import datetime, timedelta
-import random
+from sqlalchemy import func
+from src.models.user import db, User
+from src.models.wallpaper import Wallpaper
+from src.models.analytics import AdPerformance
+from src.utils.event_queue import event_queue
+from src.utils.rollups import ALL_EVENTS, period_start, series, totals_by_key, active_users, rollup_status, rollup_scheduler
+from src.utils.event_archive import event_counts
 
 analytics_bp = Blueprint('analytics', __name__)
 
-# Mock data generators for analytics
-def generate_daily_active_users(days=30):
-    """Generate mock daily active users data"""
-    data = []
-    base_date = datetime.now() - timedelta(days=days)
-    base_users = 3000
-    
-    for i in range(days):
-        date = base_date + timedelta(days=i)
-        # Add some realistic variation
-        variation = random.uniform(0.8, 1.2)
-        trend = 1 + (i * 0.01)  # Slight upward trend
-        users = int(base_users * variation * trend)
-        
-        data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'users': users,
-            'new_users': int(users * 0.15),
-            'returning_users': int(users * 0.85)
-        })
-    
-    return data
-
-def generate_download_trends(days=30):
-    """Generate mock download trends data"""
-    data = []
-    base_date = datetime.now() - timedelta(days=days)
-    base_downloads = 2500
-    
-    for i in range(days):
-        date = base_date + timedelta(days=i)
-        variation = random.uniform(0.7, 1.3)
-        trend = 1 + (i * 0.008)
-        downloads = int(base_downloads * variation * trend)
-        
-        data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'downloads': downloads,
-            'premium_downloads': int(downloads * 0.25),
-            'free_downloads': int(downloads * 0.75)
-        })
-    
-    return data
+MAX_DAYS = 366
+MAX_HOURS = 24 * 14
 
-def generate_revenue_data(days=30):
-    """Generate mock revenue data"""
-    data = []
-    base_date = datetime.now() - timedelta(days=days)
-    base_revenue = 150
-    
-    for i in range(days):
-        date = base_date + timedelta(days=i)
-        variation = random.uniform(0.8, 1.4)
-        trend = 1 + (i * 0.012)
-        revenue = base_revenue * variation * trend
-        
-        data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'revenue': round(revenue, 2),
-            'ad_revenue': round(revenue * 0.6, 2),
-            'premium_revenue': round(revenue * 0.4, 2)
-        })
-    
-    return data
+def _window_days(default=30):
+    """(first day, number of days) for ?days=, ending with today (UTC)"""
+    days = max(1, min(request.args.get('days', default, type=int), MAX_DAYS))
+    today = period_start('day', datetime.utcnow())
+    return today - timedelta(days=days - 1), days
 
-# Mock data
-TOP_WALLPAPERS = [
-    {
-        'id': 1,
-        'title': 'Mountain Landscape 4K',
-        'downloads': 15432,
-        'views': 45678,
-        'revenue': 234.56,
-        'category': 'Nature',
-        'upload_date': '2024-08-15',
-        'rating': 4.8,
-        'thumbnail': '/api/placeholder/150/100'
-    },
-    {
-        'id': 2,
-        'title': 'Ocean Waves Sunset',
-        'downloads': 12876,
-        'views': 38945,
-        'revenue': 198.43,
-        'category': 'Nature',
-        'upload_date': '2024-08-20',
-        'rating': 4.7,
-        'thumbnail': '/api/placeholder/150/100'
-    },
-    {
-        'id': 3,
-        'title': 'City Skyline Night',
-        'downloads': 11234,
-        'views': 34567,
-        'revenue': 176.89,
-        'category': 'Urban',
-        'upload_date': '2024-08-18',
-        'rating': 4.6,
-        'thumbnail': '/api/placeholder/150/100'
-    },
-    {
-        'id': 4,
-        'title': 'Forest Path Autumn',
-        'downloads': 9876,
-        'views': 29876,
-        'revenue': 154.32,
-        'category': 'Nature',
-        'upload_date': '2024-08-22',
-        'rating': 4.5,
-        'thumbnail': '/api/placeholder/150/100'
-    },
-    {
-        'id': 5,
-        'title': 'Desert Sunset Dunes',
-        'downloads': 8765,
-        'views': 26543,
-        'revenue': 132.45,
-        'category': 'Nature',
-        'upload_date': '2024-08-25',
-        'rating': 4.4,
-        'thumbnail': '/api/placeholder/150/100'
-    },
-    {
-        'id': 6,
-        'title': 'Space Galaxy Stars',
-        'downloads': 7654,
-        'views': 23456,
-        'revenue': 118.76,
-        'category': 'Space',
-        'upload_date': '2024-08-28',
-        'rating': 4.3,
-        'thumbnail': '/api/placeholder/150/100'
-    },
-    {
-        'id': 7,
-        'title': 'Minimalist Abstract',
-        'downloads': 6543,
-        'views': 19876,
-        'revenue': 98.65,
-        'category': 'Abstract',
-        'upload_date': '2024-08-30',
-        'rating': 4.2,
-        'thumbnail': '/api/placeholder/150/100'
-    },
-    {
-        'id': 8,
-        'title': 'Tropical Beach Paradise',
-        'downloads': 5432,
-        'views': 16789,
-        'revenue': 87.54,
-        'category': 'Nature',
-        'upload_date': '2024-09-01',
-        'rating': 4.1,
-        'thumbnail': '/api/placeholder/150/100'
+def _change(current, previous):
+    change = ((current - previous) / previous) * 100 if previous else 0
+    return {
+        'current': current,
+        'change': round(change, 1),
+        'trend': 'up' if change > 0 else 'down'
     }
-]
 
-AD_PERFORMANCE_DATA = [
-    {
-        'type': 'Search Ads',
-        'impressions': 125678,
-        'clicks': 5234,
-        'revenue': 1876.43,
-        'ctr': 4.16,
-        'cpm': 14.92,
-        'conversion_rate': 2.8
-    },
-    {
-        'type': '4K Unlock Ads',
-        'impressions': 89456,
-        'clicks': 3876,
-        'revenue': 1543.21,
-        'ctr': 4.33,
-        'cpm': 17.25,
-        'conversion_rate': 3.2
-    },
-    {
-        'type': 'Banner Ads',
-        'impressions': 156789,
-        'clicks': 4567,
-        'revenue': 987.65,
-        'ctr': 2.91,
-        'cpm': 6.30,
-        'conversion_rate': 1.5
-    },
-    {
-        'type': 'Video Ads',
-        'impressions': 67890,
-        'clicks': 2345,
-        'revenue': 1234.56,
-        'ctr': 3.45,
-        'cpm': 18.18,
-        'conversion_rate': 4.1
-    },
-    {
-        'type': 'Native Ads',
-        'impressions': 98765,
-        'clicks': 3456,
-        'revenue': 765.43,
-        'ctr': 3.50,
-        'cpm': 7.75,
-        'conversion_rate': 2.1
-    }
-]
+def _ad_totals(start, end):
+    """(impressions, clicks, revenue) recorded for the days in [start, end)"""
+    row = db.session.query(
+        func.coalesce(func.sum(AdPerformance.impressions), 0),
+        func.coalesce(func.sum(AdPerformance.clicks), 0),
+        func.coalesce(func.sum(AdPerformance.revenue), 0.0)
+    ).filter(AdPerformance.date >= start.date(), AdPerformance.date < end.date()).one()
+    return row[0], row[1], float(row[2])
 
 @analytics_bp.route('/api/analytics/overview', methods=['GET'])
 def get_analytics_overview():
     """Get analytics overview with key metrics"""
     try:
-        # Calculate totals from recent data
-        daily_users = generate_daily_active_users(7)
-        downloads = generate_download_trends(7)
-        revenue = generate_revenue_data(7)
-        
-        current_dau = daily_users[-1]['users']
-        previous_dau = daily_users[-2]['users']
-        dau_change = ((current_dau - previous_dau) / previous_dau) * 100
-        
-        total_downloads = sum([d['downloads'] for d in downloads])
-        prev_downloads = sum([d['downloads'] for d in downloads[:-1]])
-        downloads_change = ((total_downloads - prev_downloads) / prev_downloads) * 100 if prev_downloads > 0 else 0
-        
-        total_revenue = sum([r['revenue'] for r in revenue])
-        prev_revenue = sum([r['revenue'] for r in revenue[:-1]])
-        revenue_change = ((total_revenue - prev_revenue) / prev_revenue) * 100 if prev_revenue > 0 else 0
-        
-        total_views = sum([w['views'] for w in TOP_WALLPAPERS])
+        # This week (ending today) against the week before
+        today = period_start('day', datetime.utcnow())
+        start = today - timedelta(days=13)
+        active = series(ALL_EVENTS, start, 14)
+        downloads = series('download', start, 14)
+        views = series('view', start, 14)
+        _, _, revenue = _ad_totals(today - timedelta(days=6), today + timedelta(days=1))
+        _, _, prev_revenue = _ad_totals(start, today - timedelta(days=6))
         
+        # Today is still in progress, so DAU compares the last two complete days
         overview = {
-            'daily_active_users': {
-                'current': current_dau,
-                'change': round(dau_change, 1),
-                'trend': 'up' if dau_change > 0 else 'down'
-            },
-            'total_downloads': {
-                'current': total_downloads,
-                'change': round(downloads_change, 1),
-                'trend': 'up' if downloads_change > 0 else 'down'
-            },
-            'page_views': {
-                'current': total_views,
-                'change': 15.3,
-                'trend': 'up'
-            },
-            'ad_revenue': {
-                'current': round(total_revenue, 2),
-                'change': round(revenue_change, 1),
-                'trend': 'up' if revenue_change > 0 else 'down'
-            }
+            'daily_active_users': _change(active[-2][2], active[-3][2]),
+            'total_downloads': _change(sum(d[1] for d in downloads[7:]), sum(d[1] for d in downloads[:7])),
+            'page_views': _change(sum(v[1] for v in views[7:]), sum(v[1] for v in views[:7])),
+            'ad_revenue': _change(round(revenue, 2), round(prev_revenue, 2))
         }
         
         return jsonify(overview)
@@ -263,27 +65,85 @@ def get_analytics_overview():
 def get_user_activity():
     """Get user activity trends"""
     try:
-        days = request.args.get('days', 30, type=int)
-        data = generate_daily_active_users(days)
+        start, days = _window_days()
+        signups = dict(
+            db.session.query(func.date(User.created_at), func.count(User.id))
+            .filter(User.created_at >= start)
+            .group_by(func.date(User.created_at))
+        )
+        signups = {str(day): n for day, n in signups.items()}
+        
+        data = []
+        for day, _, users in series(ALL_EVENTS, start, days):
+            date = day.strftime('%Y-%m-%d')
+            new_users = signups.get(date, 0)
+            data.append({
+                'date': date,
+                'users': users,
+                'new_users': new_users,
+                'returning_users': max(users - new_users, 0)
+            })
         
+        active = active_users(start + timedelta(days=days - 1))
         return jsonify({
             'data': data,
             'total_days': days,
-            'average_dau': sum([d['users'] for d in data]) // len(data)
+            'average_dau': sum([d['users'] for d in data]) // len(data),
+            'wau': active['wau'],
+            'mau': active['mau']
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@analytics_bp.route('/api/analytics/active-users', methods=['GET'])
+def get_active_users():
+    """Get DAU/WAU/MAU and unique sessions ending on ?date= (default today), optionally for one category"""
+    try:
+        date = request.args.get('date')
+        category = request.args.get('category')
+        try:
+            day = datetime.strptime(date, '%Y-%m-%d') if date else period_start('day', datetime.utcnow())
+        except ValueError:
+            return jsonify({'error': f'Invalid date {date}, expected YYYY-MM-DD'}), 400
+        
+        if category and category != 'all':
+            result = active_users(day, dimension='category', key=category)
+        else:
+            result = active_users(day)
+        result['date'] = day.strftime('%Y-%m-%d')
+        result['category'] = category or 'all'
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @analytics_bp.route('/api/analytics/download-trends', methods=['GET'])
 def get_download_trends():
-    """Get download trends"""
+    """Get download trends per day, or per hour with ?interval=hour"""
     try:
-        days = request.args.get('days', 30, type=int)
-        data = generate_download_trends(days)
+        if request.args.get('interval') == 'hour':
+            periods = max(1, min(request.args.get('hours', 48, type=int), MAX_HOURS))
+            start = period_start('hour', datetime.utcnow()) - timedelta(hours=periods - 1)
+            grain, label = 'hour', '%Y-%m-%dT%H:00'
+        else:
+            start, periods = _window_days()
+            grain, label = 'day', '%Y-%m-%d'
+        
+        downloads = series('download', start, periods, grain)
+        premium = series('download', start, periods, grain, dimension='premium', key='1')
+        data = [
+            {
+                'date': moment.strftime(label),
+                'downloads': total,
+                'premium_downloads': premium_count,
+                'free_downloads': total - premium_count
+            }
+            for (moment, total, _), (_, premium_count, _) in zip(downloads, premium)
+        ]
         
         return jsonify({
             'data': data,
-            'total_days': days,
+            'total_days': periods if grain == 'day' else None,
+            'interval': grain,
             'total_downloads': sum([d['downloads'] for d in data])
         })
     except Exception as e:
@@ -293,13 +153,34 @@ def get_download_trends():
 def get_revenue_trends():
     """Get revenue trends"""
     try:
-        days = request.args.get('days', 30, type=int)
-        data = generate_revenue_data(days)
+        start, days = _window_days()
+        # AdPerformance is already one row per ad per day
+        by_date = {
+            str(date): (impressions, clicks, float(revenue))
+            for date, impressions, clicks, revenue in db.session.query(
+                AdPerformance.date,
+                func.sum(AdPerformance.impressions),
+                func.sum(AdPerformance.clicks),
+                func.sum(AdPerformance.revenue)
+            ).filter(AdPerformance.date >= start.date()).group_by(AdPerformance.date)
+        }
+        
+        data = []
+        for i in range(days):
+            date = (start + timedelta(days=i)).strftime('%Y-%m-%d')
+            impressions, clicks, revenue = by_date.get(date, (0, 0, 0.0))
+            data.append({
+                'date': date,
+                'revenue': round(revenue, 2),
+                'ad_revenue': round(revenue, 2),
+                'impressions': impressions,
+                'clicks': clicks
+            })
         
         return jsonify({
             'data': data,
             'total_days': days,
-            'total_revenue': sum([d['revenue'] for d in data])
+            'total_revenue': round(sum([d['revenue'] for d in data]), 2)
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -308,26 +189,44 @@ def get_revenue_trends():
 def get_top_wallpapers():
     """Get top performing wallpapers"""
     try:
-        limit = request.args.get('limit', 10, type=int)
+        limit = max(1, min(request.args.get('limit', 10, type=int), 100))
         category = request.args.get('category', None)
+        start, days = _window_days()
+        end = start + timedelta(days=days)
         
-        wallpapers = TOP_WALLPAPERS.copy()
-        
+        keys = None
         if category and category != 'all':
-            wallpapers = [w for w in wallpapers if w['category'].lower() == category.lower()]
-        
-        # Sort by downloads and limit results
-        wallpapers = sorted(wallpapers, key=lambda x: x['downloads'], reverse=True)[:limit]
+            keys = [str(wallpaper_id) for (wallpaper_id,) in db.session.query(Wallpaper.id).filter(
+                func.lower(Wallpaper.category) == category.lower()
+            )]
+        ranked = totals_by_key('wallpaper', ['download', 'view', 'like'], start, end,
+                               sort_by='download', limit=limit, keys=keys)
+        wallpapers_by_id = {
+            w.id: w for w in Wallpaper.query.filter(Wallpaper.id.in_([int(key) for key, _ in ranked]))
+        }
         
-        # Add calculated metrics
-        for wallpaper in wallpapers:
-            wallpaper['conversion_rate'] = round((wallpaper['downloads'] / wallpaper['views']) * 100, 2)
-            wallpaper['revenue_per_download'] = round(wallpaper['revenue'] / wallpaper['downloads'], 3)
+        wallpapers = []
+        for key, counts in ranked:
+            wallpaper = wallpapers_by_id.get(int(key))
+            if wallpaper is None:
+                continue
+            wallpapers.append({
+                'id': wallpaper.id,
+                'title': wallpaper.title,
+                'category': wallpaper.category,
+                'downloads': counts['download'],
+                'views': counts['view'],
+                'likes': counts['like'],
+                'upload_date': wallpaper.created_at.strftime('%Y-%m-%d') if wallpaper.created_at else None,
+                'thumbnail': f"/static/uploads/thumbnails/{wallpaper.thumbnail_filename}" if wallpaper.thumbnail_filename else None,
+                'conversion_rate': round((counts['download'] / counts['view']) * 100, 2) if counts['view'] else 0
+            })
         
         return jsonify({
             'wallpapers': wallpapers,
             'total_count': len(wallpapers),
-            'categories': list(set([w['category'] for w in TOP_WALLPAPERS]))
+            'total_days': days,
+            'categories': sorted(c for (c,) in db.session.query(Wallpaper.category).distinct())
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -336,26 +235,48 @@ def get_top_wallpapers():
 def get_ad_performance():
     """Get ad performance metrics"""
     try:
-        ad_data = AD_PERFORMANCE_DATA.copy()
+        start, days = _window_days()
+        rows = (
+            db.session.query(
+                AdPerformance.ad_type,
+                func.sum(AdPerformance.impressions),
+                func.sum(AdPerformance.clicks),
+                func.sum(AdPerformance.revenue)
+            )
+            .filter(AdPerformance.date >= start.date())
+            .group_by(AdPerformance.ad_type)
+            .order_by(func.sum(AdPerformance.revenue).desc())
+        )
         
-        # Calculate additional metrics
-        for ad in ad_data:
-            ad['ctr'] = round((ad['clicks'] / ad['impressions']) * 100, 2)
-            ad['cpm'] = round((ad['revenue'] / ad['impressions']) * 1000, 2)
-            ad['revenue_per_click'] = round(ad['revenue'] / ad['clicks'], 3)
+        ad_data = []
+        for ad_type, impressions, clicks, revenue in rows:
+            impressions, clicks, revenue = impressions or 0, clicks or 0, float(revenue or 0)
+            ad_data.append({
+                'type': ad_type,
+                'impressions': impressions,
+                'clicks': clicks,
+                'revenue': round(revenue, 2),
+                'ctr': round((clicks / impressions) * 100, 2) if impressions else 0,
+                'cpm': round((revenue / impressions) * 1000, 2) if impressions else 0,
+                'revenue_per_click': round(revenue / clicks, 3) if clicks else 0
+            })
         
         # Calculate totals
+        total_impressions = sum([ad['impressions'] for ad in ad_data])
+        total_clicks = sum([ad['clicks'] for ad in ad_data])
+        total_revenue = sum([ad['revenue'] for ad in ad_data])
         totals = {
-            'total_impressions': sum([ad['impressions'] for ad in ad_data]),
-            'total_clicks': sum([ad['clicks'] for ad in ad_data]),
-            'total_revenue': sum([ad['revenue'] for ad in ad_data]),
-            'average_ctr': sum([ad['ctr'] for ad in ad_data]) / len(ad_data),
-            'average_cpm': sum([ad['cpm'] for ad in ad_data]) / len(ad_data)
+            'total_impressions': total_impressions,
+            'total_clicks': total_clicks,
+            'total_revenue': round(total_revenue, 2),
+            'average_ctr': round((total_clicks / total_impressions) * 100, 2) if total_impressions else 0,
+            'average_cpm': round((total_revenue / total_impressions) * 1000, 2) if total_impressions else 0
         }
         
         return jsonify({
             'ad_performance': ad_data,
-            'totals': totals
+            'totals': totals,
+            'total_days': days
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -364,41 +285,92 @@ def get_ad_performance():
 def get_category_performance():
     """Get performance by wallpaper category"""
     try:
-        categories = {}
+        start, days = _window_days()
+        end = start + timedelta(days=days)
+        counts = dict(totals_by_key('category', ['download', 'view', 'like'], start, end))
+        catalog = dict(
+            db.session.query(Wallpaper.category, func.count(Wallpaper.id)).group_by(Wallpaper.category)
+        )
         
-        for wallpaper in TOP_WALLPAPERS:
-            category = wallpaper['category']
-            if category not in categories:
-                categories[category] = {
-                    'category': category,
-                    'wallpapers': 0,
-                    'total_downloads': 0,
-                    'total_views': 0,
-                    'total_revenue': 0,
-                    'average_rating': 0
-                }
-            
-            categories[category]['wallpapers'] += 1
-            categories[category]['total_downloads'] += wallpaper['downloads']
-            categories[category]['total_views'] += wallpaper['views']
-            categories[category]['total_revenue'] += wallpaper['revenue']
-            categories[category]['average_rating'] += wallpaper['rating']
-        
-        # Calculate averages and conversion rates
         category_list = []
-        for category_data in categories.values():
-            category_data['average_rating'] = round(category_data['average_rating'] / category_data['wallpapers'], 2)
-            category_data['conversion_rate'] = round((category_data['total_downloads'] / category_data['total_views']) * 100, 2)
-            category_data['revenue_per_wallpaper'] = round(category_data['total_revenue'] / category_data['wallpapers'], 2)
-            category_list.append(category_data)
+        for category in set(catalog) | set(counts):
+            totals = counts.get(category, {'download': 0, 'view': 0, 'like': 0})
+            wallpapers = catalog.get(category, 0)
+            category_list.append({
+                'category': category,
+                'wallpapers': wallpapers,
+                'total_downloads': totals['download'],
+                'total_views': totals['view'],
+                'total_likes': totals['like'],
+                'conversion_rate': round((totals['download'] / totals['view']) * 100, 2) if totals['view'] else 0,
+                'downloads_per_wallpaper': round(totals['download'] / wallpapers, 2) if wallpapers else 0
+            })
         
         # Sort by total downloads
-        category_list = sorted(category_list, key=lambda x: x['total_downloads'], reverse=True)
+        category_list = sorted(category_list, key=lambda x: (-x['total_downloads'], x['category']))
         
         return jsonify({
             'categories': category_list,
-            'total_categories': len(category_list)
+            'total_categories': len(category_list),
+            'total_days': days
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@analytics_bp.route('/api/analytics/ingest-metrics', methods=['GET'])
+def get_ingest_metrics():
+    """Get analytics ingestion queue depth and flush latency"""
+    try:
+        return jsonify(event_queue.metrics())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/api/analytics/rollup-status', methods=['GET'])
+def get_rollup_status():
+    """Get the rollup watermark, backlog and last scheduled run"""
+    try:
+        status = rollup_status()
+        status['last_run'] = rollup_scheduler.last_run
+        status['last_archive'] = rollup_scheduler.last_archive
+        status['last_error'] = rollup_scheduler.last_error
+        return jsonify(status)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/api/analytics/history', methods=['GET'])
+def get_event_history():
+    """Event counts for any date range, read from the cold archive and the live table.
+
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD (end inclusive, default today),
+    &group_by=day,event_type (any of day, event_type, wallpaper_id, user_id, user_agent),
+    &event_type=view,download to count only those types, &limit= groups (default 1000).
+    """
+    try:
+        try:
+            end = datetime.strptime(request.args['end'], '%Y-%m-%d') if request.args.get('end') else period_start('day', datetime.utcnow())
+            start = datetime.strptime(request.args['start'], '%Y-%m-%d') if request.args.get('start') else end - timedelta(days=29)
+        except ValueError:
+            return jsonify({'error': 'start and end must be dates as YYYY-MM-DD'}), 400
+        if start > end:
+            return jsonify({'error': 'start must not be after end'}), 400
+        group_by = [name for name in request.args.get('group_by', 'day').split(',') if name] or ['day']
+        event_types = [name for name in request.args.get('event_type', '').split(',') if name] or None
+        limit = max(1, min(request.args.get('limit', 1000, type=int), 10000))
+        
+        try:
+            counts = event_counts(start, end + timedelta(days=1), group_by, event_types)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # NULL groups sort last within a column
+        keys = sorted(counts, key=lambda key: tuple((value is None, '' if value is None else value) for value in key))
+        return jsonify({
+            'start': start.strftime('%Y-%m-%d'),
+            'end': end.strftime('%Y-%m-%d'),
+            'group_by': group_by,
+            'rows': [dict(zip(group_by, key), count=counts[key]) for key in keys[:limit]],
+            'total': sum(counts.values()),
+            'truncated': len(keys) > limit
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
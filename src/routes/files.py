@@ -0,0 +1,111 @@
+"""
+Serving of uploaded originals and thumbnails.
+
+Files are streamed with send_file, which hands the open file to the WSGI
+server's file_wrapper (gunicorn uses sendfile(2) for it), answers Range
+requests with 206 and If-None-Match / If-Modified-Since with 304. ETags are
+derived from the name and size rather than mtime, so every replica returns
+the same tag for the same file. Content-addressed names never change
+contents and are cached as immutable.
+
+With a remote storage backend (STORAGE_BACKEND = 's3') requests are
+redirected to the object's public or presigned URL instead.
+
+With FILE_SERVING_OFFLOAD = 'x-accel-redirect' (nginx) or 'x-sendfile'
+(Apache/lighttpd) the app only resolves the file and sets headers; the
+front proxy sends the bytes and handles ranges itself.
+"""
+import mimetypes
+import os
+import stat as stat_module
+from urllib.parse import quote
+from flask import Blueprint, request, jsonify, send_file, current_app, redirect
+from werkzeug.utils import secure_filename
+from src.utils.file_handler import is_content_addressed
+from src.utils.storage import storage
+
+files_bp = Blueprint('files', __name__)
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+# Legacy uuid-named uploads: cache for a day, then revalidate against the ETag
+DEFAULT_MAX_AGE = 24 * 60 * 60
+OFFLOAD_MODES = ('x-accel-redirect', 'x-sendfile')
+# Suffixes of files still being written (stream_to_file, renditions)
+TEMPORARY_SUFFIXES = ('.part', '.tmp')
+
+def _not_found():
+    return jsonify({'error': 'File not found'}), 404
+
+def _is_private(filename):
+    """Dot-prefixed names (e.g. .incoming-* staging files, spool files, locks) and partial writes"""
+    return any(part.startswith('.') for part in filename.split('/')) or filename.endswith(TEMPORARY_SUFFIXES)
+
+def _offload_response(filename, path, mimetype):
+    """Empty response telling the front proxy which file to send"""
+    mode = current_app.config.get('FILE_SERVING_OFFLOAD')
+    response = current_app.response_class(mimetype=mimetype)
+    if mode == 'x-accel-redirect':
+        # An `internal` nginx location aliased to the upload folder
+        prefix = current_app.config.get('FILE_SERVING_ACCEL_PREFIX', '/_uploads/')
+        response.headers['X-Accel-Redirect'] = prefix + quote(filename)
+    else:
+        response.headers['X-Sendfile'] = path
+    return response
+
+@files_bp.route('/static/uploads/<path:filename>', methods=['GET', 'HEAD'])
+def serve_upload(filename):
+    """Serve an upload with Range, ETag and long-lived caching"""
+    try:
+        if _is_private(filename):
+            return _not_found()
+        
+        as_attachment = request.args.get('download', 'false').lower() in ('1', 'true')
+        download_name = secure_filename(request.args.get('name', '')) or os.path.basename(filename)
+        
+        if not storage.is_local:
+            return redirect(storage.url(filename, download_name if as_attachment else None))
+        
+        try:
+            path = storage.backend.local_path(filename)
+        except ValueError:
+            return _not_found()
+        
+        # One stat() both checks existence and supplies size/mtime for the validators
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return _not_found()
+        if not stat_module.S_ISREG(stat.st_mode):
+            return _not_found()
+        
+        name = os.path.basename(path)
+        stem = name.rsplit('.', 1)[0]
+        immutable = is_content_addressed(name)
+        etag = stem if immutable else f'{stem}-{stat.st_size}'
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        
+        if current_app.config.get('FILE_SERVING_OFFLOAD') in OFFLOAD_MODES:
+            response = _offload_response(filename, path, mimetype)
+            response.set_etag(etag)
+            response.last_modified = stat.st_mtime
+            if as_attachment:
+                response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+        else:
+            response = send_file(
+                path,
+                mimetype=mimetype,
+                as_attachment=as_attachment,
+                download_name=download_name,
+                conditional=True,
+                etag=etag,
+                last_modified=stat.st_mtime
+            )
+        
+        if immutable:
+            response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = f'public, max-age={DEFAULT_MAX_AGE}'
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,48 @@
+from flask import Blueprint, jsonify, send_file
+from src.models.user import db
+from src.models.wallpaper import Wallpaper
+from src.utils.renditions import rendition_cache, RENDITION_WIDTHS
+
+renditions_bp = Blueprint('renditions', __name__)
+
+RENDITION_MIMETYPES = {
+    'jpg': 'image/jpeg',
+    'webp': 'image/webp',
+    'avif': 'image/avif'
+}
+
+# Renditions of a wallpaper never change once generated, so clients and CDNs may keep them forever
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+@renditions_bp.route('/renditions/<int:wallpaper_id>/<int:width>.<fmt>', methods=['GET'])
+def get_rendition(wallpaper_id, width, fmt):
+    """Serve a resized copy of a wallpaper, generating it on first request"""
+    try:
+        if not rendition_cache.enabled:
+            return jsonify({'error': 'Renditions are not configured'}), 503
+        if not rendition_cache.is_allowed(width, fmt):
+            return jsonify({
+                'error': 'Unsupported rendition',
+                'widths': list(RENDITION_WIDTHS),
+                'formats': list(rendition_cache.formats)
+            }), 404
+        
+        filename = db.session.query(Wallpaper.filename).filter(Wallpaper.id == wallpaper_id).scalar()
+        if not filename:
+            return jsonify({'error': 'Wallpaper not found'}), 404
+        
+        path = rendition_cache.get(filename, width, fmt)
+        
+        try:
+            response = send_file(path, mimetype=RENDITION_MIMETYPES[fmt], conditional=True, max_age=IMMUTABLE_MAX_AGE)
+        except FileNotFoundError:
+            # Evicted between get() and opening it; regenerate once
+            path = rendition_cache.get(filename, width, fmt)
+            response = send_file(path, mimetype=RENDITION_MIMETYPES[fmt], conditional=True, max_age=IMMUTABLE_MAX_AGE)
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        return response
+        
+    except FileNotFoundError:
+        return jsonify({'error': 'Original image not found'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,44 +1,146 @@
 from flask import Blueprint, request, jsonify, session, current_app
+from sqlalchemy.orm import joinedload
+from werkzeug.exceptions import RequestEntityTooLarge
 from datetime import datetime, timedelta
+from urllib.parse import urlencode
+from werkzeug.utils import secure_filename
 import os
 import json
+import zipfile
 from src.models.user import db, User
 from src.models.wallpaper import Wallpaper
-from src.models.analytics import AnalyticsEvent
-from src.utils.file_handler import save_uploaded_file, delete_file
+from src.utils.file_handler import save_uploaded_file
+from src.utils.pagination import CURSOR_SORT_COLUMNS, InvalidCursor, keyset_page, cached_count
+from src.utils.search import apply_search
+from src.utils.tags import filter_by_tags, sync_wallpaper_tags, tag_counts
+from src.utils.serializers import wallpaper_list_query, serialize_wallpaper_row
+from src.utils.counters import counter_buffer
+from src.utils.trending import trending
+from src.utils.event_queue import event_queue
+from src.utils.response_cache import cached_response, invalidate_catalog
+from src.utils.wallpaper_stats import get_stats
+from src.utils.image_tasks import image_processor
+from src.utils.renditions import rendition_cache
+from src.utils.blobs import blob_exists, acquire_blob, register_blob, release_blob, discard_unregistered, ensure_thumbnail
+from src.utils.similarity import similarity_index, MAX_SEARCH_DISTANCE
+from src.utils.storage import storage
+from src.utils.colors import filter_by_color, set_wallpaper_palette, DEFAULT_COLOR_DISTANCE
+from src.utils.dimensions import filter_by_dimensions, set_wallpaper_resolution
+from src.utils.bulk_upload import ingest_batch, multipart_sources, archive_sources, DEFAULT_MAX_ITEMS
 
 wallpapers_enhanced_bp = Blueprint('wallpapers_enhanced', __name__)
 
 # Upload folder configuration
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'uploads')
+MAX_TRENDING = 100
+MODERATION_STATUSES = ('approved', 'pending', 'flagged', 'rejected')
+RECENT_LIMIT = 10
+
+def filter_arg(name):
+    """A filter query parameter, where 'all' (like an empty value) means no filter"""
+    value = request.args.get(name)
+    return None if value in (None, '', 'all') else value
+
+def track_event(event_type, wallpaper):
+    """Queue an analytics event for the current request (written in the background) and count it towards trending"""
+    trending.record(event_type, wallpaper.id, wallpaper.category)
+    event_queue.enqueue(
+        event_type,
+        wallpaper_id=wallpaper.id,
+        user_id=session.get('user_id'),
+        session_id=session.get('session_id'),
+        ip_address=request.remote_addr,
+        user_agent=request.headers.get('User-Agent')
+    )
 
 @wallpapers_enhanced_bp.route('/api/wallpapers', methods=['GET'])
+@cached_response()
 def get_wallpapers():
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
-        category = request.args.get('category')
-        status = request.args.get('status')
+        category = filter_arg('category')
+        status = filter_arg('status')
         search = request.args.get('search')
-        sort_by = request.args.get('sort_by', 'created_at')
+        tags = request.args.get('tags')
+        tag_mode = request.args.get('tag_mode', 'any')
+        color = request.args.get('color')
+        color_distance = request.args.get('color_distance', DEFAULT_COLOR_DISTANCE, type=float)
+        min_width = request.args.get('min_width', type=int)
+        min_height = request.args.get('min_height', type=int)
+        orientation = request.args.get('orientation')
+        size_class = request.args.get('size_class')
+        sort_by = request.args.get('sort_by', 'relevance' if search else 'created_at')
         order = request.args.get('order', 'desc')
+        cursor = request.args.get('cursor')
+        include_total = request.args.get('include_total', 'false').lower() == 'true'
         
-        query = Wallpaper.query
+        query = wallpaper_list_query()
         
         # Apply filters
         if category:
             query = query.filter(Wallpaper.category == category)
         if status:
             query = query.filter(Wallpaper.status == status)
+        rank = None
         if search:
-            query = query.filter(
-                Wallpaper.title.contains(search) | 
-                Wallpaper.description.contains(search) |
-                Wallpaper.tags.contains(search)
-            )
+            query, rank = apply_search(query, Wallpaper, db.engine.dialect.name, search)
+        if tags:
+            query = filter_by_tags(query, tags.split(','), match_all=tag_mode == 'all')
+        if color:
+            try:
+                query = filter_by_color(query, color, max_distance=max(1.0, min(color_distance, 100.0)))
+            except ValueError:
+                return jsonify({'error': f'Invalid color {color}, expected #RRGGBB'}), 400
+        if min_width or min_height or orientation or size_class:
+            try:
+                query = filter_by_dimensions(
+                    query, min_width, min_height, orientation,
+                    size_class.lower().split(',') if size_class else None
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        # Cursor mode: seek on (sort_by, id) instead of OFFSET, count only on request
+        if cursor is not None:
+            seek_column = None
+            if sort_by == 'relevance':
+                if rank is not None:
+                    # Seek on (rank, id); lower rank is more relevant
+                    seek_column, order = rank, 'asc'
+                    query = query.add_columns(rank.label('relevance'))
+                else:
+                    # No full-text index: relevance falls back to newest first, as in page mode
+                    sort_by, order = 'created_at', 'desc'
+            elif sort_by not in CURSOR_SORT_COLUMNS:
+                return jsonify({'error': f'Cannot paginate by cursor on {sort_by}'}), 400
+            per_page = max(1, min(per_page, 100))
+            try:
+                rows, next_cursor = keyset_page(query, Wallpaper, sort_by, order, per_page, cursor or None, seek_column)
+            except InvalidCursor as e:
+                return jsonify({'error': str(e)}), 400
+            
+            response = {
+                'wallpapers': [serialize_wallpaper_row(w) for w in rows],
+                'next_cursor': next_cursor,
+                'per_page': per_page,
+                'has_next': next_cursor is not None
+            }
+            if include_total:
+                response['total'] = cached_count(
+                    (category, status, search, tags, tag_mode, color, color_distance,
+                     min_width, min_height, orientation, size_class),
+                    query
+                )
+            return jsonify(response), 200
         
         # Apply sorting
-        if hasattr(Wallpaper, sort_by):
+        if sort_by == 'relevance':
+            if rank is not None:
+                query = query.order_by(rank, Wallpaper.id)
+            else:
+                query = query.order_by(Wallpaper.created_at.desc())
+        elif hasattr(Wallpaper, sort_by):
             if order == 'desc':
                 query = query.order_by(getattr(Wallpaper, sort_by).desc())
             else:
@@ -52,7 +154,7 @@ def get_wallpapers():
         )
         
         return jsonify({
-            'wallpapers': [w.to_dict() for w in wallpapers.items],
+            'wallpapers': [serialize_wallpaper_row(w) for w in wallpapers.items],
             'total': wallpapers.total,
             'pages': wallpapers.pages,
             'current_page': page,
@@ -64,33 +166,61 @@ def get_wallpapers():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@wallpapers_enhanced_bp.route('/api/wallpapers/trending', methods=['GET'])
+def get_trending_wallpapers():
+    """Approved wallpapers ranked by time-decayed views, likes and downloads (?category=, ?limit= up to 100)"""
+    try:
+        category = request.args.get('category')
+        limit = max(1, min(request.args.get('limit', 20, type=int), MAX_TRENDING))
+        
+        # Spare entries stand in for wallpapers deleted or unapproved since they trended
+        ranked = trending.top(category, limit * 2)
+        rows = {
+            row.id: row
+            for row in wallpaper_list_query().filter(
+                Wallpaper.id.in_([wallpaper_id for wallpaper_id, _ in ranked]),
+                Wallpaper.status == 'approved'
+            )
+        }
+        wallpapers = []
+        for wallpaper_id, score in ranked:
+            row = rows.get(wallpaper_id)
+            if row is None:
+                continue
+            item = counter_buffer.apply_pending(serialize_wallpaper_row(row))
+            item['trending_score'] = round(score, 3)
+            wallpapers.append(item)
+            if len(wallpapers) == limit:
+                break
+        
+        return jsonify({
+            'wallpapers': wallpapers,
+            'category': category,
+            'half_life_hours': trending.half_life / 3600
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @wallpapers_enhanced_bp.route('/api/wallpapers/<int:wallpaper_id>', methods=['GET'])
 def get_wallpaper(wallpaper_id):
     try:
-        wallpaper = Wallpaper.query.get_or_404(wallpaper_id)
+        wallpaper = Wallpaper.query.options(joinedload(Wallpaper.uploader)).get_or_404(wallpaper_id)
         
         # Track view event
-        event = AnalyticsEvent(
-            event_type='view',
-            wallpaper_id=wallpaper_id,
-            user_id=session.get('user_id'),
-            session_id=session.get('session_id'),
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent')
-        )
-        db.session.add(event)
+        track_event('view', wallpaper)
         
-        # Increment view count
-        wallpaper.views += 1
-        db.session.commit()
+        # Increment view count (flushed to the database in batches)
+        counter_buffer.increment(wallpaper_id, 'views')
         
-        return jsonify({'wallpaper': wallpaper.to_dict()}), 200
+        return jsonify({'wallpaper': counter_buffer.apply_pending(wallpaper.to_dict())}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @wallpapers_enhanced_bp.route('/api/wallpapers', methods=['POST'])
 def create_wallpaper():
+    file_info = None
     try:
         user_id = session.get('user_id')
         if not user_id:
@@ -109,34 +239,199 @@ def create_wallpaper():
         if not title or not category:
             return jsonify({'error': 'Title and category are required'}), 400
         
-        # Save uploaded file
-        file_info, error = save_uploaded_file(file, UPLOAD_FOLDER)
+        # Save uploaded file; the thumbnail is generated in the background when a worker pool is configured.
+        # Bytes already stored under the same hash are discarded along with all thumbnail work.
+        background = image_processor.enabled
+        file_info, error = save_uploaded_file(file, UPLOAD_FOLDER, generate_thumbnail=not background, is_stored=blob_exists)
         if error:
             return jsonify({'error': error}), 400
         
+        if file_info['deduplicated']:
+            blob = acquire_blob(file_info['content_hash'])
+            if blob is None:
+                return jsonify({'error': 'Upload conflicted with a concurrent delete, please retry'}), 409
+            if not blob.thumbnail_filename and not background:
+                # The earlier upload's thumbnail failed or is still being made by a background worker
+                ensure_thumbnail(blob, UPLOAD_FOLDER)
+        else:
+            blob = register_blob(file_info)
+        
+        # Upload-time check: existing wallpapers that look the same (resized, recompressed, re-uploaded).
+        # A new upload processed in the background has no hash yet; its status_url reports them instead
+        near_duplicates = [
+            {'id': match_id, 'distance': distance}
+            for distance, match_id in similarity_index.find(blob.phash)
+        ]
+        
+        # A blob without a thumbnail is still being processed for an earlier upload (or failed to decode)
+        needs_processing = background and not blob.thumbnail_filename
+        
         # Create wallpaper record
         wallpaper = Wallpaper(
             title=title,
             description=description,
-            filename=file_info['filename'],
-            thumbnail_filename=file_info['thumbnail_filename'],
+            filename=blob.filename,
+            thumbnail_filename=blob.thumbnail_filename,
             category=category,
             tags=tags,
-            resolution=file_info['resolution'],
-            file_size=file_info['file_size'],
-            uploaded_by=user_id
+            file_size=blob.file_size,
+            uploaded_by=user_id,
+            processing_status='processing' if needs_processing else 'ready',
+            processing_claimed_at=datetime.utcnow() if needs_processing else None,
+            phash=blob.phash
         )
+        set_wallpaper_resolution(wallpaper, blob.resolution)
+        set_wallpaper_palette(wallpaper, blob.palette)
+        sync_wallpaper_tags(wallpaper)
         
         db.session.add(wallpaper)
         db.session.commit()
+        invalidate_catalog()
+        similarity_index.add(wallpaper.id, wallpaper.phash)
+        
+        if needs_processing:
+            image_processor.submit(wallpaper.id, wallpaper.filename)
+            return jsonify({
+                'message': 'Wallpaper uploaded, processing',
+                'wallpaper': wallpaper.to_dict(),
+                'deduplicated': file_info['deduplicated'],
+                'near_duplicates': near_duplicates,
+                'status_url': f'/api/wallpapers/{wallpaper.id}/processing'
+            }), 202
         
         return jsonify({
             'message': 'Wallpaper uploaded successfully',
-            'wallpaper': wallpaper.to_dict()
+            'wallpaper': wallpaper.to_dict(),
+            'deduplicated': file_info['deduplicated'],
+            'near_duplicates': near_duplicates
         }), 201
         
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'File size too large (max 16MB)'}), 413
     except Exception as e:
         db.session.rollback()
+        if file_info and not file_info['deduplicated']:
+            discard_unregistered(file_info['filename'], file_info.get('thumbnail_filename'))
+        return jsonify({'error': str(e)}), 500
+
+@wallpapers_enhanced_bp.route('/api/wallpapers/bulk', methods=['POST'])
+def bulk_create_wallpapers():
+    """Admin: ingest a pack of wallpapers from repeated 'files' fields or a zip 'archive'"""
+    try:
+        user_id = session.get('user_id')
+        user_role = session.get('role')
+        
+        if not user_id:
+            return jsonify({'error': 'Authentication required'}), 401
+        if user_role not in ['admin', 'moderator']:
+            return jsonify({'error': 'Permission denied'}), 403
+        
+        # Packs are far larger than the single-upload limit; each image is still capped at MAX_FILE_SIZE
+        request.max_content_length = current_app.config.get('BULK_UPLOAD_MAX_BYTES', 512 * 1024 * 1024)
+        max_items = current_app.config.get('BULK_UPLOAD_MAX_ITEMS', DEFAULT_MAX_ITEMS)
+        
+        category = request.form.get('category')
+        if not category:
+            return jsonify({'error': 'Category is required'}), 400
+        defaults = {
+            'category': category,
+            'description': request.form.get('description', ''),
+            'tags': request.form.get('tags', '[]')
+        }
+        # Optional per-file overrides: {"<filename>": {"title": ..., "description": ..., "category": ..., "tags": [...]}}
+        try:
+            metadata = json.loads(request.form.get('metadata') or '{}')
+        except ValueError:
+            metadata = None
+        if not isinstance(metadata, dict):
+            return jsonify({'error': 'metadata must be a JSON object keyed by filename'}), 400
+        
+        files = request.files.getlist('files')
+        archive = request.files.get('archive')
+        if archive:
+            with zipfile.ZipFile(archive.stream) as zf:
+                items = ingest_batch(archive_sources(zf), UPLOAD_FOLDER, user_id, defaults, metadata, max_items)
+        elif files:
+            items = ingest_batch(multipart_sources(files), UPLOAD_FOLDER, user_id, defaults, metadata, max_items)
+        else:
+            return jsonify({'error': 'No files provided'}), 400
+        invalidate_catalog()
+        
+        created = sum(1 for item in items if item['status'] == 'created')
+        return jsonify({
+            'created': created,
+            'failed': len(items) - created,
+            'items': items
+        }), 200 if created else 400
+        
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'Batch too large'}), 413
+    except zipfile.BadZipFile:
+        return jsonify({'error': 'Invalid zip archive'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@wallpapers_enhanced_bp.route('/api/wallpapers/<int:wallpaper_id>/similar', methods=['GET'])
+def get_similar_wallpapers(wallpaper_id):
+    """Admin: wallpapers whose perceptual hash is within max_distance bits of this one"""
+    try:
+        user_id = session.get('user_id')
+        user_role = session.get('role')
+        
+        if not user_id:
+            return jsonify({'error': 'Authentication required'}), 401
+        if user_role not in ['admin', 'moderator']:
+            return jsonify({'error': 'Permission denied'}), 403
+        
+        max_distance = request.args.get('max_distance', similarity_index.max_distance, type=int)
+        max_distance = max(0, min(max_distance, MAX_SEARCH_DISTANCE))
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        
+        wallpaper = Wallpaper.query.get_or_404(wallpaper_id)
+        if not wallpaper.phash:
+            return jsonify({'error': 'Wallpaper has no perceptual hash yet'}), 409
+        
+        matches = similarity_index.find(wallpaper.phash, max_distance, exclude_id=wallpaper.id, limit=limit)
+        distances = {match_id: distance for distance, match_id in matches}
+        rows = wallpaper_list_query().filter(Wallpaper.id.in_(list(distances))).all() if distances else []
+        
+        similar = []
+        for row in sorted(rows, key=lambda r: (distances[r.id], r.id)):
+            item = serialize_wallpaper_row(row)
+            item['distance'] = distances[row.id]
+            similar.append(item)
+        
+        return jsonify({
+            'wallpaper_id': wallpaper.id,
+            'phash': wallpaper.phash,
+            'max_distance': max_distance,
+            'similar': similar
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@wallpapers_enhanced_bp.route('/api/wallpapers/<int:wallpaper_id>/processing', methods=['GET'])
+def get_processing_status(wallpaper_id):
+    try:
+        wallpaper = Wallpaper.query.get_or_404(wallpaper_id)
+        
+        return jsonify({
+            'id': wallpaper.id,
+            'processing_status': wallpaper.processing_status,
+            'processing_attempts': wallpaper.processing_attempts,
+            'processing_error': wallpaper.processing_error,
+            'thumbnail_filename': wallpaper.thumbnail_filename,
+            'resolution': wallpaper.resolution,
+            # Known once processing has hashed the upload
+            'near_duplicates': [
+                {'id': match_id, 'distance': distance}
+                for distance, match_id in similarity_index.find(wallpaper.phash, exclude_id=wallpaper.id)
+            ]
+        }), 200
+        
+    except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @wallpapers_enhanced_bp.route('/api/wallpapers/<int:wallpaper_id>', methods=['PUT'])
@@ -164,7 +459,9 @@ def update_wallpaper(wallpaper_id):
         if 'category' in data:
             wallpaper.category = data['category']
         if 'tags' in data:
-            wallpaper.tags = data['tags']
+            tags = data['tags']
+            wallpaper.tags = json.dumps(tags) if isinstance(tags, list) else tags
+            sync_wallpaper_tags(wallpaper)
         if 'status' in data and user_role in ['admin', 'moderator']:
             wallpaper.status = data['status']
         if 'featured' in data and user_role in ['admin', 'moderator']:
@@ -174,6 +471,7 @@ def update_wallpaper(wallpaper_id):
         
         wallpaper.updated_at = datetime.utcnow()
         db.session.commit()
+        invalidate_catalog()
         
         return jsonify({
             'message': 'Wallpaper updated successfully',
@@ -184,8 +482,38 @@ def update_wallpaper(wallpaper_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@wallpapers_enhanced_bp.route('/api/wallpapers/<int:wallpaper_id>', methods=['DELETE'])
-def delete_wallpaper(wallpaper_id):
+@wallpapers_enhanced_bp.route('/api/wallpapers/<int:wallpaper_id>/status', methods=['PUT'])
+def update_wallpaper_status(wallpaper_id):
+    """Moderate a wallpaper (approve, reject, flag or send back to pending)"""
+    try:
+        if not session.get('user_id'):
+            return jsonify({'error': 'Authentication required'}), 401
+        if session.get('role') not in ['admin', 'moderator']:
+            return jsonify({'error': 'Permission denied'}), 403
+        
+        data = request.get_json() or {}
+        new_status = data.get('status')
+        if new_status not in MODERATION_STATUSES:
+            return jsonify({'error': 'Invalid status'}), 400
+        
+        wallpaper = Wallpaper.query.get_or_404(wallpaper_id)
+        wallpaper.status = new_status
+        wallpaper.updated_at = datetime.utcnow()
+        db.session.commit()
+        invalidate_catalog()
+        
+        return jsonify({
+            'message': f'Wallpaper status updated to {new_status}',
+            'wallpaper': wallpaper.to_dict()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@wallpapers_enhanced_bp.route('/api/wallpapers/<int:wallpaper_id>/tags', methods=['PUT'])
+def update_wallpaper_tags(wallpaper_id):
+    """Replace a wallpaper's tags"""
     try:
         user_id = session.get('user_id')
         user_role = session.get('role')
@@ -199,18 +527,61 @@ def delete_wallpaper(wallpaper_id):
         if wallpaper.uploaded_by != user_id and user_role not in ['admin', 'moderator']:
             return jsonify({'error': 'Permission denied'}), 403
         
-        # Delete files
-        if wallpaper.filename:
-            file_path = os.path.join(UPLOAD_FOLDER, wallpaper.filename)
-            delete_file(file_path)
+        tags = (request.get_json() or {}).get('tags', [])
+        if not isinstance(tags, list):
+            return jsonify({'error': 'Tags must be a list'}), 400
         
-        if wallpaper.thumbnail_filename:
-            thumbnail_path = os.path.join(UPLOAD_FOLDER, 'thumbnails', wallpaper.thumbnail_filename)
-            delete_file(thumbnail_path)
+        wallpaper.tags = json.dumps(tags)
+        sync_wallpaper_tags(wallpaper)
+        wallpaper.updated_at = datetime.utcnow()
+        db.session.commit()
+        invalidate_catalog()
+        
+        return jsonify({
+            'message': 'Tags updated successfully',
+            'wallpaper': wallpaper.to_dict()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@wallpapers_enhanced_bp.route('/api/wallpapers/<int:wallpaper_id>', methods=['DELETE'])
+def delete_wallpaper(wallpaper_id):
+    try:
+        user_id = session.get('user_id')
+        user_role = session.get('role')
         
-        # Delete database record
+        if not user_id:
+            return jsonify({'error': 'Authentication required'}), 401
+        
+        wallpaper = Wallpaper.query.get_or_404(wallpaper_id)
+        
+        # Check permissions
+        if wallpaper.uploaded_by != user_id and user_role not in ['admin', 'moderator']:
+            return jsonify({'error': 'Permission denied'}), 403
+        
+        # Delete database record, dropping this wallpaper's reference to the stored original
+        filename, thumbnail_filename = wallpaper.filename, wallpaper.thumbnail_filename
+        delete_files = release_blob(filename)
         db.session.delete(wallpaper)
+        db.session.flush()
+        
+        # Delete files once no other wallpaper shares them, before the commit releases
+        # the blob row so an identical upload can't store them again in between
+        if delete_files:
+            if filename:
+                storage.delete(filename)
+            
+            if thumbnail_filename:
+                storage.delete(f'thumbnails/{thumbnail_filename}')
+            
+            if rendition_cache.enabled:
+                rendition_cache.purge(filename)
+        
         db.session.commit()
+        invalidate_catalog()
+        similarity_index.remove(wallpaper_id)
         
         return jsonify({'message': 'Wallpaper deleted successfully'}), 200
         
@@ -224,23 +595,17 @@ def download_wallpaper(wallpaper_id):
         wallpaper = Wallpaper.query.get_or_404(wallpaper_id)
         
         # Track download event
-        event = AnalyticsEvent(
-            event_type='download',
-            wallpaper_id=wallpaper_id,
-            user_id=session.get('user_id'),
-            session_id=session.get('session_id'),
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent')
-        )
-        db.session.add(event)
+        track_event('download', wallpaper)
         
-        # Increment download count
-        wallpaper.downloads += 1
-        db.session.commit()
+        # Increment download count (flushed to the database in batches)
+        counter_buffer.increment(wallpaper_id, 'downloads')
         
+        # Served by files.serve_upload as an attachment named after the title (resumable via Range)
+        ext = wallpaper.filename.rsplit('.', 1)[-1]
+        download_name = secure_filename(f'{wallpaper.title}.{ext}') or wallpaper.filename
         return jsonify({
             'message': 'Download tracked',
-            'download_url': f'/static/uploads/{wallpaper.filename}'
+            'download_url': f"/static/uploads/{wallpaper.filename}?{urlencode({'download': 1, 'name': download_name})}"
         }), 200
         
     except Exception as e:
@@ -252,29 +617,21 @@ def like_wallpaper(wallpaper_id):
         wallpaper = Wallpaper.query.get_or_404(wallpaper_id)
         
         # Track like event
-        event = AnalyticsEvent(
-            event_type='like',
-            wallpaper_id=wallpaper_id,
-            user_id=session.get('user_id'),
-            session_id=session.get('session_id'),
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent')
-        )
-        db.session.add(event)
+        track_event('like', wallpaper)
         
-        # Increment like count
-        wallpaper.likes += 1
-        db.session.commit()
+        # Increment like count (flushed to the database in batches)
+        counter_buffer.increment(wallpaper_id, 'likes')
         
         return jsonify({
             'message': 'Like recorded',
-            'likes': wallpaper.likes
+            'likes': (wallpaper.likes or 0) + counter_buffer.pending(wallpaper_id, 'likes')
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @wallpapers_enhanced_bp.route('/api/wallpapers/categories', methods=['GET'])
+@cached_response()
 def get_categories():
     try:
         categories = db.session.query(Wallpaper.category).distinct().all()
@@ -285,26 +642,44 @@ def get_categories():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@wallpapers_enhanced_bp.route('/api/wallpapers/stats', methods=['GET'])
-def get_wallpaper_stats():
+@wallpapers_enhanced_bp.route('/api/wallpapers/recent', methods=['GET'])
+@cached_response()
+def get_recent_wallpapers():
+    """The most recently uploaded wallpapers (?status= to filter)"""
     try:
-        total_wallpapers = Wallpaper.query.count()
-        pending_wallpapers = Wallpaper.query.filter_by(status='pending').count()
-        approved_wallpapers = Wallpaper.query.filter_by(status='approved').count()
-        featured_wallpapers = Wallpaper.query.filter_by(featured=True).count()
+        query = wallpaper_list_query()
+        status = filter_arg('status')
+        if status:
+            query = query.filter(Wallpaper.status == status)
+        wallpapers = [
+            serialize_wallpaper_row(row)
+            for row in query.order_by(Wallpaper.created_at.desc(), Wallpaper.id.desc()).limit(RECENT_LIMIT)
+        ]
         
-        # Recent uploads (last 7 days)
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        recent_uploads = Wallpaper.query.filter(Wallpaper.created_at >= week_ago).count()
+        return jsonify({'wallpapers': wallpapers, 'count': len(wallpapers)}), 200
         
-        return jsonify({
-            'total_wallpapers': total_wallpapers,
-            'pending_wallpapers': pending_wallpapers,
-            'approved_wallpapers': approved_wallpapers,
-            'featured_wallpapers': featured_wallpapers,
-            'recent_uploads': recent_uploads
-        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@wallpapers_enhanced_bp.route('/api/wallpapers/tags', methods=['GET'])
+@cached_response()
+def get_tags():
+    try:
+        status = filter_arg('status')
+        limit = request.args.get('limit', 50, type=int)
+        
+        counts = tag_counts(status=status, limit=max(1, min(limit, 500)))
+        
+        return jsonify({'tags': [{'name': name, 'count': count} for name, count in counts]}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@wallpapers_enhanced_bp.route('/api/wallpapers/stats', methods=['GET'])
+@cached_response()
+def get_wallpaper_stats():
+    try:
+        return jsonify(get_stats()), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
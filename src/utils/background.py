@@ -0,0 +1,57 @@
+"""
+Background thread that runs a flush function inside an app context.
+
+Shared by the write-behind buffers (counters, analytics events, trending
+scores): each owns a BackgroundFlusher, flushes every interval or sooner
+when woken, and is flushed one last time at interpreter exit.
+"""
+import atexit
+import threading
+
+class BackgroundFlusher:
+    def __init__(self, flush, name, description):
+        self.flush = flush
+        self.name = name
+        self.description = description  # for log lines, e.g. 'flushing counters'
+        self.interval = None
+        self.app = None
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self, app, interval):
+        """Start the thread (once) and flush on interpreter exit"""
+        self.app = app
+        self.interval = interval
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def wake(self):
+        """Flush now instead of at the end of the interval"""
+        self._wakeup.set()
+
+    def flush_in_app(self):
+        """Run one flush, logging instead of raising"""
+        if self.app is None:
+            return
+        try:
+            with self.app.app_context():
+                self.flush()
+        except Exception as e:
+            print(f"Error {self.description}: {e}")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush_in_app()
+
+    def shutdown(self):
+        """Stop the thread and flush whatever is still pending"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+        self.flush_in_app()
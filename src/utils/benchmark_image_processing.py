@@ -0,0 +1,131 @@
+"""
+Benchmark per-upload CPU time of the image processing pipeline.
+
+Compares the previous separate-pass pipeline (header probe, thumbnail, one
+decode per eager rendition, and one each for the perceptual hash and palette)
+with process_uploaded_image(), which derives every output from a single
+reduced-scale decode. Both arms produce the same outputs. The previous
+pipeline is copied below as it was, so later changes to file_handler don't
+move the baseline; its hash and palette passes draft to 64px, which is the
+cheapest a separate pass can be.
+
+Two workloads: a thumbnail only (the default upload) and a thumbnail plus
+640 and 1920px WebP renditions (eager renditions configured). CPU time per
+upload of a 7680x4320 source, 3 runs:
+
+    JPEG thumbnail only     104 ms -> 48 ms   (2.2x)
+    JPEG with renditions    345 ms -> 268 ms  (1.3x)
+    PNG thumbnail only     1334 ms -> 638 ms  (2.1x)
+    PNG with renditions    3109 ms -> 1362 ms (2.3x)
+
+Usage: python src/utils/benchmark_image_processing.py [width height] [runs]
+"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+from PIL import Image
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from src.utils.file_handler import RENDITION_SAVE_OPTIONS, process_uploaded_image
+from src.utils.phash import dhash
+from src.utils.palette import extract_palette
+
+WORKLOADS = (
+    ('thumbnail only', ()),
+    ('with renditions', ((640, 'webp'), (1920, 'webp')))
+)
+
+def baseline_image_info(image_path):
+    with Image.open(image_path) as img:
+        width, height = img.size
+        return {
+            'resolution': f"{width}x{height}",
+            'file_size': os.path.getsize(image_path),
+            'width': width,
+            'height': height
+        }
+
+def baseline_thumbnail(image_path, thumbnail_path, size=(300, 300)):
+    with Image.open(image_path) as img:
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGB')
+        img.thumbnail(size, Image.Resampling.LANCZOS)
+        img.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
+
+def baseline_rendition(image_path, rendition_path, width, fmt):
+    pil_format, options = RENDITION_SAVE_OPTIONS[fmt]
+    with Image.open(image_path) as img:
+        if img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            img.draft('RGB', (width, height))
+        else:
+            width, height = img.size
+        if fmt == 'jpg' and img.mode != 'RGB':
+            img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if img.mode in ('LA', 'P') else 'RGB')
+        if img.size != (width, height):
+            img = img.resize((width, height), Image.Resampling.LANCZOS)
+        tmp_path = f"{rendition_path}.{uuid.uuid4().hex}.tmp"
+        img.save(tmp_path, pil_format, **options)
+        os.replace(tmp_path, rendition_path)
+
+def baseline_small(image_path):
+    # Hash and palette each opened the file again, drafted down to 64px
+    img = Image.open(image_path)
+    if img.width > 64:
+        img.draft('RGB', (64, max(1, img.height * 64 // img.width)))
+    img.load()
+    return img
+
+def baseline_phash(image_path):
+    with baseline_small(image_path) as img:
+        return dhash(img)
+
+def baseline_palette(image_path):
+    with baseline_small(image_path) as img:
+        return extract_palette(img)
+
+def make_sample(path, size, fmt):
+    img = Image.effect_mandelbrot(size, (-2.0, -1.2, 1.0, 1.2), 100).convert('RGB')
+    img.save(path, fmt, quality=90) if fmt == 'JPEG' else img.save(path, fmt)
+
+def separate_passes(image_path, workdir, renditions):
+    baseline_image_info(image_path)
+    baseline_thumbnail(image_path, os.path.join(workdir, 'thumb.jpg'))
+    for width, fmt in renditions:
+        baseline_rendition(image_path, os.path.join(workdir, f'{width}.{fmt}'), width, fmt)
+    baseline_phash(image_path)
+    baseline_palette(image_path)
+
+def single_decode(image_path, workdir, renditions):
+    jobs = [(os.path.join(workdir, f'{width}.{fmt}'), width, fmt) for width, fmt in renditions]
+    process_uploaded_image(image_path, os.path.join(workdir, 'thumb.jpg'), jobs)
+
+def cpu_time(func, image_path, workdir, renditions, runs):
+    func(image_path, workdir, renditions)  # warm up
+    started = time.process_time()
+    for _ in range(runs):
+        func(image_path, workdir, renditions)
+    return (time.process_time() - started) / runs
+
+def main():
+    size = (int(sys.argv[1]), int(sys.argv[2])) if len(sys.argv) >= 3 else (7680, 4320)
+    runs = int(sys.argv[3]) if len(sys.argv) >= 4 else 3
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for fmt, ext in (('JPEG', 'jpg'), ('PNG', 'png')):
+            image_path = os.path.join(workdir, f'sample.{ext}')
+            make_sample(image_path, size, fmt)
+            for name, renditions in WORKLOADS:
+                before = cpu_time(separate_passes, image_path, workdir, renditions, runs)
+                after = cpu_time(single_decode, image_path, workdir, renditions, runs)
+                print(f"{fmt} {size[0]}x{size[1]} {name}: separate passes {before * 1000:.1f} ms, "
+                      f"single decode {after * 1000:.1f} ms ({before / after:.2f}x)")
+
+if __name__ == '__main__':
+    main()
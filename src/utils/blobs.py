@@ -0,0 +1,123 @@
+"""
+Reference counting for content-addressed originals.
+
+Uploads are stored as <sha256>.<ext>, so every wallpaper uploaded with the same
+bytes shares one ImageBlob (original, thumbnail and renditions). The blob's
+ref_count is the number of wallpapers pointing at it; files are removed only
+when the last one is deleted. Wallpapers stored before content addressing have
+no blob and own their files outright.
+
+The files of a blob are deleted while its row is still locked by the
+releasing transaction, so an identical upload either takes a reference
+before the release or finds the blob gone (and the files with it).
+"""
+import os
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db
+from src.models.blob import ImageBlob
+from src.utils.file_handler import process_uploaded_image, thumbnail_filename_for
+from src.utils.storage import storage
+
+def blob_exists(content_hash):
+    """Whether an original with this hash is already stored"""
+    return db.session.query(ImageBlob.id).filter(ImageBlob.content_hash == content_hash).first() is not None
+
+def stored_hashes(content_hashes):
+    """The subset of content_hashes already stored, in one query"""
+    if not content_hashes:
+        return set()
+    rows = db.session.query(ImageBlob.content_hash).filter(ImageBlob.content_hash.in_(list(content_hashes))).all()
+    return {content_hash for content_hash, in rows}
+
+def acquire_blob(content_hash):
+    """Add a reference to an existing blob and return it, or None if it no longer exists"""
+    updated = ImageBlob.query.filter(ImageBlob.content_hash == content_hash).update(
+        {ImageBlob.ref_count: ImageBlob.ref_count + 1}, synchronize_session=False
+    )
+    if not updated:
+        return None
+    return ImageBlob.query.filter(ImageBlob.content_hash == content_hash).populate_existing().one()
+
+def register_blob(file_info):
+    """Record a newly stored original with one reference
+
+    Two identical uploads can both miss blob_exists(); the loser of the insert
+    race takes a reference on the winner's row instead. The row is part of the
+    caller's transaction (pysqlite would commit a savepoint on its own), so it
+    is rolled back with the wallpaper if that fails.
+    """
+    values = {
+        'content_hash': file_info['content_hash'],
+        'filename': file_info['filename'],
+        'thumbnail_filename': file_info.get('thumbnail_filename'),
+        'resolution': file_info.get('resolution'),
+        'file_size': file_info.get('file_size'),
+        'phash': file_info.get('phash'),
+        'palette': file_info.get('palette'),
+        'ref_count': 1
+    }
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql_insert if dialect == 'postgresql' else sqlite_insert
+        inserted = db.session.execute(
+            insert(ImageBlob).values(**values).on_conflict_do_nothing(index_elements=['content_hash'])
+        ).rowcount
+    else:
+        try:
+            with db.session.begin_nested():
+                db.session.add(ImageBlob(**values))
+            inserted = 1
+        except IntegrityError:
+            inserted = 0
+    if not inserted:
+        return acquire_blob(file_info['content_hash'])
+    return ImageBlob.query.filter(ImageBlob.content_hash == file_info['content_hash']).one()
+
+def release_blob(filename):
+    """Drop a reference to the blob stored as ``filename``, locking its row until the caller commits
+
+    Returns True when the caller should delete the files before committing:
+    the last reference was released, or the wallpaper predates content addressing.
+    """
+    blob = ImageBlob.query.filter(ImageBlob.filename == filename).with_for_update().first()
+    if blob is None:
+        return True
+    ImageBlob.query.filter(ImageBlob.id == blob.id).update(
+        {ImageBlob.ref_count: ImageBlob.ref_count - 1}, synchronize_session=False
+    )
+    db.session.refresh(blob)
+    if blob.ref_count > 0:
+        return False
+    db.session.delete(blob)
+    return True
+
+def discard_unregistered(filename, thumbnail_filename=None):
+    """Delete the files of an upload whose blob was never committed
+
+    Skipped if an identical upload registered a blob for the same name meanwhile.
+    """
+    if db.session.query(ImageBlob.id).filter(ImageBlob.filename == filename).first() is not None:
+        return False
+    storage.delete(filename)
+    if thumbnail_filename:
+        storage.delete(f'thumbnails/{thumbnail_filename}')
+    return True
+
+def ensure_thumbnail(blob, upload_folder):
+    """Generate a blob's missing thumbnail and metadata inline; returns whether it now has one"""
+    thumbnail_filename = thumbnail_filename_for(blob.filename)
+    thumbnail_path = os.path.join(upload_folder, 'thumbnails', thumbnail_filename)
+    try:
+        image_info = process_uploaded_image(storage.ensure_local(blob.filename), thumbnail_path)
+        storage.put_file(f'thumbnails/{thumbnail_filename}', thumbnail_path, immutable=True)
+    except Exception as e:
+        print(f"Error creating thumbnail: {e}")
+        return False
+    blob.thumbnail_filename = thumbnail_filename
+    blob.resolution = image_info['resolution']
+    blob.file_size = image_info['file_size']
+    blob.phash = image_info['phash']
+    blob.palette = image_info['palette']
+    return True
@@ -0,0 +1,216 @@
+"""
+Bulk ingestion of wallpaper packs.
+
+Files arrive as repeated multipart ``files`` fields or as one zip ``archive``.
+Each is staged and hashed like a single upload; originals not already stored
+are decoded in parallel in the image processing pool, then every Wallpaper
+row of the batch is inserted in a single transaction. The result is a
+manifest with one entry per input file, in input order.
+"""
+import json
+import os
+from datetime import datetime
+from src.models.user import db
+from src.models.wallpaper import Wallpaper
+from src.utils.file_handler import (
+    MAX_FILE_SIZE, InvalidImage, UploadTooLarge, allowed_file, stage_upload, store_upload,
+    thumbnail_filename_for, delete_file
+)
+from src.utils.blobs import stored_hashes, acquire_blob, register_blob, discard_unregistered
+from src.utils.tags import sync_wallpaper_tags
+from src.utils.colors import set_wallpaper_palette
+from src.utils.dimensions import set_wallpaper_resolution
+from src.utils.similarity import similarity_index
+from src.utils.image_tasks import image_processor
+from src.utils.renditions import rendition_cache
+
+DEFAULT_MAX_ITEMS = 500
+
+def multipart_sources(files):
+    """(name, opener, declared size) for each uploaded FileStorage"""
+    for file in files:
+        yield file.filename, (lambda file=file: file.stream), None
+
+def archive_sources(archive):
+    """(name, opener, declared size) for each file in an open ZipFile, skipping folders and metadata"""
+    for info in archive.infolist():
+        name = os.path.basename(info.filename)
+        if info.is_dir() or not name or name.startswith('.') or info.filename.startswith('__MACOSX/'):
+            continue
+        yield name, (lambda info=info: archive.open(info)), info.file_size
+
+def title_from_filename(filename):
+    """'misty_forest-01.jpg' -> 'misty forest 01'"""
+    stem = filename.rsplit('.', 1)[0]
+    return stem.replace('_', ' ').replace('-', ' ').strip()[:200] or 'Untitled'
+
+def stage_batch(sources, upload_folder, max_items=DEFAULT_MAX_ITEMS):
+    """Stream every source into the working folder; returns one manifest item per source"""
+    os.makedirs(os.path.join(upload_folder, 'thumbnails'), exist_ok=True)
+    items = []
+    for index, (name, opener, declared_size) in enumerate(sources):
+        item = {'index': index, 'filename': name, 'status': 'error'}
+        items.append(item)
+        if index >= max_items:
+            item['error'] = f'Too many files in batch (max {max_items})'
+        elif not allowed_file(name):
+            item['error'] = 'File type not allowed'
+        elif declared_size is not None and declared_size > MAX_FILE_SIZE:
+            item['error'] = 'File size too large (max 16MB)'
+        else:
+            stream = opener()
+            try:
+                # The limit is enforced on the bytes read, not on a zip member's declared size
+                item['staging_path'], item['stored_filename'], item['content_hash'] = stage_upload(stream, upload_folder)
+                item['status'] = 'staged'
+            except InvalidImage:
+                item['error'] = 'Invalid image file'
+            except UploadTooLarge:
+                item['error'] = 'File size too large (max 16MB)'
+            finally:
+                stream.close()
+    return items
+
+def process_batch(items, upload_folder):
+    """Decode each new original once, in parallel; returns (already stored hashes, file info by hash)"""
+    staged = [item for item in items if item['status'] == 'staged']
+    known = stored_hashes({item['content_hash'] for item in staged})
+
+    # Only the first copy of each new original is kept and processed
+    new = {}
+    for item in staged:
+        content_hash = item['content_hash']
+        if content_hash in known or content_hash in new:
+            os.remove(item['staging_path'])
+            item['deduplicated'] = True
+        else:
+            os.replace(item['staging_path'], os.path.join(upload_folder, item['stored_filename']))
+            item['deduplicated'] = False
+            new[content_hash] = item
+        del item['staging_path']
+
+    jobs = []
+    for item in new.values():
+        filename = item['stored_filename']
+        renditions = rendition_cache.eager_jobs(filename) if rendition_cache.enabled else []
+        jobs.append((
+            os.path.join(upload_folder, filename),
+            os.path.join(upload_folder, 'thumbnails', thumbnail_filename_for(filename)),
+            renditions
+        ))
+
+    infos = {}
+    for (content_hash, item), result in zip(new.items(), image_processor.process_many(jobs)):
+        filename = item['stored_filename']
+        if isinstance(result, Exception):
+            print(f"Error processing {item['filename']}: {result}")
+            delete_file(os.path.join(upload_folder, filename))
+            continue
+        thumbnail_filename = thumbnail_filename_for(filename)
+        try:
+            store_upload(upload_folder, filename, thumbnail_filename)
+        except Exception as e:
+            print(f"Error storing {item['filename']}: {e}")
+            discard_unregistered(filename, thumbnail_filename)
+            continue
+        for _, size in result['renditions']:
+            rendition_cache.record(size)
+        infos[content_hash] = {
+            'content_hash': content_hash,
+            'filename': filename,
+            'thumbnail_filename': thumbnail_filename,
+            'resolution': result['resolution'],
+            'file_size': result['file_size'],
+            'phash': result['phash'],
+            'palette': result['palette']
+        }
+
+    # Copies of an original that failed to decode or store fail with it
+    for item in staged:
+        content_hash = item['content_hash']
+        if content_hash not in known and content_hash not in infos:
+            item['status'] = 'error'
+            item['error'] = 'Invalid image file'
+    return known, infos
+
+def insert_batch(items, known, infos, user_id, defaults, metadata):
+    """Insert a Wallpaper per staged item in one transaction; returns (item, id, filename, phash, processing_status)"""
+    created = []
+    registered = set()
+    tag_cache = {}
+    for item in items:
+        if item['status'] != 'staged':
+            continue
+        content_hash = item['content_hash']
+        if content_hash in known or content_hash in registered:
+            blob = acquire_blob(content_hash)
+            if blob is None:
+                item['status'] = 'error'
+                item['error'] = 'Upload conflicted with a concurrent delete, please retry'
+                continue
+        else:
+            blob = register_blob(infos[content_hash])
+            registered.add(content_hash)
+
+        meta = metadata.get(item['filename']) or {}
+        tags = meta.get('tags', defaults['tags'])
+        needs_processing = image_processor.enabled and not blob.thumbnail_filename
+        wallpaper = Wallpaper(
+            title=(meta.get('title') or title_from_filename(item['filename']))[:200],
+            description=meta.get('description', defaults['description']),
+            filename=blob.filename,
+            thumbnail_filename=blob.thumbnail_filename,
+            category=(meta.get('category') or defaults['category'])[:100],
+            tags=json.dumps(tags) if isinstance(tags, list) else tags,
+            file_size=blob.file_size,
+            uploaded_by=user_id,
+            processing_status='processing' if needs_processing else 'ready',
+            processing_claimed_at=datetime.utcnow() if needs_processing else None,
+            phash=blob.phash
+        )
+        set_wallpaper_resolution(wallpaper, blob.resolution)
+        set_wallpaper_palette(wallpaper, blob.palette)
+        sync_wallpaper_tags(wallpaper, tag_cache)
+        db.session.add(wallpaper)
+        created.append((item, wallpaper))
+
+    # Read ids at flush time so the commit doesn't cost a refresh SELECT per row
+    db.session.flush()
+    created = [(item, w.id, w.filename, w.phash, w.processing_status) for item, w in created]
+    db.session.commit()
+    return created
+
+def ingest_batch(sources, upload_folder, user_id, defaults, metadata=None, max_items=DEFAULT_MAX_ITEMS):
+    """Stage, process and insert a batch; returns the per-item manifest"""
+    items = stage_batch(sources, upload_folder, max_items)
+    try:
+        known, infos = process_batch(items, upload_folder)
+        created = insert_batch(items, known, infos, user_id, defaults, metadata or {})
+    except Exception:
+        db.session.rollback()
+        for item in items:
+            if item.get('staging_path'):
+                delete_file(item.pop('staging_path'))
+            elif item.get('deduplicated') is False:
+                discard_unregistered(item['stored_filename'], thumbnail_filename_for(item['stored_filename']))
+        raise
+
+    for item, wallpaper_id, filename, phash, processing_status in created:
+        similarity_index.add(wallpaper_id, phash)
+        if processing_status == 'processing':
+            image_processor.submit(wallpaper_id, filename)
+    # After indexing the whole batch, so copies within the pack are flagged too
+    for item, wallpaper_id, filename, phash, processing_status in created:
+        item['status'] = 'created'
+        item['wallpaper_id'] = wallpaper_id
+        item['near_duplicates'] = [
+            {'id': match_id, 'distance': distance}
+            for distance, match_id in similarity_index.find(phash, exclude_id=wallpaper_id)
+        ]
+
+    for item in items:
+        item.pop('content_hash', None)
+        item.pop('stored_filename', None)
+        if item['status'] == 'error':
+            item.pop('deduplicated', None)
+    return items
@@ -0,0 +1,100 @@
+"""
+Palette rows and the colour filter for the wallpaper listing.
+
+Every palette colour is stored as a WallpaperColor row with its CIELAB
+coordinates and Lab bin. A ?color= query turns into an IN over the handful
+of bins near the requested colour (served by the (bin, wallpaper_id) index),
+with the exact delta E check applied only to rows in those bins.
+"""
+import os
+import sys
+import json
+from sqlalchemy import select
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from src.models.user import db
+from src.models.wallpaper import Wallpaper
+from src.models.blob import ImageBlob
+from src.models.color import WallpaperColor
+from src.utils.palette import parse_color, rgb_to_lab, lab_bin, bins_within
+from src.utils.file_handler import compute_palette
+from src.utils.storage import storage
+
+DEFAULT_COLOR_DISTANCE = 20
+# A colour must cover at least this share of the image to count as one of its colours
+DEFAULT_MIN_WEIGHT = 0.1
+
+def color_rows(palette):
+    """WallpaperColor rows for a palette JSON string"""
+    rows = []
+    for position, entry in enumerate(json.loads(palette) if palette else []):
+        lab = rgb_to_lab(parse_color(entry['color']))
+        rows.append(WallpaperColor(
+            position=position,
+            bin=lab_bin(lab),
+            l=lab[0], a=lab[1], b=lab[2],
+            weight=entry['weight']
+        ))
+    return rows
+
+def set_wallpaper_palette(wallpaper, palette):
+    """Store a palette on a wallpaper and replace its searchable colour rows"""
+    wallpaper.palette = palette
+    wallpaper.colors = color_rows(palette)
+
+def filter_by_color(query, color, max_distance=DEFAULT_COLOR_DISTANCE, min_weight=DEFAULT_MIN_WEIGHT):
+    """Restrict a wallpaper query to wallpapers with a palette colour within max_distance (delta E) of color"""
+    l, a, b = rgb_to_lab(parse_color(color))
+    matching = select(WallpaperColor.wallpaper_id).where(
+        WallpaperColor.bin.in_(bins_within((l, a, b), max_distance)),
+        WallpaperColor.weight >= min_weight,
+        (WallpaperColor.l - l) * (WallpaperColor.l - l)
+        + (WallpaperColor.a - a) * (WallpaperColor.a - a)
+        + (WallpaperColor.b - b) * (WallpaperColor.b - b) <= max_distance * max_distance
+    )
+    return query.filter(Wallpaper.id.in_(matching))
+
+def backfill_palettes(batch_size=200):
+    """Extract palettes for stored wallpapers (and their blobs) that predate colour search"""
+    last_id = 0
+    processed = 0
+    while True:
+        batch = (
+            Wallpaper.query.filter(Wallpaper.id > last_id, Wallpaper.palette.is_(None))
+            .order_by(Wallpaper.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+        palettes = {}
+        for wallpaper in batch:
+            if wallpaper.filename not in palettes:
+                try:
+                    palettes[wallpaper.filename] = compute_palette(storage.ensure_local(wallpaper.filename))
+                except Exception as e:
+                    print(f"Error extracting palette from {wallpaper.filename}: {e}")
+                    palettes[wallpaper.filename] = None
+            if palettes[wallpaper.filename]:
+                set_wallpaper_palette(wallpaper, palettes[wallpaper.filename])
+                processed += 1
+        for blob in ImageBlob.query.filter(ImageBlob.filename.in_(list(palettes)), ImageBlob.palette.is_(None)):
+            blob.palette = palettes[blob.filename]
+        db.session.commit()
+        last_id = batch[-1].id
+    return processed
+
+if __name__ == '__main__':
+    from flask import Flask
+    
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), '..', 'database', 'app.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    db.init_app(app)
+    
+    with app.app_context():
+        db.create_all()
+        print(f"Extracted palettes for {backfill_palettes()} wallpapers")
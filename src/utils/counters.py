@@ -0,0 +1,101 @@
+"""
+Write-behind buffer for wallpaper view/download/like counters.
+
+Request handlers add deltas in memory; a background thread flushes them on an
+interval (or sooner once enough are pending) as one executemany of
+UPDATE wallpaper SET views = views + :n, so increments are atomic in the
+database and never lost to a read-modify-write race between workers.
+"""
+import threading
+from collections import defaultdict
+from sqlalchemy import update, bindparam, func
+from src.models.user import db
+from src.models.wallpaper import Wallpaper
+from src.utils.background import BackgroundFlusher
+
+COUNTER_FIELDS = ('views', 'downloads', 'likes')
+
+class CounterBuffer:
+    def __init__(self, flush_interval=5.0, flush_threshold=500):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.app = None
+        self._pending = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher = BackgroundFlusher(self.flush, 'counter-flusher', 'flushing counters')
+
+    def init_app(self, app):
+        """Start the flusher thread for this app and flush on interpreter exit"""
+        self.app = app
+        self.flush_interval = app.config.get('COUNTER_FLUSH_INTERVAL', self.flush_interval)
+        self.flush_threshold = app.config.get('COUNTER_FLUSH_THRESHOLD', self.flush_threshold)
+        self._flusher.start(app, self.flush_interval)
+
+    def increment(self, wallpaper_id, field, amount=1):
+        """Buffer a counter delta for a wallpaper"""
+        if field not in COUNTER_FIELDS:
+            raise ValueError(f'Unknown counter {field}')
+        with self._lock:
+            self._pending[wallpaper_id][field] += amount
+            self._pending_total += amount
+            if self._pending_total >= self.flush_threshold:
+                self._flusher.wake()
+
+    def pending(self, wallpaper_id, field):
+        """Return the not yet flushed delta for a wallpaper counter"""
+        with self._lock:
+            deltas = self._pending.get(wallpaper_id)
+            return deltas[field] if deltas else 0
+
+    def apply_pending(self, data):
+        """Add pending deltas to a serialized wallpaper dict, in place"""
+        with self._lock:
+            deltas = self._pending.get(data['id'])
+            if deltas:
+                for field in COUNTER_FIELDS:
+                    data[field] = (data[field] or 0) + deltas[field]
+        return data
+
+    def flush(self):
+        """Write all pending deltas in one transaction; returns rows updated"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+                self._pending_total = 0
+            if not pending:
+                return 0
+
+            params = [
+                {'wallpaper_id': wallpaper_id, **{f'd_{f}': deltas[f] for f in COUNTER_FIELDS}}
+                for wallpaper_id, deltas in pending.items()
+            ]
+            stmt = (
+                update(Wallpaper.__table__)
+                .where(Wallpaper.__table__.c.id == bindparam('wallpaper_id'))
+                .values({
+                    field: func.coalesce(Wallpaper.__table__.c[field], 0) + bindparam(f'd_{field}')
+                    for field in COUNTER_FIELDS
+                })
+            )
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(stmt, params)
+            except Exception:
+                self._restore(pending)
+                raise
+            return len(params)
+
+    def _restore(self, pending):
+        with self._lock:
+            for wallpaper_id, deltas in pending.items():
+                for field, amount in deltas.items():
+                    self._pending[wallpaper_id][field] += amount
+                    self._pending_total += amount
+
+    def shutdown(self):
+        """Stop the flusher thread and write out whatever is still pending"""
+        self._flusher.shutdown()
+
+counter_buffer = CounterBuffer()
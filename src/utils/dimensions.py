@@ -0,0 +1,132 @@
+"""
+Parsed image dimensions and the size filters for the wallpaper listing.
+
+Wallpaper.resolution stays the display string ("3840x2160"); width, height,
+aspect_ratio and size_class are derived from it whenever it is set, so
+"4K and above" or "portrait only" become indexed comparisons instead of
+parsing every row in Python.
+"""
+import os
+import sys
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from src.models.user import db
+from src.models.wallpaper import Wallpaper
+
+# (name, long edge, short edge), largest first; anything smaller is 'sd'.
+# Edges are compared orientation-independently so a 2160x3840 phone
+# wallpaper is as 4k as a 3840x2160 desktop one.
+SIZE_CLASSES = (
+    ('8k', 7680, 4320),
+    ('5k', 5120, 2880),
+    ('4k', 3840, 2160),
+    ('qhd', 2560, 1440),
+    ('fhd', 1920, 1080),
+    ('hd', 1280, 720),
+)
+SIZE_CLASS_NAMES = tuple(name for name, _, _ in SIZE_CLASSES) + ('sd',)
+ORIENTATIONS = ('landscape', 'portrait', 'square')
+# Aspect ratios within this margin of 1 count as square
+SQUARE_TOLERANCE = 0.05
+
+def parse_resolution(resolution):
+    """(width, height) from '1920x1080'; None when missing or malformed"""
+    try:
+        width, height = (int(part) for part in resolution.lower().split('x'))
+    except (AttributeError, ValueError):
+        return None
+    if width <= 0 or height <= 0:
+        return None
+    return width, height
+
+def size_class(width, height):
+    long_edge, short_edge = max(width, height), min(width, height)
+    for name, min_long, min_short in SIZE_CLASSES:
+        if long_edge >= min_long and short_edge >= min_short:
+            return name
+    return 'sd'
+
+def dimension_fields(resolution):
+    """Wallpaper column values derived from a resolution string"""
+    parsed = parse_resolution(resolution)
+    if parsed is None:
+        return {'width': None, 'height': None, 'aspect_ratio': None, 'size_class': None}
+    width, height = parsed
+    return {
+        'width': width,
+        'height': height,
+        'aspect_ratio': round(width / height, 4),
+        'size_class': size_class(width, height)
+    }
+
+def set_wallpaper_resolution(wallpaper, resolution):
+    """Store a resolution on a wallpaper along with its parsed dimensions"""
+    wallpaper.resolution = resolution
+    for name, value in dimension_fields(resolution).items():
+        setattr(wallpaper, name, value)
+
+def filter_by_dimensions(query, min_width=None, min_height=None, orientation=None, size_classes=None):
+    """Restrict a wallpaper query by size; raises ValueError for an unknown orientation or size class"""
+    if min_width:
+        query = query.filter(Wallpaper.width >= min_width)
+    if min_height:
+        query = query.filter(Wallpaper.height >= min_height)
+    if orientation:
+        if orientation not in ORIENTATIONS:
+            raise ValueError(f"Invalid orientation {orientation}, expected one of {', '.join(ORIENTATIONS)}")
+        if orientation == 'landscape':
+            query = query.filter(Wallpaper.aspect_ratio > 1 + SQUARE_TOLERANCE)
+        elif orientation == 'portrait':
+            query = query.filter(Wallpaper.aspect_ratio < 1 - SQUARE_TOLERANCE)
+        else:
+            query = query.filter(Wallpaper.aspect_ratio.between(1 - SQUARE_TOLERANCE, 1 + SQUARE_TOLERANCE))
+    if size_classes:
+        unknown = [name for name in size_classes if name not in SIZE_CLASS_NAMES]
+        if unknown:
+            raise ValueError(f"Invalid size class {unknown[0]}, expected one of {', '.join(SIZE_CLASS_NAMES)}")
+        query = query.filter(Wallpaper.size_class.in_(size_classes))
+    return query
+
+def backfill_dimensions(batch_size=500):
+    """Parse width/height for stored wallpapers that predate the dimension columns"""
+    last_id = 0
+    processed = 0
+    while True:
+        batch = (
+            Wallpaper.query.filter(
+                Wallpaper.id > last_id,
+                Wallpaper.width.is_(None),
+                Wallpaper.resolution.isnot(None)
+            )
+            .order_by(Wallpaper.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+        for wallpaper in batch:
+            fields = dimension_fields(wallpaper.resolution)
+            if fields['width'] is None:
+                print(f"Skipping wallpaper {wallpaper.id}: unparseable resolution {wallpaper.resolution!r}")
+                continue
+            for name, value in fields.items():
+                setattr(wallpaper, name, value)
+            processed += 1
+        db.session.commit()
+        last_id = batch[-1].id
+    return processed
+
+if __name__ == '__main__':
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), '..', 'database', 'app.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        print(f"Parsed dimensions for {backfill_dimensions()} wallpapers")
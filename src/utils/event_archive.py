@@ -0,0 +1,369 @@
+"""
+Columnar cold archive for aged AnalyticsEvent rows.
+
+Events older than ANALYTICS_ARCHIVE_AFTER_DAYS are moved out of the
+analytics_event table into one partition per UTC day under
+ANALYTICS_ARCHIVE_FOLDER:
+
+    date=2025-01-31/part-<first id>/_meta.json
+                                   /<column>.bin
+                                   /<column>.dict.json   (string columns)
+
+Every column is its own file, so a report reads only the columns it groups
+or filters on, and a date range skips whole partitions. Integer and
+timestamp columns are flat arrays of signed 64-bit values (array module,
+byte order recorded in _meta.json, NULL as the minimum value). String
+columns are dictionary-encoded: each distinct value once in the .dict.json
+file plus a 32-bit code per row (-1 for NULL), so event_type and
+user_agent cost 4 bytes a row and filters compare integers. The format
+needs only the standard library; a part is written to a temporary folder
+and renamed into place, so readers never see half a part.
+
+Only events the rollup job has already merged (id <= its watermark) are
+archived, and a rollup rebuild reads the archive back, so moving events
+here never changes the rollups. One worker archives at a time, under a
+lease kept in analytics_rollup_state. The holder renews it before writing
+each part and in the same transaction as each delete, and stops with
+LeaseLost if another worker has taken it over since. The folder must be
+shared if the job can run on more than one host.
+Run with: python src/utils/event_archive.py [days]
+"""
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from sqlalchemy import func
+from src.models.user import db
+from src.models.analytics import AnalyticsEvent
+from src.models.rollup import RollupState
+
+DEFAULT_ARCHIVE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'event_archive')
+DEFAULT_ARCHIVE_AFTER_DAYS = 90
+COLUMNS = {
+    'id': 'int64',
+    'event_type': 'dict',
+    'wallpaper_id': 'int64',
+    'user_id': 'int64',
+    'session_id': 'dict',
+    'ip_address': 'dict',
+    'user_agent': 'dict',
+    'event_metadata': 'dict',
+    'created_at': 'timestamp'
+}
+# Columns a report may group by; 'day' comes from the partition
+GROUP_COLUMNS = ('day', 'event_type', 'wallpaper_id', 'user_id', 'user_agent')
+INT_NULL = -2 ** 63
+PART_ROWS = 250000
+DELETE_BATCH = 50000
+LEASE_NAME = 'event_archive'
+LEASE_SECONDS = 3600
+EPOCH = datetime(1970, 1, 1)
+
+class LeaseLost(RuntimeError):
+    """Another worker took over the archive lease while this one held it"""
+
+def _to_micros(moment):
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+def _from_micros(value):
+    return EPOCH + timedelta(microseconds=value)
+
+def _day(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+class EventArchive:
+    def __init__(self, root=DEFAULT_ARCHIVE_FOLDER, archive_after_days=DEFAULT_ARCHIVE_AFTER_DAYS):
+        self.root = root
+        self.archive_after_days = archive_after_days
+        self._lease_stamp = None
+
+    def init_app(self, app):
+        """Read ANALYTICS_ARCHIVE_* settings; ANALYTICS_ARCHIVE_AFTER_DAYS = None disables archiving"""
+        self.root = app.config.get('ANALYTICS_ARCHIVE_FOLDER', self.root)
+        self.archive_after_days = app.config.get('ANALYTICS_ARCHIVE_AFTER_DAYS', self.archive_after_days)
+
+    # Writing
+
+    def _partition(self, day):
+        return os.path.join(self.root, f"date={day.strftime('%Y-%m-%d')}")
+
+    def _write_part(self, day, rows):
+        final = os.path.join(self._partition(day), f"part-{rows[0]['id']}")
+        tmp = f"{final}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(tmp)
+        try:
+            for name, encoding in COLUMNS.items():
+                values = [row[name] for row in rows]
+                if encoding == 'dict':
+                    dictionary = {}
+                    data = array('i', (-1 if v is None else dictionary.setdefault(v, len(dictionary)) for v in values))
+                    with open(os.path.join(tmp, f'{name}.dict.json'), 'w') as f:
+                        json.dump(list(dictionary), f)
+                elif encoding == 'timestamp':
+                    data = array('q', (INT_NULL if v is None else _to_micros(v) for v in values))
+                else:
+                    data = array('q', (INT_NULL if v is None else v for v in values))
+                with open(os.path.join(tmp, f'{name}.bin'), 'wb') as f:
+                    data.tofile(f)
+            with open(os.path.join(tmp, '_meta.json'), 'w') as f:
+                json.dump({
+                    'day': day.strftime('%Y-%m-%d'),
+                    'rows': len(rows),
+                    'min_id': rows[0]['id'],
+                    'max_id': rows[-1]['id'],
+                    'columns': COLUMNS,
+                    'byteorder': sys.byteorder
+                }, f)
+            os.rename(tmp, final)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    def lock(self, timeout=0):
+        """Take the archive lease, waiting up to timeout seconds; False if another worker holds it"""
+        deadline = time.monotonic() + timeout
+        while not self._claim():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(1)
+        return True
+
+    def _claim(self):
+        table = RollupState.__table__
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            table.update()
+            .where(table.c.name == LEASE_NAME, table.c.updated_at < now - timedelta(seconds=LEASE_SECONDS))
+            .values(updated_at=now)
+        ).rowcount
+        if not claimed and db.session.get(RollupState, LEASE_NAME) is None:
+            db.session.add(RollupState(name=LEASE_NAME, last_event_id=0, updated_at=now))
+            claimed = True
+        try:
+            db.session.commit()
+        except Exception:
+            # Another worker created the lease row first
+            db.session.rollback()
+            return False
+        if claimed:
+            self._lease_stamp = now
+        return bool(claimed)
+
+    def renew(self):
+        """Extend the lease by LEASE_SECONDS, uncommitted; raises LeaseLost if it is no longer ours.
+
+        The stamp only matches while no other worker has claimed the lease
+        since, so committing the caller's work with the renewal makes that
+        work conditional on still holding it.
+        """
+        table = RollupState.__table__
+        now = datetime.utcnow()
+        renewed = db.session.execute(
+            table.update()
+            .where(table.c.name == LEASE_NAME, table.c.updated_at == self._lease_stamp)
+            .values(updated_at=now)
+        ).rowcount
+        if not renewed:
+            db.session.rollback()
+            self._lease_stamp = None
+            raise LeaseLost('The event archive lease expired and was taken over by another worker')
+        self._lease_stamp = now
+
+    def unlock(self):
+        if self._lease_stamp is None:
+            return
+        table = RollupState.__table__
+        # Leave a lease another worker has taken over alone
+        db.session.execute(
+            table.update()
+            .where(table.c.name == LEASE_NAME, table.c.updated_at == self._lease_stamp)
+            .values(updated_at=EPOCH)
+        )
+        db.session.commit()
+        self._lease_stamp = None
+
+    def archive(self, older_than_days=None):
+        """Move merged events older than older_than_days into the archive; returns statistics"""
+        older_than_days = self.archive_after_days if older_than_days is None else older_than_days
+        stats = {'events': 0, 'days': 0, 'locked': False}
+        if older_than_days is None:
+            return stats
+        if not self.lock():
+            stats['locked'] = True
+            return stats
+        try:
+            state = db.session.get(RollupState, 'analytics_event')
+            watermark = state.last_event_id if state else 0
+            cutoff = _day(datetime.utcnow()) - timedelta(days=older_than_days)
+            while True:
+                first = db.session.query(func.min(AnalyticsEvent.created_at)).filter(
+                    AnalyticsEvent.created_at < cutoff, AnalyticsEvent.id <= watermark
+                ).scalar()
+                if first is None:
+                    break
+                stats['events'] += self._archive_day(_day(first), watermark)
+                stats['days'] += 1
+        finally:
+            self.unlock()
+        return stats
+
+    def _archive_day(self, day, watermark):
+        window = (
+            AnalyticsEvent.created_at >= day,
+            AnalyticsEvent.created_at < day + timedelta(days=1),
+            AnalyticsEvent.id <= watermark
+        )
+        # A run that died between writing and deleting left these behind; don't archive them twice
+        archived = set()
+        for _, _, columns in self._read_parts(['id'], day, day + timedelta(days=1)):
+            archived.update(columns['id'])
+
+        moved = 0
+        last_id = 0
+        while True:
+            rows = (
+                db.session.query(*(getattr(AnalyticsEvent, name) for name in COLUMNS))
+                .filter(*window, AnalyticsEvent.id > last_id)
+                .order_by(AnalyticsEvent.id)
+                .limit(PART_ROWS)
+                .all()
+            )
+            if not rows:
+                break
+            fresh = [row._asdict() for row in rows if row.id not in archived]
+            if fresh:
+                self.renew()
+                db.session.commit()
+                self._write_part(day, fresh)
+                moved += len(fresh)
+            last_id = rows[-1].id
+
+        # Everything in the window is now on disk
+        while True:
+            ids = [row_id for (row_id,) in db.session.query(AnalyticsEvent.id).filter(*window).limit(DELETE_BATCH)]
+            if not ids:
+                break
+            self.renew()
+            db.session.query(AnalyticsEvent).filter(AnalyticsEvent.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+        return moved
+
+    # Reading
+
+    def _parts(self, start=None, end=None):
+        """(day, part folder) for every complete part of the partitions in [start, end)"""
+        if not os.path.isdir(self.root):
+            return
+        for partition in sorted(os.listdir(self.root)):
+            if not partition.startswith('date='):
+                continue
+            day = datetime.strptime(partition[5:], '%Y-%m-%d')
+            if (start is not None and day < _day(start)) or (end is not None and day >= end):
+                continue
+            directory = os.path.join(self.root, partition)
+            for part in sorted(os.listdir(directory)):
+                if part.startswith('part-') and not part.endswith('.tmp'):
+                    yield day, os.path.join(directory, part)
+
+    def _column(self, part, meta, name):
+        """(dictionary or None, raw values) of one column"""
+        encoding = meta['columns'][name]
+        data = array('i' if encoding == 'dict' else 'q')
+        with open(os.path.join(part, f'{name}.bin'), 'rb') as f:
+            data.frombytes(f.read())
+        if meta['byteorder'] != sys.byteorder:
+            data.byteswap()
+        if encoding == 'dict':
+            with open(os.path.join(part, f'{name}.dict.json')) as f:
+                return json.load(f), data
+        return None, data
+
+    def _decode(self, meta, name, dictionary, data):
+        encoding = meta['columns'][name]
+        if encoding == 'dict':
+            return [None if code < 0 else dictionary[code] for code in data]
+        if encoding == 'timestamp':
+            return [None if v == INT_NULL else _from_micros(v) for v in data]
+        return [None if v == INT_NULL else v for v in data]
+
+    def _read_parts(self, columns, start=None, end=None, event_types=None):
+        """(day, rows, {column: values}) per part, reading only the requested columns"""
+        for day, part in self._parts(start, end):
+            with open(os.path.join(part, '_meta.json')) as f:
+                meta = json.load(f)
+            keep = None
+            if event_types is not None:
+                dictionary, codes = self._column(part, meta, 'event_type')
+                wanted = {i for i, value in enumerate(dictionary) if value in event_types}
+                if not wanted:
+                    # None of the requested types occur in this part
+                    continue
+                keep = [i for i, code in enumerate(codes) if code in wanted]
+            result = {}
+            for name in columns:
+                values = self._decode(meta, name, *self._column(part, meta, name))
+                result[name] = values if keep is None else [values[i] for i in keep]
+            yield day, meta['rows'] if keep is None else len(keep), result
+
+    def scan(self, columns=tuple(COLUMNS), start=None, end=None, event_types=None):
+        """Archived events in [start, end) as row dicts of the requested columns, one list per part"""
+        for _, _, values in self._read_parts(columns, start, end, event_types):
+            yield [dict(zip(columns, row)) for row in zip(*(values[name] for name in columns))]
+
+    def report(self, start=None, end=None, group_by=('day',), event_types=None):
+        """Counter of archived events in [start, end) keyed by the group_by values"""
+        columns = [name for name in group_by if name != 'day']
+        counts = Counter()
+        for day, rows, values in self._read_parts(columns, start, end, event_types):
+            day_key = day.strftime('%Y-%m-%d')
+            grouped = Counter(zip(*(values[name] for name in columns))) if columns else {(): rows}
+            for row, n in grouped.items():
+                values_by_name = dict(zip(columns, row), day=day_key)
+                counts[tuple(values_by_name[name] for name in group_by)] += n
+        return counts
+
+event_archive = EventArchive()
+
+def event_counts(start, end, group_by=('day',), event_types=None):
+    """Event counts in [start, end) grouped by group_by, across the archive and the live table"""
+    unknown = [name for name in group_by if name not in GROUP_COLUMNS]
+    if unknown:
+        raise ValueError(f"Cannot group by {unknown[0]}, expected any of {', '.join(GROUP_COLUMNS)}")
+
+    counts = event_archive.report(start, end, group_by, event_types)
+    expressions = [
+        func.date(AnalyticsEvent.created_at) if name == 'day' else getattr(AnalyticsEvent, name)
+        for name in group_by
+    ]
+    query = db.session.query(*expressions, func.count()).filter(
+        AnalyticsEvent.created_at >= start, AnalyticsEvent.created_at < end
+    )
+    if event_types is not None:
+        query = query.filter(AnalyticsEvent.event_type.in_(event_types))
+    for row in query.group_by(*expressions):
+        key = tuple(str(value) if name == 'day' else value for name, value in zip(group_by, row[:-1]))
+        counts[key] += row[-1]
+    return counts
+
+if __name__ == '__main__':
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), '..', 'database', 'app.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        stats = event_archive.archive(int(sys.argv[1]) if len(sys.argv) > 1 else None)
+        print(f"Archived {stats['events']} events from {stats['days']} days")
@@ -0,0 +1,175 @@
+"""
+Asynchronous, batched ingestion of AnalyticsEvent rows.
+
+Request handlers append plain dicts to a bounded in-memory queue without
+touching the database; a background writer drains it with multi-row inserts.
+When the queue is full the configured overload policy decides what is lost:
+
+    drop_newest  - reject the incoming event (default)
+    drop_oldest  - evict the oldest queued event to make room
+    sample       - above the high-water mark keep only a fraction of events,
+                   and drop the incoming event once the queue is full
+"""
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db
+from src.models.analytics import AnalyticsEvent
+from src.utils.background import BackgroundFlusher
+
+OVERLOAD_POLICIES = ('drop_newest', 'drop_oldest', 'sample')
+
+class EventQueue:
+    def __init__(self, max_size=50000, batch_size=1000, flush_interval=1.0,
+                 overload_policy='drop_newest', sample_rate=0.1, high_water=0.8):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overload_policy = overload_policy
+        self.sample_rate = sample_rate
+        self.high_water = high_water
+        self.app = None
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher = BackgroundFlusher(self.flush, 'analytics-writer', 'writing analytics events')
+        self._metrics = {
+            'enqueued': 0,
+            'dropped': 0,
+            'sampled_out': 0,
+            'written': 0,
+            'requeued': 0,
+            'failed': 0,
+            'flushes': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0
+        }
+
+    def init_app(self, app):
+        """Read ANALYTICS_QUEUE_* settings and start the writer thread"""
+        self.app = app
+        self.max_size = app.config.get('ANALYTICS_QUEUE_MAX_SIZE', self.max_size)
+        self.batch_size = app.config.get('ANALYTICS_QUEUE_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('ANALYTICS_QUEUE_FLUSH_INTERVAL', self.flush_interval)
+        self.overload_policy = app.config.get('ANALYTICS_QUEUE_OVERLOAD_POLICY', self.overload_policy)
+        self.sample_rate = app.config.get('ANALYTICS_QUEUE_SAMPLE_RATE', self.sample_rate)
+        if self.overload_policy not in OVERLOAD_POLICIES:
+            raise ValueError(f'Unknown overload policy {self.overload_policy}')
+        self._flusher.start(app, self.flush_interval)
+
+    def enqueue(self, event_type, **fields):
+        """Queue an event; returns False if the overload policy dropped it"""
+        event = {
+            'event_type': event_type,
+            'wallpaper_id': fields.get('wallpaper_id'),
+            'user_id': fields.get('user_id'),
+            'session_id': fields.get('session_id'),
+            'ip_address': fields.get('ip_address'),
+            'user_agent': fields.get('user_agent'),
+            'event_metadata': fields.get('event_metadata'),
+            'created_at': fields.get('created_at') or datetime.utcnow()
+        }
+
+        with self._lock:
+            depth = len(self._queue)
+            if (self.overload_policy == 'sample' and depth >= self.max_size * self.high_water
+                    and random.random() >= self.sample_rate):
+                self._metrics['sampled_out'] += 1
+                return False
+            if depth >= self.max_size:
+                if self.overload_policy == 'drop_oldest':
+                    self._queue.popleft()
+                    self._metrics['dropped'] += 1
+                else:
+                    self._metrics['dropped'] += 1
+                    return False
+            self._queue.append(event)
+            self._metrics['enqueued'] += 1
+            if len(self._queue) >= self.batch_size:
+                self._flusher.wake()
+        return True
+
+    def metrics(self):
+        """Snapshot of queue depth and flush statistics"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['queue_depth'] = len(self._queue)
+        metrics['max_size'] = self.max_size
+        metrics['overload_policy'] = self.overload_policy
+        metrics['avg_flush_ms'] = round(metrics['total_flush_ms'] / metrics['flushes'], 3) if metrics['flushes'] else 0.0
+        metrics['total_flush_ms'] = round(metrics['total_flush_ms'], 3)
+        return metrics
+
+    def flush(self):
+        """Drain the queue in batches of batch_size; returns events written"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                if not batch:
+                    return written
+
+                started = time.perf_counter()
+                try:
+                    with db.engine.begin() as conn:
+                        conn.execute(AnalyticsEvent.__table__.insert(), batch)
+                    inserted = len(batch)
+                except IntegrityError:
+                    # One bad event (e.g. a deleted wallpaper on Postgres) fails the whole insert
+                    inserted = self._insert_each(batch)
+                except Exception:
+                    self._requeue(batch)
+                    raise
+                elapsed_ms = (time.perf_counter() - started) * 1000
+
+                with self._lock:
+                    self._metrics['written'] += inserted
+                    self._metrics['flushes'] += 1
+                    self._metrics['last_flush_ms'] = round(elapsed_ms, 3)
+                    self._metrics['max_flush_ms'] = round(max(self._metrics['max_flush_ms'], elapsed_ms), 3)
+                    self._metrics['total_flush_ms'] += elapsed_ms
+                written += inserted
+
+    def _insert_each(self, batch):
+        # Insert a batch that failed as a whole one row at a time, dropping only
+        # the rows that fail the same way (retrying them would never succeed)
+        inserted = dropped = 0
+        for i, event in enumerate(batch):
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(AnalyticsEvent.__table__.insert(), [event])
+                inserted += 1
+            except IntegrityError:
+                dropped += 1
+            except Exception:
+                self._requeue(batch[i:])
+                with self._lock:
+                    self._metrics['written'] += inserted
+                    self._metrics['failed'] += dropped
+                raise
+        with self._lock:
+            self._metrics['failed'] += dropped
+        print(f"Dropped {dropped} of {len(batch)} analytics events that violate a constraint")
+        return inserted
+
+    def _requeue(self, batch):
+        # Put a batch that failed to insert (e.g. database is locked) back at the
+        # front for the next flush; it is older than everything queued since, so
+        # if the queue filled up meanwhile only its newest events that fit are kept
+        with self._lock:
+            room = max(self.max_size - len(self._queue), 0)
+            keep = batch[max(len(batch) - room, 0):]
+            self._queue.extendleft(reversed(keep))
+            self._metrics['requeued'] += len(keep)
+            self._metrics['failed'] += len(batch) - len(keep)
+
+    def shutdown(self):
+        """Stop the writer thread and write out whatever is still queued"""
+        self._flusher.shutdown()
+
+event_queue = EventQueue()
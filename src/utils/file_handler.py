@@ -1,57 +1,290 @@
+import hashlib
 import os
+import re
+import tempfile
 import uuid
+from flask import Request
 from PIL import Image
 from werkzeug.utils import secure_filename
+from src.utils.phash import dhash, format_hash
+from src.utils.palette import extract_palette, format_palette
+from src.utils.storage import storage
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Werkzeug keeps smaller uploads in memory
+SPOOL_TO_DISK_OVER = 500 * 1024
+
+# Leading bytes of each allowed format
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+# Extension used for content-addressed names of each detected format
+IMAGE_EXTENSIONS = {'jpeg': 'jpg', 'png': 'png', 'gif': 'gif', 'webp': 'webp'}
+
+class UploadTooLarge(Exception):
+    pass
+
+class UploadRequest(Request):
+    """Request that spools large uploaded files into ``spool_folder`` instead of an anonymous temp file.
+
+    Werkzeug has the whole body on disk before a view runs, so stage_upload can
+    hard-link the spooled file into place rather than copying it a second time.
+    The file is removed when the request closes.
+    """
+    spool_folder = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        small = total_content_length is not None and total_content_length <= SPOOL_TO_DISK_OVER
+        if self.spool_folder is None or small:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        os.makedirs(self.spool_folder, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=self.spool_folder, prefix='.incoming-', suffix='.part')
+
+class InvalidImage(Exception):
+    pass
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def generate_unique_filename(filename):
-    """Generate a unique filename while preserving the extension"""
-    ext = filename.rsplit('.', 1)[1].lower()
-    unique_id = str(uuid.uuid4())
-    return f"{unique_id}.{ext}"
+def content_filename(content_hash, image_type):
+    """Content-addressed name of a stored original"""
+    return f"{content_hash}.{IMAGE_EXTENSIONS[image_type]}"
+
+# <sha256>.<ext> originals and thumb_<sha256>.jpg thumbnails
+CONTENT_ADDRESSED = re.compile(r'^(thumb_)?[0-9a-f]{64}\.[a-z0-9]+$')
+
+def is_content_addressed(filename):
+    """Whether a stored name is derived from its contents (and so never changes)"""
+    return CONTENT_ADDRESSED.match(os.path.basename(filename)) is not None
+
+def detect_image_type(header):
+    """Identify an allowed image format from its first bytes, or None"""
+    for signature, image_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_type
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+def stream_to_file(stream, file_path, first_chunk=b'', max_size=MAX_FILE_SIZE):
+    """Copy a stream to ``file_path`` in chunks, stopping as soon as it exceeds max_size.
+
+    The data is written to a temporary file next to the target and renamed
+    into place only when complete, so a partial upload is never visible.
+    Returns the number of bytes written and their sha256 hex digest.
+    """
+    tmp_path = f"{file_path}.{uuid.uuid4().hex}.part"
+    total = 0
+    digest = hashlib.sha256()
+    try:
+        with open(tmp_path, 'wb') as out:
+            chunk = first_chunk
+            while chunk:
+                total += len(chunk)
+                if total > max_size:
+                    raise UploadTooLarge()
+                digest.update(chunk)
+                out.write(chunk)
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+        os.replace(tmp_path, file_path)
+        return total, digest.hexdigest()
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def thumbnail_filename_for(filename):
+    """Name of the thumbnail generated for an uploaded file"""
+    return f"thumb_{filename.rsplit('.', 1)[0]}.jpg"
+
+THUMBNAIL_SIZE = (300, 300)
+
+RENDITION_SAVE_OPTIONS = {
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'avif': ('AVIF', {'quality': 60})
+}
+
+def _image_info(img, image_path):
+    # Dimensions come from the header; no pixel data is decoded
+    width, height = img.size
+    return {
+        'resolution': f"{width}x{height}",
+        'file_size': os.path.getsize(image_path),
+        'width': width,
+        'height': height
+    }
+
+def _decode_for(img, max_width):
+    """Decode an opened image once, at the smallest scale that still covers max_width.
 
-def create_thumbnail(image_path, thumbnail_path, size=(300, 300)):
+    For JPEG, draft() makes libjpeg decode at 1/2, 1/4 or 1/8 scale via DCT
+    scaling, so an 8K original needed only for 1920px outputs is never fully
+    decoded. Other formats decode at full size.
+    """
+    if img.width > max_width:
+        img.draft('RGB', (max_width, max(1, img.height * max_width // img.width)))
+    img.load()
+    return img
+
+def _atomic_save(img, path, pil_format, **options):
+    # Write to a temp file and rename so a concurrent reader never sees a partial file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        img.save(tmp_path, pil_format, **options)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return os.path.getsize(path)
+
+def _save_thumbnail(img, thumbnail_path, size=THUMBNAIL_SIZE):
+    # Convert to RGB if necessary (for PNG with transparency)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGB')
+    
+    # Fit within size maintaining aspect ratio; resize() leaves the decoded source intact for other outputs
+    scale = min(size[0] / img.width, size[1] / img.height, 1.0)
+    thumb_size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    if thumb_size != img.size:
+        img = img.resize(thumb_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+    img.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
+
+def _save_rendition(img, rendition_path, width, fmt, source_size):
+    pil_format, options = RENDITION_SAVE_OPTIONS[fmt]
+    # Size from the original's dimensions; the decoded image may already be reduced
+    source_width, source_height = source_size
+    width = min(width, source_width)
+    height = max(1, round(source_height * width / source_width))
+    
+    if fmt == 'jpg' and img.mode != 'RGB':
+        img = img.convert('RGB')
+    elif img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if img.mode in ('LA', 'P') else 'RGB')
+    if img.size != (width, height):
+        # reducing_gap: box-reduce by an integer factor before the LANCZOS pass (formats without draft)
+        img = img.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return _atomic_save(img, rendition_path, pil_format, **options)
+
+def create_thumbnail(image_path, thumbnail_path, size=THUMBNAIL_SIZE):
     """Create a thumbnail from an image"""
     try:
         with Image.open(image_path) as img:
-            # Convert to RGB if necessary (for PNG with transparency)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                img = img.convert('RGB')
-            
-            # Create thumbnail maintaining aspect ratio
-            img.thumbnail(size, Image.Resampling.LANCZOS)
-            
-            # Save thumbnail
-            img.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
+            _save_thumbnail(_decode_for(img, size[0] * 2), thumbnail_path, size)
             return True
     except Exception as e:
         print(f"Error creating thumbnail: {e}")
         return False
 
+def create_rendition(image_path, rendition_path, width, fmt):
+    """Write a copy of the image scaled down to ``width`` in the given format"""
+    with Image.open(image_path) as img:
+        source_size = img.size
+        return _save_rendition(_decode_for(img, width), rendition_path, width, fmt, source_size)
+
+def compute_phash(image_path):
+    """Perceptual hash of an image file, decoding at the smallest scale available"""
+    with Image.open(image_path) as img:
+        return dhash(_decode_for(img, 64))
+
+def compute_palette(image_path):
+    """Dominant-colour palette JSON of an image file, decoding at the smallest scale available"""
+    with Image.open(image_path) as img:
+        return format_palette(extract_palette(_decode_for(img, 64)))
+
 def get_image_info(image_path):
     """Get image dimensions and file size"""
     try:
         with Image.open(image_path) as img:
-            width, height = img.size
-            file_size = os.path.getsize(image_path)
-            return {
-                'resolution': f"{width}x{height}",
-                'file_size': file_size,
-                'width': width,
-                'height': height
-            }
+            return _image_info(img, image_path)
     except Exception as e:
         print(f"Error getting image info: {e}")
         return None
 
-def save_uploaded_file(file, upload_folder):
-    """Save uploaded file and create thumbnail"""
+def process_uploaded_image(image_path, thumbnail_path, renditions=()):
+    """Generate the thumbnail, renditions and metadata for a stored upload.
+
+    The file is opened and decoded once; every output is derived from that
+    decode. ``renditions`` is a sequence of (path, width, format). Runs in a
+    worker process and raises instead of returning None so the caller can retry.
+    """
+    try:
+        img = Image.open(image_path)
+    except Exception as e:
+        raise ValueError(f"Invalid image file {image_path}: {e}")
+    
+    with img:
+        image_info = _image_info(img, image_path)
+        source_size = img.size
+        max_width = max([THUMBNAIL_SIZE[0] * 2] + [width for _, width, _ in renditions])
+        decoded = _decode_for(img, max_width)
+        
+        _save_thumbnail(decoded, thumbnail_path)
+        image_info['phash'] = format_hash(dhash(decoded))
+        image_info['palette'] = format_palette(extract_palette(decoded))
+        image_info['renditions'] = [
+            (path, _save_rendition(decoded, path, width, fmt, source_size))
+            for path, width, fmt in renditions
+        ]
+    return image_info
+
+def _spooled_path(stream, upload_folder):
+    # Path of a file UploadRequest spooled into the upload folder, else None
+    name = getattr(stream, 'name', None)
+    if isinstance(name, str) and os.path.dirname(os.path.abspath(name)) == os.path.abspath(upload_folder):
+        return name
+    return None
+
+def stage_upload(stream, upload_folder, max_size=MAX_FILE_SIZE):
+    """Put an upload in the working folder under a temporary name.
+
+    Non-images are rejected from the first chunk before anything is written.
+    A request body is already spooled by Werkzeug when this runs, so for
+    uploads the size limit that matters is MAX_CONTENT_LENGTH; max_size only
+    bounds what is kept. A file UploadRequest spooled into the upload folder
+    is hashed in place and hard-linked to the staging name, other streams
+    are copied. Returns (staging path, content-addressed filename, content hash).
+    """
+    first_chunk = stream.read(UPLOAD_CHUNK_SIZE)
+    image_type = detect_image_type(first_chunk)
+    if image_type is None:
+        raise InvalidImage()
+    
+    staging_path = os.path.join(upload_folder, f".incoming-{uuid.uuid4().hex}")
+    spooled_path = _spooled_path(stream, upload_folder)
+    if spooled_path is None:
+        _, content_hash = stream_to_file(stream, staging_path, first_chunk, max_size)
+    else:
+        if os.fstat(stream.fileno()).st_size > max_size:
+            raise UploadTooLarge()
+        digest = hashlib.sha256(first_chunk)
+        for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        content_hash = digest.hexdigest()
+        os.link(spooled_path, staging_path)
+    return staging_path, content_filename(content_hash, image_type), content_hash
+
+def store_upload(upload_folder, filename, thumbnail_filename=None):
+    """Hand an original (and its thumbnail) to the storage backend; the local copies stay as the working cache"""
+    storage.put_file(filename, os.path.join(upload_folder, filename), immutable=True)
+    if thumbnail_filename:
+        storage.put_file(f"thumbnails/{thumbnail_filename}",
+                         os.path.join(upload_folder, 'thumbnails', thumbnail_filename),
+                         immutable=True)
+
+def save_uploaded_file(file, upload_folder, generate_thumbnail=True, is_stored=None):
+    """Save uploaded file under its content hash and create thumbnail (or leave it to a background worker)
+
+    ``is_stored(content_hash)`` reports whether an identical original is already
+    stored; if so the upload is discarded and only the hash and name are returned
+    with 'deduplicated': True.
+    """
     try:
         if not file or file.filename == '':
             return None, "No file selected"
@@ -63,39 +296,73 @@ def save_uploaded_file(file, upload_folder):
         os.makedirs(upload_folder, exist_ok=True)
         os.makedirs(os.path.join(upload_folder, 'thumbnails'), exist_ok=True)
         
-        # Generate unique filename
         original_filename = secure_filename(file.filename)
-        unique_filename = generate_unique_filename(original_filename)
-        
-        # Save original file
-        file_path = os.path.join(upload_folder, unique_filename)
-        file.save(file_path)
         
-        # Check file size
-        if os.path.getsize(file_path) > MAX_FILE_SIZE:
-            os.remove(file_path)
+        try:
+            staging_path, stored_filename, content_hash = stage_upload(file.stream, upload_folder)
+        except InvalidImage:
+            return None, "Invalid image file"
+        except UploadTooLarge:
             return None, "File size too large (max 16MB)"
         
-        # Get image info
-        image_info = get_image_info(file_path)
-        if not image_info:
-            os.remove(file_path)
-            return None, "Invalid image file"
+        file_path = os.path.join(upload_folder, stored_filename)
         
-        # Create thumbnail
-        thumbnail_filename = f"thumb_{unique_filename.rsplit('.', 1)[0]}.jpg"
+        if is_stored and is_stored(content_hash):
+            os.remove(staging_path)
+            return {
+                'filename': stored_filename,
+                'original_filename': original_filename,
+                'content_hash': content_hash,
+                'file_path': file_path,
+                'deduplicated': True
+            }, None
+        
+        # Identical concurrent uploads rename the same bytes onto the same name
+        os.replace(staging_path, file_path)
+        
+        # Create thumbnail and read image info from a single decode
+        thumbnail_filename = thumbnail_filename_for(stored_filename)
         thumbnail_path = os.path.join(upload_folder, 'thumbnails', thumbnail_filename)
         
-        if not create_thumbnail(file_path, thumbnail_path):
-            # If thumbnail creation fails, continue without it
+        image_info = None
+        if generate_thumbnail:
+            try:
+                image_info = process_uploaded_image(file_path, thumbnail_path)
+                del image_info['renditions']
+            except Exception as e:
+                # If thumbnail creation fails, continue without it
+                print(f"Error creating thumbnail: {e}")
+                thumbnail_filename = None
+        else:
             thumbnail_filename = None
         
+        # Get image info (header only) when no thumbnail was decoded
+        if image_info is None:
+            image_info = get_image_info(file_path)
+            if not image_info:
+                os.remove(file_path)
+                return None, "Invalid image file"
+            # Set by the background worker, from the same decode as the thumbnail
+            image_info['phash'] = None
+        
+        try:
+            store_upload(upload_folder, stored_filename, thumbnail_filename)
+        except Exception:
+            # No blob references these files yet, unless an identical upload registered one meanwhile
+            if not (is_stored and is_stored(content_hash)):
+                storage.delete(stored_filename)
+                if thumbnail_filename:
+                    storage.delete(f"thumbnails/{thumbnail_filename}")
+            raise
+        
         return {
-            'filename': unique_filename,
+            'filename': stored_filename,
             'thumbnail_filename': thumbnail_filename,
             'original_filename': original_filename,
+            'content_hash': content_hash,
             'file_path': file_path,
             'thumbnail_path': thumbnail_path if thumbnail_filename else None,
+            'deduplicated': False,
             **image_info
         }, None
         
@@ -0,0 +1,101 @@
+"""
+HyperLogLog distinct-count sketches.
+
+A sketch with 2**p one-byte registers estimates the number of distinct
+values added to it with a relative standard error of 1.04 / sqrt(2**p).
+At the default p = 12 (4096 registers, 4KB before compression) that is
+about 1.6%: roughly two estimates in three are within 1.6% of the true
+count and nineteen in twenty within 3.3%. Up to about 3 * 2**p distinct
+values the estimate comes from linear counting over the empty registers,
+which is nearly exact for small counts; its error grows towards ~2% near
+the switch-over.
+
+Sketches merge by taking the register-wise maximum. The result is exactly
+the sketch of the union, so a monthly distinct count is the merge of 30
+daily sketches, with the same error bound as a single sketch. Merging is
+also idempotent, so re-adding a value or re-merging a sketch changes nothing.
+Run with: python src/utils/hll.py  (measures the observed error)
+"""
+import math
+import zlib
+from hashlib import blake2b
+
+DEFAULT_PRECISION = 12
+# Linear counting is used while its estimate is below this many times the register count
+LINEAR_COUNTING_LIMIT = 3
+_INVERSE_POWERS = [2.0 ** -r for r in range(65)]
+
+def relative_error(precision=DEFAULT_PRECISION):
+    """Relative standard error of a sketch with 2**precision registers"""
+    return 1.04 / math.sqrt(1 << precision)
+
+class HyperLogLog:
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError(f'Precision must be between 4 and 16, got {precision}')
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+        if len(self.registers) != self.size:
+            raise ValueError(f'Expected {self.size} registers, got {len(self.registers)}')
+
+    def add(self, value):
+        """Add a string (or anything with a stable str()) to the sketch"""
+        h = int.from_bytes(blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        # Position of the leftmost 1 bit in the remaining 64 - p bits
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Fold another sketch of the same precision into this one, in place"""
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches of different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """Estimated number of distinct values added"""
+        m = self.size
+        zeros = self.registers.count(0)
+        if zeros:
+            # The raw estimate is biased upwards until about 3m; linear counting is not
+            linear = m * math.log(m / zeros)
+            if linear <= LINEAR_COUNTING_LIMIT * m:
+                return int(round(linear))
+        alpha = 0.7213 / (1 + 1.079 / m)
+        return int(round(alpha * m * m / sum(_INVERSE_POWERS[r] for r in self.registers)))
+
+    def to_bytes(self):
+        """Precision byte followed by the zlib-compressed registers"""
+        return bytes([self.precision]) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[0], zlib.decompress(data[1:]))
+
+    @classmethod
+    def union(cls, sketches, precision=DEFAULT_PRECISION):
+        """Merge of several sketches (an empty sketch if there are none)"""
+        result = cls(precision)
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+if __name__ == '__main__':
+    import random
+
+    bound = relative_error()
+    print(f"p={DEFAULT_PRECISION}: standard error {bound:.2%}")
+    for true_count in (100, 1000, 10000, 100000, 1000000):
+        errors = []
+        for trial in range(5):
+            sketch = HyperLogLog()
+            offset = random.getrandbits(32)
+            for i in range(true_count):
+                sketch.add(f'{offset}:{i}')
+            errors.append((sketch.count() - true_count) / true_count)
+        worst = max(abs(e) for e in errors)
+        print(f"{true_count:>8} distinct: worst error {worst:.2%} over 5 trials ({'ok' if worst <= 3 * bound else 'OUTSIDE 3 sigma'})")
@@ -0,0 +1,261 @@
+"""
+Background image processing for uploads.
+
+create_wallpaper stores the original and inserts the Wallpaper row with
+processing_status='processing'; the thumbnail and metadata are produced in a
+process pool and written back here, to the blob and to every wallpaper sharing
+it. Failed jobs are retried with backoff up to
+IMAGE_PROCESSING_MAX_ATTEMPTS times before the row is marked 'failed'.
+
+A job belongs to the worker that last stamped processing_claimed_at. Every
+IMAGE_PROCESSING_CLAIM_TIMEOUT seconds (and at start-up) each worker takes
+over jobs whose claim is older than that, by compare-and-set on the stamp,
+so a job abandoned by a dead worker is resubmitted by exactly one other.
+
+A pool whose child process died (crash, OOM kill) refuses all further work;
+it is replaced by the next submit. A retry that can't be queued marks the
+row 'failed' instead of leaving it 'processing'.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from src.models.user import db
+from src.models.wallpaper import Wallpaper
+from src.models.blob import ImageBlob
+from src.utils.file_handler import process_uploaded_image, thumbnail_filename_for, delete_file
+from src.utils.renditions import rendition_cache
+from src.utils.storage import storage
+from src.utils.colors import set_wallpaper_palette
+from src.utils.similarity import similarity_index
+from src.utils.dimensions import dimension_fields
+from src.utils.response_cache import invalidate_catalog
+
+class ImageProcessor:
+    def __init__(self, max_workers=2, max_attempts=3, retry_delay=2.0, claim_timeout=300):
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.claim_timeout = claim_timeout
+        self.app = None
+        self.upload_folder = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sweeper = None
+
+    def init_app(self, app, upload_folder):
+        """Configure from IMAGE_PROCESSING_* settings and resume unfinished jobs"""
+        self.app = app
+        self.upload_folder = upload_folder
+        self.max_workers = app.config.get('IMAGE_PROCESSING_WORKERS', self.max_workers)
+        self.max_attempts = app.config.get('IMAGE_PROCESSING_MAX_ATTEMPTS', self.max_attempts)
+        self.retry_delay = app.config.get('IMAGE_PROCESSING_RETRY_DELAY', self.retry_delay)
+        self.claim_timeout = app.config.get('IMAGE_PROCESSING_CLAIM_TIMEOUT', self.claim_timeout)
+        atexit.register(self.shutdown)
+        with app.app_context():
+            self.resume_pending()
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep, name='image-job-sweeper', daemon=True)
+            self._sweeper.start()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._stopped.is_set():
+                raise RuntimeError('Image processor is shut down')
+            if self._executor is None:
+                # spawn: forking a multi-threaded gunicorn worker is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _replace_executor(self, broken):
+        """Drop a broken pool so the next _get_executor() starts a fresh one"""
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _submit_job(self, *job):
+        executor = self._get_executor()
+        try:
+            return executor.submit(process_uploaded_image, *job)
+        except BrokenProcessPool:
+            # A child died and failed every job in flight; start over with a new pool
+            self._replace_executor(executor)
+        except RuntimeError:
+            # Shut down by another thread replacing it after we got it
+            if self._stopped.is_set():
+                raise
+        return self._get_executor().submit(process_uploaded_image, *job)
+
+    @property
+    def enabled(self):
+        return self.app is not None
+
+    def submit(self, wallpaper_id, filename):
+        """Queue thumbnail/metadata generation for a stored upload"""
+        image_path = storage.ensure_local(filename)
+        thumbnail_filename = thumbnail_filename_for(filename)
+        thumbnail_path = os.path.join(self.upload_folder, 'thumbnails', thumbnail_filename)
+
+        renditions = rendition_cache.eager_jobs(filename) if rendition_cache.enabled else []
+        future = self._submit_job(image_path, thumbnail_path, renditions)
+        future.add_done_callback(
+            lambda f: self._on_done(f, wallpaper_id, filename, thumbnail_filename)
+        )
+        return future
+
+    def process_many(self, jobs):
+        """Run process_uploaded_image for each (image_path, thumbnail_path, renditions) job in parallel.
+
+        Blocks until all are done; returns each job's image info, or the
+        exception it raised, in job order.
+        """
+        futures = [self._submit_job(*job) for job in jobs]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def resume_pending(self):
+        """Claim and resubmit uploads whose worker stopped working on them; returns jobs resumed"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.claim_timeout)
+        stale = db.session.query(Wallpaper.id, Wallpaper.filename, Wallpaper.processing_claimed_at).filter(
+            Wallpaper.processing_status == 'processing',
+            or_(Wallpaper.processing_claimed_at.is_(None), Wallpaper.processing_claimed_at < cutoff)
+        ).all()
+        resumed = 0
+        for wallpaper_id, filename, claimed_at in stale:
+            # Only the worker whose update still sees the old stamp gets the job
+            claimed = Wallpaper.query.filter(
+                Wallpaper.id == wallpaper_id,
+                Wallpaper.processing_status == 'processing',
+                Wallpaper.processing_claimed_at.is_(None) if claimed_at is None
+                else Wallpaper.processing_claimed_at == claimed_at
+            ).update({Wallpaper.processing_claimed_at: datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+            if not claimed:
+                continue
+            try:
+                self.submit(wallpaper_id, filename)
+                resumed += 1
+            except Exception as e:
+                print(f"Error resuming image processing for wallpaper {wallpaper_id}: {e}")
+        return resumed
+
+    def _sweep(self):
+        while not self._stopped.wait(self.claim_timeout):
+            try:
+                with self.app.app_context():
+                    self.resume_pending()
+            except Exception as e:
+                print(f"Error resuming image processing: {e}")
+
+    def _on_done(self, future, wallpaper_id, filename, thumbnail_filename):
+        try:
+            with self.app.app_context():
+                wallpaper = db.session.get(Wallpaper, wallpaper_id)
+                blob = ImageBlob.query.filter(ImageBlob.filename == filename).first()
+                error = future.exception()
+                if error is None and (wallpaper is not None or blob is not None):
+                    try:
+                        storage.put_file(f'thumbnails/{thumbnail_filename}',
+                                         os.path.join(self.upload_folder, 'thumbnails', thumbnail_filename),
+                                         immutable=True)
+                    except Exception as e:
+                        error = e
+                if wallpaper is None:
+                    if blob is None:
+                        # Deleted while processing; don't leave an orphaned thumbnail behind
+                        delete_file(os.path.join(self.upload_folder, 'thumbnails', thumbnail_filename))
+                        if rendition_cache.enabled:
+                            rendition_cache.purge(filename)
+                        return
+                    if error is not None:
+                        return
+                else:
+                    wallpaper.processing_attempts = (wallpaper.processing_attempts or 0) + 1
+
+                if error is None:
+                    image_info = future.result()
+                    if blob is not None:
+                        blob.thumbnail_filename = thumbnail_filename
+                        blob.resolution = image_info['resolution']
+                        blob.file_size = image_info['file_size']
+                        blob.phash = image_info['phash']
+                        blob.palette = image_info['palette']
+                    # Duplicates uploaded while this job ran are waiting on the same result
+                    values = {
+                        Wallpaper.thumbnail_filename: thumbnail_filename,
+                        Wallpaper.resolution: image_info['resolution'],
+                        Wallpaper.file_size: image_info['file_size'],
+                        Wallpaper.phash: image_info['phash'],
+                        Wallpaper.processing_status: 'ready',
+                        Wallpaper.processing_error: None
+                    }
+                    for name, value in dimension_fields(image_info['resolution']).items():
+                        values[getattr(Wallpaper, name)] = value
+                    Wallpaper.query.filter(Wallpaper.filename == filename).update(values, synchronize_session='fetch')
+                    for sharing in Wallpaper.query.filter(Wallpaper.filename == filename, Wallpaper.palette.is_(None)):
+                        set_wallpaper_palette(sharing, image_info['palette'])
+                    for _, size in image_info['renditions']:
+                        rendition_cache.record(size)
+                elif wallpaper.processing_attempts < self.max_attempts:
+                    wallpaper.processing_error = str(error)
+                    delay = self.retry_delay * 2 ** (wallpaper.processing_attempts - 1)
+                    # Keep the claim through the backoff so no other worker takes the retry
+                    wallpaper.processing_claimed_at = datetime.utcnow() + timedelta(seconds=delay)
+                    retry = threading.Timer(delay, self._retry, args=(wallpaper_id, filename))
+                    retry.daemon = True
+                    retry.start()
+                else:
+                    wallpaper.processing_status = 'failed'
+                    wallpaper.processing_error = str(error)
+                db.session.commit()
+                invalidate_catalog()
+                if error is None:
+                    for (sharing_id,) in db.session.query(Wallpaper.id).filter(Wallpaper.filename == filename):
+                        similarity_index.add(sharing_id, image_info['phash'])
+        except Exception as e:
+            print(f"Error recording image processing result for wallpaper {wallpaper_id}: {e}")
+
+    def _retry(self, wallpaper_id, filename):
+        if self._stopped.is_set():
+            # The claim runs out and another worker resumes the job
+            return
+        try:
+            self.submit(wallpaper_id, filename)
+        except Exception as e:
+            print(f"Error resubmitting image processing for wallpaper {wallpaper_id}: {e}")
+            try:
+                with self.app.app_context():
+                    Wallpaper.query.filter(
+                        Wallpaper.id == wallpaper_id,
+                        Wallpaper.processing_status == 'processing'
+                    ).update({
+                        Wallpaper.processing_status: 'failed',
+                        Wallpaper.processing_error: f'Could not resubmit: {e}'
+                    }, synchronize_session=False)
+                    db.session.commit()
+                    invalidate_catalog()
+            except Exception as e:
+                print(f"Error recording image processing failure for wallpaper {wallpaper_id}: {e}")
+
+    def shutdown(self):
+        self._stopped.set()
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+image_processor = ImageProcessor()
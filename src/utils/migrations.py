@@ -0,0 +1,231 @@
+"""
+Ordered schema migrations for databases created before a model change.
+
+Missing tables are created and columns added to a model are added to
+existing tables before anything else runs; other changes (indexes,
+backfills) are registered here and recorded in the schema_migrations table
+once applied. A migration that fails part way is rerun from the start on
+the next boot, which each one tolerates; they are not safe to run twice at
+the same time (backfills insert unique rows, rebuilds reset shared state),
+so every worker migrates under migration_lock() and a worker that gets the
+lock after another finds nothing left to do.
+Run with: python src/utils/migrations.py
+"""
+import os
+import re
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import text, inspect
+from sqlalchemy.schema import CreateIndex, CreateColumn
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, migrations run unlocked
+    fcntl = None
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from src.models.user import db
+from src.utils.search import ensure_search_index
+from src.utils.tags import backfill_tags
+from src.utils.wallpaper_stats import rebuild_stats_row
+from src.utils.dimensions import backfill_dimensions
+from src.utils.rollups import schedule_rebuild
+
+schema_migrations = db.Table(
+    'schema_migrations',
+    db.Column('id', db.String(100), primary_key=True),
+    db.Column('applied_at', db.DateTime, nullable=False)
+)
+
+MIGRATIONS = []
+# Key of the Postgres advisory lock held while migrating
+MIGRATION_LOCK_KEY = 0x77616c6c
+
+def migration(migration_id):
+    """Register a migration function; migrations run in registration order"""
+    def decorator(func):
+        MIGRATIONS.append((migration_id, func))
+        return func
+    return decorator
+
+def create_missing_indexes(engine):
+    """Create every index declared on the models that the database lacks.
+
+    On Postgres indexes are built with CREATE INDEX CONCURRENTLY outside a
+    transaction so writes to the table are not blocked; an INVALID index left
+    behind by an interrupted build is dropped and rebuilt.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda ix: ix.name):
+            if index.name in existing and not _is_invalid_index(engine, index.name):
+                continue
+            _create_index(engine, index)
+            created.append(index.name)
+    return created
+
+def add_missing_columns(engine):
+    """Add columns declared on the models that existing tables lack.
+
+    New columns must be nullable or carry a server_default so existing rows
+    are valid; on Postgres 11+ a constant default makes this a catalog-only change.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {col['name'] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                print(f"Skipping {table.name}.{column.name}: NOT NULL without a server_default needs a data migration")
+                continue
+            ddl = CreateColumn(column).compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {engine.dialect.identifier_preparer.format_table(table)} ADD COLUMN {ddl}'))
+            added.append(f'{table.name}.{column.name}')
+    return added
+
+def _is_invalid_index(engine, name):
+    if engine.dialect.name != 'postgresql':
+        return False
+    with engine.connect() as conn:
+        return bool(conn.execute(text(
+            "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {'name': name}).scalar())
+
+def _create_index(engine, index):
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect))
+
+    if engine.dialect.name == 'postgresql':
+        ddl = re.sub(r'^CREATE (UNIQUE )?INDEX', r'CREATE \1INDEX CONCURRENTLY', ddl)
+        invalid = _is_invalid_index(engine, index.name)
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            if invalid:
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"'))
+            conn.execute(text(ddl))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text(ddl))
+
+@migration('0001_wallpaper_search_index')
+def add_search_index(engine):
+    ensure_search_index(engine)
+
+@migration('0002_backfill_wallpaper_tags')
+def add_wallpaper_tags(engine):
+    backfill_tags()
+
+@migration('0003_hot_query_indexes')
+def add_hot_query_indexes(engine):
+    create_missing_indexes(engine)
+
+@migration('0004_materialized_wallpaper_stats')
+def add_wallpaper_stats(engine):
+    rebuild_stats_row()
+
+@migration('0005_wallpaper_dimensions')
+def add_wallpaper_dimensions(engine):
+    # Backfill before indexing so the indexes are built once over the final values
+    backfill_dimensions()
+    create_missing_indexes(engine)
+
+@migration('0006_analytics_rollups')
+def add_analytics_rollups(engine):
+    schedule_rebuild()
+
+@migration('0007_analytics_sketches')
+def add_analytics_sketches(engine):
+    # Distinct-actor sketches cover every stored day only after a full re-merge
+    schedule_rebuild()
+
+@contextmanager
+def migration_lock(engine):
+    """Hold a lock shared by every process using the database while migrating.
+
+    Postgres: a session-level advisory lock on a dedicated connection.
+    SQLite: an flock on a file beside the database file. Migrations write
+    through other connections, so the lock cannot be a write transaction on
+    the SQLite database itself (it allows one writer at a time). Both are
+    released if the process dies.
+    """
+    if engine.dialect.name == 'postgresql':
+        with engine.connect() as conn:
+            conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+            conn.commit()
+            try:
+                yield
+            finally:
+                conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+                conn.commit()
+        return
+
+    database = engine.url.database
+    if engine.dialect.name != 'sqlite' or fcntl is None or not database or database == ':memory:':
+        yield
+        return
+    with open(f'{database}.migrate.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def applied_migrations(engine):
+    schema_migrations.create(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(schema_migrations.select())}
+
+def run_migrations(engine):
+    """Create missing tables and apply pending migrations in order; returns the ids that were applied"""
+    with migration_lock(engine):
+        # create_all inside the lock too: two workers creating the same table collide
+        db.metadata.create_all(engine)
+        # Bring existing tables up to the declared columns first so data
+        # migrations below can query through the current models
+        for column in add_missing_columns(engine):
+            print(f"Added column {column}")
+        done = applied_migrations(engine)
+        applied = []
+
+        for migration_id, func in MIGRATIONS:
+            if migration_id in done:
+                continue
+            print(f"Applying migration {migration_id}...")
+            func(engine)
+            with engine.begin() as conn:
+                conn.execute(schema_migrations.insert().values(id=migration_id, applied_at=datetime.utcnow()))
+            applied.append(migration_id)
+        return applied
+
+if __name__ == '__main__':
+    from flask import Flask
+    from src.models.wallpaper import Wallpaper
+    from src.models.report import Report
+    from src.models.analytics import AnalyticsEvent, AdPerformance
+    from src.models.tag import Tag
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), '..', 'database', 'app.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        applied = run_migrations(db.engine)
+        print(f"Applied {len(applied)} migration(s)")
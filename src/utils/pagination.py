@@ -0,0 +1,102 @@
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+# Columns a keyset cursor may be ordered on; each is paired with ``id`` as a tiebreaker
+CURSOR_SORT_COLUMNS = {'created_at', 'updated_at', 'title', 'views', 'downloads', 'likes', 'file_size', 'id'}
+
+COUNT_CACHE_TTL = 60  # seconds
+COUNT_CACHE_MAX_ENTRIES = 1024  # keys carry raw filter values (search text, tags, ...), so bound them
+
+_count_cache = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(sort_by, order, value, row_id):
+    """Encode the position after a row as an opaque, URL-safe cursor"""
+    if isinstance(value, datetime):
+        value = {'dt': value.isoformat()}
+    payload = json.dumps([sort_by, order, value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, sort_by, order):
+    """Decode a cursor, checking it was issued for the same ordering"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, cursor_order, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise InvalidCursor('Malformed cursor')
+
+    if cursor_sort != sort_by or cursor_order != order:
+        raise InvalidCursor('Cursor does not match sort_by/order')
+    if isinstance(value, dict) and 'dt' in value:
+        value = datetime.fromisoformat(value['dt'])
+    return value, row_id
+
+def apply_keyset(query, model, sort_by, order, cursor=None, column=None):
+    """Order a query by (sort_by, id) and seek past the cursor position.
+
+    ``column`` overrides the model attribute named by sort_by, e.g. a search
+    rank; the query must then also select it labelled sort_by. NULL sort
+    values are ordered last in both directions so the seek predicate is the
+    same on SQLite and Postgres.
+    """
+    if column is None:
+        column = getattr(model, sort_by)
+    descending = order == 'desc'
+
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort_by, order)
+        id_after = model.id < row_id if descending else model.id > row_id
+        if value is None:
+            query = query.filter(and_(column.is_(None), id_after))
+        else:
+            value_after = column < value if descending else column > value
+            query = query.filter(or_(
+                value_after,
+                and_(column == value, id_after),
+                column.is_(None)
+            ))
+
+    if sort_by == 'id':
+        return query.order_by(model.id.desc() if descending else model.id.asc())
+    if descending:
+        return query.order_by(column.desc().nulls_last(), model.id.desc())
+    return query.order_by(column.asc().nulls_last(), model.id.asc())
+
+def keyset_page(query, model, sort_by, order, per_page, cursor=None, column=None):
+    """Fetch one page and the cursor for the next one (None on the last page)"""
+    rows = apply_keyset(query, model, sort_by, order, cursor, column).limit(per_page + 1).all()
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+
+    next_cursor = None
+    if has_next and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(sort_by, order, getattr(last, sort_by), last.id)
+    return rows, next_cursor
+
+def cached_count(key, query):
+    """Return ``query.count()``, memoized per filter key for COUNT_CACHE_TTL seconds (LRU, COUNT_CACHE_MAX_ENTRIES keys)"""
+    now = time.monotonic()
+    with _count_cache_lock:
+        hit = _count_cache.get(key)
+        if hit:
+            if hit[1] > now:
+                _count_cache.move_to_end(key)
+                return hit[0]
+            del _count_cache[key]
+
+    total = query.order_by(None).count()
+    with _count_cache_lock:
+        _count_cache[key] = (total, now + COUNT_CACHE_TTL)
+        _count_cache.move_to_end(key)
+        while len(_count_cache) > COUNT_CACHE_MAX_ENTRIES:
+            _count_cache.popitem(last=False)
+    return total
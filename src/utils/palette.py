@@ -0,0 +1,127 @@
+"""
+Dominant-colour palettes and CIELAB bins for colour search.
+
+Palettes come from Pillow's median-cut quantizer (implemented in C) run on a
+64px reduction of the already decoded image. Colours are compared in CIELAB,
+where Euclidean distance (delta E 1976) tracks perceived difference; ~2 is
+just noticeable and ~20 is still "the same colour" for browsing.
+
+For indexing, Lab space is cut into LAB_BIN_SIZE cubes. A query only
+considers the bins whose cube intersects the sphere of the requested radius.
+"""
+import json
+import math
+from PIL import Image
+
+PALETTE_SIZE = 5
+SAMPLE_SIZE = 64
+LAB_BIN_SIZE = 10
+# L is 0..100; a and b stay within -128..127 for sRGB input
+A_B_OFFSET = 128
+A_B_BINS = 256 // LAB_BIN_SIZE + 1
+L_BINS = 100 // LAB_BIN_SIZE + 1
+
+# Shortcuts accepted by ?color= besides #RRGGBB
+COLOR_NAMES = {
+    'black': '#000000',
+    'dark': '#1c1c1c',
+    'gray': '#808080',
+    'white': '#ffffff',
+    'red': '#d32f2f',
+    'orange': '#f57c00',
+    'yellow': '#fbc02d',
+    'green': '#388e3c',
+    'teal': '#00897b',
+    'blue': '#1976d2',
+    'purple': '#7b1fa2',
+    'pink': '#e91e63',
+    'brown': '#6d4c41'
+}
+
+def extract_palette(img, size=PALETTE_SIZE):
+    """[(hex, weight)] of the dominant colours, heaviest first; weights sum to 1"""
+    small = img.convert('RGB')
+    small.thumbnail((SAMPLE_SIZE, SAMPLE_SIZE), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    quantized = small.quantize(colors=size, method=Image.Quantize.MEDIANCUT)
+    palette = quantized.getpalette()
+    colors = quantized.getcolors(size) or []
+    total = sum(count for count, _ in colors) or 1
+
+    result = []
+    for count, index in sorted(colors, reverse=True):
+        r, g, b = palette[index * 3:index * 3 + 3]
+        result.append((f'#{r:02x}{g:02x}{b:02x}', round(count / total, 4)))
+    return result
+
+def format_palette(palette):
+    """JSON stored in Wallpaper.palette: [{"color": "#rrggbb", "weight": 0.42}, ...]"""
+    return json.dumps([{'color': color, 'weight': weight} for color, weight in palette])
+
+def parse_color(value):
+    """(r, g, b) from '#RRGGBB', 'RRGGBB', '#RGB' or a COLOR_NAMES key; raises ValueError"""
+    text = COLOR_NAMES.get(value.strip().lower(), value.strip()).lstrip('#')
+    if len(text) == 3:
+        text = ''.join(c * 2 for c in text)
+    if len(text) != 6:
+        raise ValueError(f'Invalid color {value}')
+    return tuple(int(text[i:i + 2], 16) for i in (0, 2, 4))
+
+def _linear(channel):
+    c = channel / 255
+    return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+def _f(t):
+    return t ** (1 / 3) if t > 0.008856 else 7.787 * t + 16 / 116
+
+def rgb_to_lab(rgb):
+    """sRGB (0-255) to CIELAB under D65"""
+    r, g, b = (_linear(c) for c in rgb)
+    x = (0.4124 * r + 0.3576 * g + 0.1805 * b) / 0.95047
+    y = 0.2126 * r + 0.7152 * g + 0.0722 * b
+    z = (0.0193 * r + 0.1192 * g + 0.9505 * b) / 1.08883
+    fx, fy, fz = _f(x), _f(y), _f(z)
+    return (116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz))
+
+def _bin_coords(lab):
+    l, a, b = lab
+    return (
+        min(max(int(l // LAB_BIN_SIZE), 0), L_BINS - 1),
+        min(max(int((a + A_B_OFFSET) // LAB_BIN_SIZE), 0), A_B_BINS - 1),
+        min(max(int((b + A_B_OFFSET) // LAB_BIN_SIZE), 0), A_B_BINS - 1)
+    )
+
+def _bin_id(l_bin, a_bin, b_bin):
+    return (l_bin * A_B_BINS + a_bin) * A_B_BINS + b_bin
+
+def lab_bin(lab):
+    """Index of the Lab cube containing a colour"""
+    return _bin_id(*_bin_coords(lab))
+
+def _axis_gap(value, low, high):
+    # Distance from value to the interval [low, high) along one axis
+    if value < low:
+        return low - value
+    if value >= high:
+        return value - high
+    return 0.0
+
+def bins_within(lab, radius):
+    """Ids of every Lab cube that has a point within ``radius`` of lab"""
+    l, a, b = lab
+    shifted = (l, a + A_B_OFFSET, b + A_B_OFFSET)
+    limits = (L_BINS, A_B_BINS, A_B_BINS)
+    ranges = [
+        range(max(0, math.floor((v - radius) / LAB_BIN_SIZE)), min(n - 1, math.floor((v + radius) / LAB_BIN_SIZE)) + 1)
+        for v, n in zip(shifted, limits)
+    ]
+
+    bins = []
+    for l_bin in ranges[0]:
+        dl = _axis_gap(shifted[0], l_bin * LAB_BIN_SIZE, (l_bin + 1) * LAB_BIN_SIZE)
+        for a_bin in ranges[1]:
+            da = _axis_gap(shifted[1], a_bin * LAB_BIN_SIZE, (a_bin + 1) * LAB_BIN_SIZE)
+            for b_bin in ranges[2]:
+                db = _axis_gap(shifted[2], b_bin * LAB_BIN_SIZE, (b_bin + 1) * LAB_BIN_SIZE)
+                if dl * dl + da * da + db * db <= radius * radius:
+                    bins.append(_bin_id(l_bin, a_bin, b_bin))
+    return bins
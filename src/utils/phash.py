@@ -0,0 +1,111 @@
+"""
+Perceptual hashing and a multi-index hash table for Hamming-distance lookups.
+
+dHash compares neighbouring pixels of a 9x8 grayscale reduction, giving a
+64-bit hash that survives rescaling, recompression and small colour changes.
+Near-duplicates typically differ in at most a handful of bits; unrelated
+images sit around 32.
+"""
+from itertools import combinations
+from PIL import Image
+
+HASH_SIZE = 8  # 8x8 comparisons = 64 bits
+
+def dhash(img):
+    """64-bit difference hash of a PIL image"""
+    small = img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def format_hash(value):
+    """Fixed-width hex form stored in the database"""
+    return f'{value:016x}'
+
+def parse_hash(text):
+    return int(text, 16)
+
+CHUNKS = 4
+CHUNK_BITS = HASH_SIZE * HASH_SIZE // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+def _flip_masks(radius):
+    """Every CHUNK_BITS-wide mask with at most ``radius`` bits set"""
+    masks = []
+    for bits in range(radius + 1):
+        for positions in combinations(range(CHUNK_BITS), bits):
+            mask = 0
+            for position in positions:
+                mask |= 1 << position
+            masks.append(mask)
+    return masks
+
+class MultiIndexHash:
+    """Multi-index hash table over 64-bit hashes.
+
+    Each hash is split into CHUNKS 16-bit substrings, and each substring
+    position has its own dict of substring -> items. If two hashes are within
+    distance r, at least one substring pair is within r // CHUNKS of each
+    other (pigeonhole), so a search only probes the buckets for substrings
+    near the query's and verifies those few candidates. Up to r = 7 that is
+    17 probes per table regardless of how many hashes are indexed.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.tables = [{} for _ in range(CHUNKS)]
+        self._masks = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, item):
+        return item in self.values
+
+    @staticmethod
+    def _chunks(value):
+        return [(value >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(CHUNKS)]
+
+    def add(self, item, value):
+        if item in self.values:
+            self.remove(item)
+        self.values[item] = value
+        for table, chunk in zip(self.tables, self._chunks(value)):
+            table.setdefault(chunk, set()).add(item)
+
+    def remove(self, item):
+        value = self.values.pop(item, None)
+        if value is None:
+            return
+        for table, chunk in zip(self.tables, self._chunks(value)):
+            bucket = table.get(chunk)
+            if bucket is not None:
+                bucket.discard(item)
+                if not bucket:
+                    del table[chunk]
+
+    def search(self, value, max_distance):
+        """(distance, item) for every item within max_distance of value, nearest first"""
+        radius = max_distance // CHUNKS
+        masks = self._masks.get(radius)
+        if masks is None:
+            masks = self._masks[radius] = _flip_masks(radius)
+
+        candidates = set()
+        for table, chunk in zip(self.tables, self._chunks(value)):
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if bucket:
+                    candidates.update(bucket)
+
+        results = []
+        for item in candidates:
+            distance = (self.values[item] ^ value).bit_count()
+            if distance <= max_distance:
+                results.append((distance, item))
+        results.sort()
+        return results
@@ -0,0 +1,147 @@
+"""
+Bounded on-disk cache of resized wallpaper renditions.
+
+Renditions live at <upload_folder>/renditions/<stored name>/<width>.<format>,
+keyed by the original's content-addressed name so wallpapers sharing a blob
+share its renditions, and are generated on first request (or eagerly after upload). When the cache
+grows past RENDITION_CACHE_MAX_BYTES the least recently served files are
+evicted; a file's mtime is bumped each time it is served.
+"""
+import os
+import shutil
+import threading
+from PIL import features
+from src.utils.file_handler import create_rendition
+from src.utils.storage import storage
+
+RENDITION_WIDTHS = (320, 640, 1080, 1440, 1920, 2560)
+RENDITION_FORMATS = ('jpg', 'webp', 'avif')
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2GB
+
+def available_formats():
+    """Whitelisted formats the installed Pillow can encode"""
+    return tuple(f for f in RENDITION_FORMATS if f == 'jpg' or features.check(f))
+
+class RenditionCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.root = None
+        self.upload_folder = None
+        self.eager = ()
+        self.formats = ()
+        self._size = None  # bytes on disk, computed lazily
+        self._lock = threading.Lock()
+        self._key_locks = {}  # (filename, width, format) -> [lock, requests holding or waiting on it]
+
+    def init_app(self, app, upload_folder):
+        """Configure from RENDITION_* settings"""
+        self.upload_folder = upload_folder
+        self.root = os.path.join(upload_folder, 'renditions')
+        self.max_bytes = app.config.get('RENDITION_CACHE_MAX_BYTES', self.max_bytes)
+        self.formats = available_formats()
+        # e.g. [(640, 'webp'), (1080, 'webp')]
+        self.eager = tuple(app.config.get('RENDITIONS_EAGER', ()))
+        os.makedirs(self.root, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.root is not None
+
+    def is_allowed(self, width, fmt):
+        return width in RENDITION_WIDTHS and fmt in self.formats
+
+    def _directory(self, filename):
+        return os.path.join(self.root, filename.rsplit('.', 1)[0])
+
+    def path_for(self, filename, width, fmt):
+        return os.path.join(self._directory(filename), f'{width}.{fmt}')
+
+    def get(self, filename, width, fmt):
+        """Return the path of a rendition of the stored original ``filename``, generating it on a miss"""
+        path = self.path_for(filename, width, fmt)
+        if os.path.exists(path):
+            self._touch(path)
+            return path
+
+        # One generator per rendition; concurrent requests wait for it
+        key = (filename, width, fmt)
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    size = create_rendition(storage.ensure_local(filename), path, width, fmt)
+                    self._account(size)
+        finally:
+            # The last request out removes the lock, so every waiter shared the same one
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+        return path
+
+    def eager_jobs(self, filename):
+        """(path, width, format) for each RENDITIONS_EAGER entry"""
+        jobs = []
+        for width, fmt in self.eager:
+            if self.is_allowed(width, fmt):
+                path = self.path_for(filename, width, fmt)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                jobs.append((path, width, fmt))
+        return jobs
+
+    def record(self, size):
+        """Account for a rendition written outside get(), evicting if over budget"""
+        self._account(size)
+
+    def purge(self, filename):
+        """Delete every rendition of a stored original"""
+        directory = self._directory(filename)
+        if os.path.isdir(directory):
+            shutil.rmtree(directory, ignore_errors=True)
+            with self._lock:
+                self._size = None
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _files(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _account(self, added):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._files())
+            else:
+                self._size += added
+            if self._size <= self.max_bytes:
+                return
+            self._evict()
+
+    def _evict(self):
+        # Called with self._lock held; trim to 90% of the budget to avoid evicting on every write
+        target = self.max_bytes * 0.9
+        for path, size, _ in sorted(self._files(), key=lambda f: f[2]):
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+            except OSError:
+                pass
+
+rendition_cache = RenditionCache()
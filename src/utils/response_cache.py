@@ -0,0 +1,84 @@
+"""
+In-process cache for catalog read endpoints with strong ETags.
+
+Responses are cached per endpoint and normalized query string. Writes to the
+catalog call invalidate_catalog(), which clears this worker's cache; the TTL
+bounds how long other gunicorn workers can serve an entry after a change.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, make_response
+
+DEFAULT_TTL = 30  # seconds
+MAX_ENTRIES = 1024
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_generation = 0  # bumped on invalidation so in-flight renders of stale data are not stored
+
+def cache_key(endpoint, args):
+    """Normalize query parameter order so equivalent URLs share an entry"""
+    # Empty values are kept: an empty cursor (first keyset page) is not the same request as no cursor
+    items = sorted((k, v) for k in args for v in args.getlist(k))
+    return endpoint, tuple(items)
+
+def invalidate_catalog():
+    """Drop every cached catalog response"""
+    global _generation
+    with _lock:
+        _generation += 1
+        _cache.clear()
+
+def _get(key):
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        if entry['expires'] <= time.monotonic():
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        return entry
+
+def _put(key, entry, generation):
+    with _lock:
+        if generation != _generation:
+            return
+        _cache[key] = entry
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+def _build_response(entry):
+    response = make_response(entry['body'], 200)
+    response.mimetype = entry['mimetype']
+    response.set_etag(entry['etag'])
+    response.headers['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    return response.make_conditional(request)
+
+def cached_response(ttl=DEFAULT_TTL):
+    """Cache successful responses of a GET view and answer If-None-Match with 304"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = cache_key(request.endpoint, request.args)
+            entry = _get(key)
+            if entry is None:
+                generation = _generation
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                entry = {
+                    'body': body,
+                    'mimetype': response.mimetype,
+                    'etag': hashlib.sha256(body).hexdigest()[:32],
+                    'expires': time.monotonic() + ttl
+                }
+                _put(key, entry, generation)
+            return _build_response(entry)
+        return wrapper
+    return decorator
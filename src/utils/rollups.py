@@ -0,0 +1,503 @@
+"""
+Incremental hourly and daily rollups of AnalyticsEvent for the analytics endpoints.
+
+Each rollup row counts the events of one type in one period (UTC hour or
+UTC day) for one slice of the catalog:
+
+    all        - every event (dimension_key '')
+    category   - events on wallpapers in a category
+    wallpaper  - events on one wallpaper (key is its id)
+    premium    - events on premium ('1') or free ('0') wallpapers
+
+event_type '*' totals every type for the all and category slices.
+
+Distinct users are not additive, so alongside the counts the job keeps a
+HyperLogLog sketch per day for the all and category slices, of actors
+(signed-in users, else anonymous sessions) and of sessions. A day's daily
+'*' rows carry its unique_actors estimate; DAU/WAU/MAU for any window is
+the merge of the window's daily sketches (see utils/hll.py for the error
+bound, ~1.6% standard error).
+
+The job keeps a watermark, the id of the last event merged. Each run reads
+the events after it in id order, in batches, and adds their counts to the
+rollup rows; the watermark moves forward in the same transaction as the
+counts, so a batch is merged exactly once even if a run dies halfway or two
+workers run at the same time. Ids are allocated before commit, so on
+Postgres a lower id can become visible after a higher one; a run therefore
+stops at the first event received less than SAFE_LAG ago and leaves it and
+everything after it to the next run. A transaction held open for longer
+than SAFE_LAG can still be passed over; rebuild to recover its events.
+
+Events arrive late (clients retry, queues back up): a period accepts events
+received up to LATE_WINDOW after it ends. Events received after that are
+skipped and reported as late, however long the job itself was stalled; a
+rebuild re-aggregates everything and is the way to repair them.
+Events moved to the cold archive (utils/event_archive.py) are always behind
+the watermark already, and a rebuild reads them back from there.
+Run with: python src/utils/rollups.py [--rebuild]
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import func, case, select, bindparam
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from src.models.user import db
+from src.models.wallpaper import Wallpaper
+from src.models.analytics import AnalyticsEvent
+from src.models.rollup import AnalyticsRollupHourly, AnalyticsRollupDaily, AnalyticsSketch, RollupState
+from src.utils.hll import HyperLogLog, relative_error
+from src.utils.event_archive import event_archive
+
+ALL_EVENTS = '*'
+GRAINS = {
+    'hour': (AnalyticsRollupHourly, timedelta(hours=1)),
+    'day': (AnalyticsRollupDaily, timedelta(days=1))
+}
+STATE_NAME = 'analytics_event'
+DEFAULT_LATE_WINDOW = timedelta(hours=48)
+DEFAULT_SAFE_LAG = timedelta(seconds=60)
+DEFAULT_BATCH_SIZE = 10000
+# How long a rebuild waits for a running archive job (seconds)
+ARCHIVE_LOCK_WAIT = 600
+ARCHIVED_COLUMNS = ('id', 'created_at', 'event_type', 'wallpaper_id', 'user_id', 'session_id')
+# An archived event shaped like a row of the run_rollups batch query
+_ArchivedEvent = namedtuple('_ArchivedEvent', ARCHIVED_COLUMNS + ('category', 'premium'))
+
+def period_start(grain, moment):
+    """Start of the hour or day containing moment"""
+    if grain == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _sketch_values(user_id, session_id):
+    """(metric, value) pairs an event adds to its day's sketches"""
+    values = []
+    # Signed-in users count once however many sessions they use; anonymous visitors count per session
+    if user_id is not None:
+        values.append(('actors', f'u:{user_id}'))
+    elif session_id:
+        values.append(('actors', f's:{session_id}'))
+    if session_id:
+        values.append(('sessions', session_id))
+    return values
+
+def _slices(event_type, wallpaper_id, category, premium):
+    """(dimension, key, event_type) rows an event counts towards"""
+    slices = [('all', '', event_type), ('all', '', ALL_EVENTS)]
+    if wallpaper_id is not None:
+        slices.append(('wallpaper', str(wallpaper_id), event_type))
+    # Events on deleted wallpapers keep their all/wallpaper counts but drop out of catalog slices
+    if category is not None:
+        slices.append(('category', category, event_type))
+        slices.append(('category', category, ALL_EVENTS))
+        slices.append(('premium', '1' if premium else '0', event_type))
+    return slices
+
+def _claim(old, new):
+    """Move the watermark from old to new; False if another run got there first"""
+    table = RollupState.__table__
+    result = db.session.execute(
+        table.update()
+        .where(table.c.name == STATE_NAME, table.c.last_event_id == old)
+        .values(last_event_id=new, updated_at=datetime.utcnow())
+    )
+    return result.rowcount == 1
+
+def _merge(model, deltas, now):
+    """Add {(dimension, key, event_type, period_start): n} onto the rollup rows"""
+    table = model.__table__
+    existing = {
+        tuple(row) for row in db.session.execute(
+            select(table.c.dimension, table.c.dimension_key, table.c.event_type, table.c.period_start)
+            .where(table.c.period_start.in_({key[3] for key in deltas}))
+        )
+    }
+    updates, inserts = [], []
+    for (dimension, key, event_type, start), n in deltas.items():
+        if (dimension, key, event_type, start) in existing:
+            updates.append({'b_dimension': dimension, 'b_key': key, 'b_event_type': event_type, 'b_start': start, 'b_delta': n})
+        else:
+            inserts.append({
+                'dimension': dimension, 'dimension_key': key, 'event_type': event_type,
+                'period_start': start, 'count': n, 'updated_at': now
+            })
+    if updates:
+        db.session.execute(
+            table.update()
+            .where(
+                table.c.dimension == bindparam('b_dimension'),
+                table.c.dimension_key == bindparam('b_key'),
+                table.c.event_type == bindparam('b_event_type'),
+                table.c.period_start == bindparam('b_start')
+            )
+            .values(count=table.c.count + bindparam('b_delta'), updated_at=now),
+            updates
+        )
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+
+def _merge_sketches(sketches, now):
+    """Fold {(metric, dimension, key, day): HyperLogLog} into the stored sketches and refresh unique_actors"""
+    table = AnalyticsSketch.__table__
+    stored = {
+        (row.metric, row.dimension, row.dimension_key, row.day): row.registers
+        for row in db.session.execute(select(table).where(table.c.day.in_({key[3] for key in sketches})))
+    }
+    updates, inserts = [], []
+    for (metric, dimension, key, day), sketch in sketches.items():
+        registers = stored.get((metric, dimension, key, day))
+        if registers is not None:
+            sketch.merge(HyperLogLog.from_bytes(registers))
+            updates.append({
+                'b_metric': metric, 'b_dimension': dimension, 'b_key': key, 'b_day': day,
+                'b_registers': sketch.to_bytes()
+            })
+        else:
+            inserts.append({
+                'metric': metric, 'dimension': dimension, 'dimension_key': key, 'day': day,
+                'registers': sketch.to_bytes(), 'updated_at': now
+            })
+    if updates:
+        db.session.execute(
+            table.update()
+            .where(
+                table.c.metric == bindparam('b_metric'),
+                table.c.dimension == bindparam('b_dimension'),
+                table.c.dimension_key == bindparam('b_key'),
+                table.c.day == bindparam('b_day')
+            )
+            .values(registers=bindparam('b_registers'), updated_at=now),
+            updates
+        )
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+
+    daily = AnalyticsRollupDaily.__table__
+    estimates = [
+        {'b_dimension': dimension, 'b_key': key, 'b_day': day, 'b_actors': sketch.count()}
+        for (metric, dimension, key, day), sketch in sketches.items() if metric == 'actors'
+    ]
+    if estimates:
+        db.session.execute(
+            daily.update()
+            .where(
+                daily.c.dimension == bindparam('b_dimension'),
+                daily.c.dimension_key == bindparam('b_key'),
+                daily.c.event_type == ALL_EVENTS,
+                daily.c.period_start == bindparam('b_day')
+            )
+            .values(unique_actors=bindparam('b_actors')),
+            estimates
+        )
+
+def _reset(rebuild_through):
+    # Claim the state row before deleting so a concurrent batch either commits first
+    # (and its rows are deleted) or fails its watermark check afterwards
+    table = RollupState.__table__
+    values = {'last_event_id': 0, 'rebuild_through': rebuild_through, 'updated_at': datetime.utcnow()}
+    if not db.session.execute(table.update().where(table.c.name == STATE_NAME).values(values)).rowcount:
+        db.session.execute(table.insert().values(name=STATE_NAME, **values))
+    for model, _ in GRAINS.values():
+        db.session.execute(model.__table__.delete())
+    db.session.execute(AnalyticsSketch.__table__.delete())
+    db.session.commit()
+
+def _aggregate(events, now, late_window=None, rebuild_through=0):
+    """Merge a batch of events into the rollups and sketches, uncommitted; returns how many were late.
+
+    Events after rebuild_through that were received more than late_window
+    after their period ended are skipped; without a late_window every event
+    is merged.
+    """
+    deltas = {grain: defaultdict(int) for grain in GRAINS}
+    sketches = defaultdict(HyperLogLog)
+    late_events = 0
+    for event in events:
+        if event.created_at is None:
+            continue
+        late = False
+        # Rows written before received_at existed fall back to their event time
+        received_at = (event.received_at or event.created_at) if late_window is not None else None
+        for grain, (_, step) in GRAINS.items():
+            start = period_start(grain, event.created_at)
+            if received_at is not None and start + step + late_window <= received_at and event.id > rebuild_through:
+                late = True
+                continue
+            for dimension, key, event_type in _slices(event.event_type, event.wallpaper_id, event.category, event.premium):
+                deltas[grain][(dimension, key, event_type, start)] += 1
+            if grain == 'day':
+                slices = [('all', '')] + ([('category', event.category)] if event.category is not None else [])
+                for metric, value in _sketch_values(event.user_id, event.session_id):
+                    for dimension, key in slices:
+                        sketches[(metric, dimension, key, start)].add(value)
+        late_events += late
+    for grain, (model, _) in GRAINS.items():
+        if deltas[grain]:
+            _merge(model, deltas[grain], now)
+    if sketches:
+        _merge_sketches(sketches, now)
+    return late_events
+
+def _merge_archive():
+    """Merge every archived event into the freshly reset rollups; returns how many"""
+    merged = 0
+    for rows in event_archive.scan(ARCHIVED_COLUMNS):
+        wallpaper_ids = list({row['wallpaper_id'] for row in rows if row['wallpaper_id'] is not None})
+        wallpapers = {}
+        for i in range(0, len(wallpaper_ids), 500):
+            for wallpaper_id, category, premium in db.session.query(Wallpaper.id, Wallpaper.category, Wallpaper.premium).filter(
+                Wallpaper.id.in_(wallpaper_ids[i:i + 500])
+            ):
+                wallpapers[wallpaper_id] = {'category': category, 'premium': premium}
+        # Events on deleted wallpapers count like the outer join in run_rollups does
+        missing = {'category': None, 'premium': None}
+        events = [_ArchivedEvent(**row, **wallpapers.get(row['wallpaper_id'], missing)) for row in rows]
+        _aggregate(events, datetime.utcnow())
+        # Only counted while the archive job is still kept from moving more events in
+        event_archive.renew()
+        db.session.commit()
+        merged += len(events)
+    return merged
+
+def run_rollups(late_window=DEFAULT_LATE_WINDOW, batch_size=DEFAULT_BATCH_SIZE, rebuild=False, safe_lag=DEFAULT_SAFE_LAG):
+    """Merge the events after the watermark and older than safe_lag into the rollups; returns run statistics.
+
+    With rebuild=True (or when no watermark exists yet) every rollup row is
+    dropped and all stored events, archived ones included, are merged again,
+    ignoring the late window.
+    """
+    started = time.perf_counter()
+    state = db.session.get(RollupState, STATE_NAME)
+    archived_events = 0
+    if rebuild or state is None:
+        # Holding the archive lease keeps the archive job from moving events
+        # out of analytics_event while they are being re-read
+        if not event_archive.lock(timeout=ARCHIVE_LOCK_WAIT):
+            raise RuntimeError('The event archive job is running; rebuild the rollups once it finishes')
+        try:
+            _reset(db.session.query(func.max(AnalyticsEvent.id)).scalar() or 0)
+            archived_events = _merge_archive()
+        finally:
+            event_archive.unlock()
+        state = db.session.get(RollupState, STATE_NAME)
+        rebuild = True
+    watermark, rebuild_through = state.last_event_id, state.rebuild_through or 0
+    db.session.commit()
+
+    stats = {'events': 0, 'archived_events': archived_events, 'late_events': 0, 'batches': 0, 'rebuild': rebuild, 'conflict': False}
+    settled_before = datetime.utcnow() - safe_lag
+    while True:
+        batch = (
+            db.session.query(
+                AnalyticsEvent.id, AnalyticsEvent.created_at, AnalyticsEvent.received_at, AnalyticsEvent.event_type,
+                AnalyticsEvent.wallpaper_id, AnalyticsEvent.user_id, AnalyticsEvent.session_id,
+                Wallpaper.category, Wallpaper.premium
+            )
+            .outerjoin(Wallpaper, Wallpaper.id == AnalyticsEvent.wallpaper_id)
+            .filter(AnalyticsEvent.id > watermark)
+            .order_by(AnalyticsEvent.id)
+            .limit(batch_size)
+            .all()
+        )
+        # Stop at the first recent event: ids below it may still be uncommitted
+        settled = next((i for i, event in enumerate(batch) if event.received_at is not None and event.received_at >= settled_before), len(batch))
+        caught_up = settled < len(batch)
+        batch = batch[:settled]
+        if not batch:
+            break
+
+        if not _claim(watermark, batch[-1].id):
+            db.session.rollback()
+            stats['conflict'] = True
+            break
+
+        stats['late_events'] += _aggregate(batch, datetime.utcnow(), late_window, rebuild_through)
+        db.session.commit()
+
+        watermark = batch[-1].id
+        stats['events'] += len(batch)
+        stats['batches'] += 1
+        if caught_up:
+            break
+
+    stats['watermark'] = watermark
+    stats['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return stats
+
+def rebuild_rollups():
+    """Drop every rollup row and re-aggregate all stored events"""
+    return run_rollups(rebuild=True)
+
+def schedule_rebuild():
+    """Rebuild now, or if the archive job keeps the rollups busy, leave it to the next scheduled run"""
+    try:
+        return rebuild_rollups()
+    except RuntimeError as e:
+        # Without a watermark the next run_rollups() rebuilds
+        db.session.rollback()
+        db.session.execute(RollupState.__table__.delete().where(RollupState.__table__.c.name == STATE_NAME))
+        db.session.commit()
+        print(f"Rollup rebuild deferred to the scheduler: {e}")
+        return None
+
+def rollup_status():
+    """Watermark and how many stored events are still waiting to be merged"""
+    state = db.session.get(RollupState, STATE_NAME)
+    latest = db.session.query(func.max(AnalyticsEvent.id)).scalar() or 0
+    watermark = state.last_event_id if state else 0
+    return {
+        'watermark': watermark,
+        'latest_event_id': latest,
+        'pending_events': max(latest - watermark, 0),
+        'updated_at': state.updated_at.isoformat() if state and state.updated_at else None
+    }
+
+class RollupScheduler:
+    """Runs the incremental rollup every ANALYTICS_ROLLUP_INTERVAL seconds in a background thread,
+    and the event archive job every ANALYTICS_ARCHIVE_INTERVAL seconds after a rollup"""
+
+    def __init__(self, interval=60.0, late_window=DEFAULT_LATE_WINDOW, batch_size=DEFAULT_BATCH_SIZE, archive_interval=3600.0,
+                 safe_lag=DEFAULT_SAFE_LAG):
+        self.interval = interval
+        self.late_window = late_window
+        self.safe_lag = safe_lag
+        self.batch_size = batch_size
+        self.archive_interval = archive_interval
+        self.app = None
+        self.last_run = None
+        self.last_archive = None
+        self.last_error = None
+        self._archived_at = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        """Read ANALYTICS_ROLLUP_* settings and start the scheduler; an interval of 0 disables it"""
+        self.app = app
+        self.interval = app.config.get('ANALYTICS_ROLLUP_INTERVAL', self.interval)
+        self.late_window = timedelta(hours=app.config.get('ANALYTICS_ROLLUP_LATE_WINDOW_HOURS', self.late_window.total_seconds() / 3600))
+        self.safe_lag = timedelta(seconds=app.config.get('ANALYTICS_ROLLUP_SAFE_LAG_SECONDS', self.safe_lag.total_seconds()))
+        self.batch_size = app.config.get('ANALYTICS_ROLLUP_BATCH_SIZE', self.batch_size)
+        self.archive_interval = app.config.get('ANALYTICS_ARCHIVE_INTERVAL', self.archive_interval)
+        if self.interval and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='analytics-rollup', daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def run_once(self):
+        with self.app.app_context():
+            try:
+                self.last_run = run_rollups(self.late_window, self.batch_size, safe_lag=self.safe_lag)
+                self.last_run['finished_at'] = datetime.utcnow().isoformat()
+                self.last_error = None
+                if self.archive_interval and event_archive.archive_after_days is not None and (
+                    self._archived_at is None or time.monotonic() - self._archived_at >= self.archive_interval
+                ):
+                    self._archived_at = time.monotonic()
+                    self.last_archive = event_archive.archive()
+                    self.last_archive['finished_at'] = datetime.utcnow().isoformat()
+            except Exception as e:
+                db.session.rollback()
+                self.last_error = str(e)
+                print(f"Error rolling up analytics events: {e}")
+        return self.last_run
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.run_once()
+
+    def shutdown(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+rollup_scheduler = RollupScheduler()
+
+def distinct_count(metric, end_day, days, dimension='all', key=''):
+    """Estimated distinct actors or sessions over the days ending with end_day (inclusive)"""
+    start = end_day - timedelta(days=days - 1)
+    rows = db.session.query(AnalyticsSketch.registers).filter(
+        AnalyticsSketch.metric == metric,
+        AnalyticsSketch.dimension == dimension,
+        AnalyticsSketch.dimension_key == key,
+        AnalyticsSketch.day >= start,
+        AnalyticsSketch.day <= end_day
+    )
+    return HyperLogLog.union(HyperLogLog.from_bytes(registers) for (registers,) in rows).count()
+
+def active_users(day, dimension='all', key=''):
+    """DAU, WAU and MAU (trailing 1, 7 and 30 days ending with day) plus the same for sessions"""
+    windows = (('daily', 1), ('weekly', 7), ('monthly', 30))
+    return {
+        'dau': distinct_count('actors', day, 1, dimension, key),
+        'wau': distinct_count('actors', day, 7, dimension, key),
+        'mau': distinct_count('actors', day, 30, dimension, key),
+        'sessions': {name: distinct_count('sessions', day, days, dimension, key) for name, days in windows},
+        'relative_error': round(relative_error(), 4)
+    }
+
+def series(event_type, start, periods, grain='day', dimension='all', key=''):
+    """[(period_start, count, unique_actors)] for consecutive periods from start; missing periods are zero"""
+    model, step = GRAINS[grain]
+    rows = {
+        row.period_start: row
+        for row in db.session.query(model.period_start, model.count, model.unique_actors).filter(
+            model.dimension == dimension,
+            model.dimension_key == key,
+            model.event_type == event_type,
+            model.period_start >= start,
+            model.period_start < start + step * periods
+        )
+    }
+    result = []
+    for i in range(periods):
+        moment = start + step * i
+        row = rows.get(moment)
+        result.append((moment, row.count if row else 0, (row.unique_actors or 0) if row else 0))
+    return result
+
+def totals_by_key(dimension, event_types, start, end, sort_by=None, limit=None, keys=None):
+    """[(dimension_key, {event_type: count})] summed over the days in [start, end)"""
+    model = AnalyticsRollupDaily
+    sums = [
+        func.coalesce(func.sum(case((model.event_type == event_type, model.count), else_=0)), 0)
+        for event_type in event_types
+    ]
+    query = (
+        db.session.query(model.dimension_key, *sums)
+        .filter(
+            model.dimension == dimension,
+            model.event_type.in_(event_types),
+            model.period_start >= start,
+            model.period_start < end
+        )
+        .group_by(model.dimension_key)
+    )
+    if keys is not None:
+        query = query.filter(model.dimension_key.in_(keys))
+    if sort_by is not None:
+        query = query.order_by(sums[event_types.index(sort_by)].desc(), model.dimension_key)
+    if limit is not None:
+        query = query.limit(limit)
+    return [(row[0], dict(zip(event_types, row[1:]))) for row in query]
+
+if __name__ == '__main__':
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), '..', 'database', 'app.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        stats = run_rollups(rebuild='--rebuild' in sys.argv[1:])
+        print(f"Merged {stats['events']} events ({stats['late_events']} late) up to event {stats['watermark']}")
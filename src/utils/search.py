@@ -0,0 +1,116 @@
+import re
+from sqlalchemy import text, inspect, Integer, Float
+
+# SQLite: external-content FTS5 table over wallpaper, kept in sync by triggers
+SQLITE_FTS_TABLE = """
+CREATE VIRTUAL TABLE wallpaper_fts USING fts5(
+    title, description, tags,
+    content='wallpaper', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+)
+"""
+
+SQLITE_FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS wallpaper_fts_ai AFTER INSERT ON wallpaper BEGIN
+        INSERT INTO wallpaper_fts(rowid, title, description, tags)
+        VALUES (new.id, new.title, new.description, new.tags);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS wallpaper_fts_ad AFTER DELETE ON wallpaper BEGIN
+        INSERT INTO wallpaper_fts(wallpaper_fts, rowid, title, description, tags)
+        VALUES ('delete', old.id, old.title, old.description, old.tags);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS wallpaper_fts_au AFTER UPDATE OF title, description, tags ON wallpaper BEGIN
+        INSERT INTO wallpaper_fts(wallpaper_fts, rowid, title, description, tags)
+        VALUES ('delete', old.id, old.title, old.description, old.tags);
+        INSERT INTO wallpaper_fts(rowid, title, description, tags)
+        VALUES (new.id, new.title, new.description, new.tags);
+    END
+    """
+]
+
+# Postgres: stored generated tsvector (maintained by the database itself) plus a GIN index
+POSTGRES_SEARCH_DDL = [
+    """
+    ALTER TABLE wallpaper ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(tags, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_wallpaper_search_vector ON wallpaper USING GIN (search_vector)"
+]
+
+# Column weights for bm25(): title, description, tags
+SQLITE_RANK = "bm25(wallpaper_fts, 10.0, 1.0, 5.0)"
+
+def ensure_search_index(engine):
+    """Create the full-text index for the engine's dialect if it is missing"""
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        if dialect == 'sqlite':
+            if not inspect(conn).has_table('wallpaper_fts'):
+                conn.execute(text(SQLITE_FTS_TABLE))
+                conn.execute(text("INSERT INTO wallpaper_fts(wallpaper_fts) VALUES ('rebuild')"))
+            for trigger in SQLITE_FTS_TRIGGERS:
+                conn.execute(text(trigger))
+        elif dialect == 'postgresql':
+            for statement in POSTGRES_SEARCH_DDL:
+                conn.execute(text(statement))
+
+def search_terms(search):
+    """Split user input into lowercase word tokens"""
+    return re.findall(r'\w+', search.lower())
+
+def search_subquery(dialect, search):
+    """Build a (wallpaper_id, rank) subquery for the search string.
+
+    Every term must match and is treated as a prefix. Lower rank is more
+    relevant on both dialects. Returns None when the dialect has no
+    full-text index.
+    """
+    terms = search_terms(search)
+    if not terms:
+        return None
+
+    if dialect == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        stmt = text(
+            f"SELECT rowid AS wallpaper_id, {SQLITE_RANK} AS rank "
+            "FROM wallpaper_fts WHERE wallpaper_fts MATCH :match"
+        ).bindparams(match=match)
+    elif dialect == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        stmt = text(
+            # float8 so a rank carried in a pagination cursor compares equal to the recomputed one
+            "SELECT id AS wallpaper_id, -(ts_rank(search_vector, q)::float8) AS rank "
+            "FROM wallpaper, to_tsquery('simple', :tsquery) AS q "
+            "WHERE search_vector @@ q"
+        ).bindparams(tsquery=tsquery)
+    else:
+        return None
+
+    return stmt.columns(wallpaper_id=Integer, rank=Float).subquery('search')
+
+def apply_search(query, model, dialect, search):
+    """Filter a wallpaper query by full-text search.
+
+    Returns the filtered query and the rank column to order by, or None
+    for the rank when falling back to LIKE matching.
+    """
+    subquery = search_subquery(dialect, search)
+    if subquery is None:
+        return query.filter(
+            model.title.contains(search) |
+            model.description.contains(search) |
+            model.tags.contains(search)
+        ), None
+
+    query = query.join(subquery, subquery.c.wallpaper_id == model.id)
+    return query, subquery.c.rank
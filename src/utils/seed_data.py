@@ -13,6 +13,8 @@ from src.models.user import db, User
 from src.models.wallpaper import Wallpaper
 from src.models.report import Report
 from src.models.analytics import AnalyticsEvent, AdPerformance
+from src.utils.tags import sync_wallpaper_tags
+from src.utils.dimensions import set_wallpaper_resolution
 
 def create_sample_users():
     """Create sample users"""
@@ -175,7 +177,6 @@ def create_sample_wallpapers(users):
             thumbnail_filename=f'thumb_sample_{i+1}.jpg',
             category=wallpaper_data['category'],
             tags=wallpaper_data['tags'],
-            resolution=wallpaper_data['resolution'],
             file_size=wallpaper_data['file_size'],
             downloads=random.randint(100, 2000),
             views=random.randint(500, 5000),
@@ -186,6 +187,8 @@ def create_sample_wallpapers(users):
             uploaded_by=random.choice(users).id,
             created_at=datetime.utcnow() - timedelta(days=random.randint(1, 30))
         )
+        set_wallpaper_resolution(wallpaper, wallpaper_data['resolution'])
+        sync_wallpaper_tags(wallpaper)
         db.session.add(wallpaper)
         created_wallpapers.append(wallpaper)
     
@@ -0,0 +1,60 @@
+"""
+Projection queries and row serializers for read-only list endpoints.
+
+Each *_list_query selects exactly the columns its serializer reads, with the
+related usernames/titles joined in, so a page of N rows costs one SELECT
+instead of 1 + N lazy loads per relationship. The serializers return the same
+shape as the corresponding model's to_dict().
+"""
+from src.models.user import db, User
+from src.models.wallpaper import Wallpaper
+
+WALLPAPER_LIST_COLUMNS = (
+    Wallpaper.id, Wallpaper.title, Wallpaper.description, Wallpaper.filename,
+    Wallpaper.thumbnail_filename, Wallpaper.category, Wallpaper.tags, Wallpaper.resolution,
+    Wallpaper.width, Wallpaper.height, Wallpaper.aspect_ratio, Wallpaper.size_class,
+    Wallpaper.file_size, Wallpaper.downloads, Wallpaper.views, Wallpaper.likes,
+    Wallpaper.status, Wallpaper.featured, Wallpaper.premium, Wallpaper.processing_status, Wallpaper.palette, Wallpaper.uploaded_by,
+    Wallpaper.created_at, Wallpaper.updated_at
+)
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+def wallpaper_list_query():
+    """Query of wallpaper columns plus the uploader's username"""
+    return (
+        db.session.query(*WALLPAPER_LIST_COLUMNS, User.username.label('uploader'))
+        .select_from(Wallpaper)
+        .outerjoin(User, User.id == Wallpaper.uploaded_by)
+    )
+
+def serialize_wallpaper_row(row):
+    """Serialize a row from wallpaper_list_query() like Wallpaper.to_dict()"""
+    return {
+        'id': row.id,
+        'title': row.title,
+        'description': row.description,
+        'filename': row.filename,
+        'thumbnail_filename': row.thumbnail_filename,
+        'category': row.category,
+        'tags': row.tags,
+        'resolution': row.resolution,
+        'width': row.width,
+        'height': row.height,
+        'aspect_ratio': row.aspect_ratio,
+        'size_class': row.size_class,
+        'file_size': row.file_size,
+        'downloads': row.downloads,
+        'views': row.views,
+        'likes': row.likes,
+        'status': row.status,
+        'featured': row.featured,
+        'premium': row.premium,
+        'processing_status': row.processing_status,
+        'palette': row.palette,
+        'uploaded_by': row.uploaded_by,
+        'uploader': row.uploader,
+        'created_at': _isoformat(row.created_at),
+        'updated_at': _isoformat(row.updated_at)
+    }
@@ -0,0 +1,153 @@
+"""
+In-memory near-duplicate index over Wallpaper.phash.
+
+Each worker builds its MultiIndexHash lazily from the database on first use.
+Before a search it catches up on rows inserted by other workers (id above the
+highest id it has seen), at most once every PHASH_CATCH_UP_INTERVAL seconds.
+Uploads whose hash the image worker has not set yet are remembered by id and
+re-read until they are hashed, fail or are deleted, so one stuck upload does
+not hold the others back. Hashes set on this worker are added directly.
+Deletions elsewhere are not tracked here; callers re-read matching rows,
+which drops wallpapers that no longer exist.
+"""
+import os
+import sys
+import threading
+import time
+from sqlalchemy import or_
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from src.models.user import db
+from src.models.wallpaper import Wallpaper
+from src.models.blob import ImageBlob
+from src.utils.phash import MultiIndexHash, parse_hash, format_hash
+from src.utils.file_handler import compute_phash
+from src.utils.storage import storage
+
+DEFAULT_MAX_DISTANCE = 6
+# Largest radius a caller may ask for; the probes per table grow combinatorially with it
+MAX_SEARCH_DISTANCE = 16
+# Seconds between catch-up queries; a search in between uses the index as it is
+CATCH_UP_INTERVAL = 1.0
+
+class SimilarityIndex:
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, catch_up_interval=CATCH_UP_INTERVAL):
+        self.max_distance = max_distance
+        self.catch_up_interval = catch_up_interval
+        self._index = None
+        self._max_id = 0
+        self._pending = set()
+        self._caught_up_at = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Read PHASH_MAX_DISTANCE (default Hamming radius for near-duplicates) and PHASH_CATCH_UP_INTERVAL"""
+        self.max_distance = app.config.get('PHASH_MAX_DISTANCE', self.max_distance)
+        self.catch_up_interval = app.config.get('PHASH_CATCH_UP_INTERVAL', self.catch_up_interval)
+
+    def _catch_up(self):
+        # Called with self._lock held
+        if self._index is None:
+            self._index = MultiIndexHash()
+            self._max_id = 0
+            self._pending = set()
+            self._caught_up_at = None
+        now = time.monotonic()
+        if self._caught_up_at is not None and now - self._caught_up_at < self.catch_up_interval:
+            return
+        self._caught_up_at = now
+        
+        columns = (Wallpaper.id, Wallpaper.phash, Wallpaper.processing_status)
+        rows = db.session.query(*columns).filter(
+            Wallpaper.id > self._max_id,
+            or_(Wallpaper.phash.isnot(None), Wallpaper.processing_status == 'processing')
+        ).order_by(Wallpaper.id).all()
+        # Uploads that were still processing: hashed, failed or deleted since drop out of the set
+        pending = list(self._pending)
+        self._pending = set()
+        for i in range(0, len(pending), 500):
+            rows.extend(db.session.query(*columns).filter(Wallpaper.id.in_(pending[i:i + 500])))
+        for wallpaper_id, phash, processing_status in rows:
+            if phash:
+                self._index.add(wallpaper_id, parse_hash(phash))
+            elif processing_status == 'processing':
+                self._pending.add(wallpaper_id)
+            self._max_id = max(self._max_id, wallpaper_id)
+
+    def add(self, wallpaper_id, phash):
+        """Index a new wallpaper's hash (hex string)"""
+        if not phash:
+            return
+        with self._lock:
+            if self._index is not None:
+                self._index.add(wallpaper_id, parse_hash(phash))
+                self._pending.discard(wallpaper_id)
+
+    def remove(self, wallpaper_id):
+        with self._lock:
+            if self._index is not None:
+                self._index.remove(wallpaper_id)
+                self._pending.discard(wallpaper_id)
+
+    def find(self, phash, max_distance=None, exclude_id=None, limit=20):
+        """(distance, wallpaper_id) pairs within max_distance of phash, nearest first"""
+        if not phash:
+            return []
+        max_distance = self.max_distance if max_distance is None else max_distance
+        with self._lock:
+            self._catch_up()
+            matches = self._index.search(parse_hash(phash), max_distance)
+        return [(d, i) for d, i in matches if i != exclude_id][:limit]
+
+    def reset(self):
+        """Drop the index; it is rebuilt on the next search"""
+        with self._lock:
+            self._index = None
+
+similarity_index = SimilarityIndex()
+
+def backfill_phashes(batch_size=200):
+    """Compute phash for stored wallpapers (and their blobs) that predate perceptual hashing"""
+    last_id = 0
+    processed = 0
+    while True:
+        batch = (
+            Wallpaper.query.filter(Wallpaper.id > last_id, Wallpaper.phash.is_(None))
+            .order_by(Wallpaper.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+        hashes = {}
+        for wallpaper in batch:
+            if wallpaper.filename not in hashes:
+                try:
+                    hashes[wallpaper.filename] = format_hash(compute_phash(storage.ensure_local(wallpaper.filename)))
+                except Exception as e:
+                    print(f"Error hashing {wallpaper.filename}: {e}")
+                    hashes[wallpaper.filename] = None
+            wallpaper.phash = hashes[wallpaper.filename]
+            if wallpaper.phash:
+                processed += 1
+        for blob in ImageBlob.query.filter(ImageBlob.filename.in_(list(hashes)), ImageBlob.phash.is_(None)):
+            blob.phash = hashes[blob.filename]
+        db.session.commit()
+        last_id = batch[-1].id
+    similarity_index.reset()
+    return processed
+
+if __name__ == '__main__':
+    from flask import Flask
+    
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), '..', 'database', 'app.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    db.init_app(app)
+    
+    with app.app_context():
+        db.create_all()
+        print(f"Computed perceptual hashes for {backfill_phashes()} wallpapers")
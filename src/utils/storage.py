@@ -0,0 +1,298 @@
+"""
+Storage backends for uploaded originals and thumbnails.
+
+Keys are paths relative to the upload root, e.g. '<sha256>.jpg' or
+'thumbnails/thumb_<sha256>.jpg'. STORAGE_BACKEND selects the driver:
+
+    local  - files under the upload folder (default)
+    s3     - an S3-compatible bucket (AWS, MinIO, moto server) via boto3
+
+With a remote backend the upload folder is only a per-node working cache:
+uploads are decoded there, and ensure_local() downloads an original on a
+node that has not seen it before generating renditions from it.
+"""
+import mimetypes
+import os
+import shutil
+import threading
+import uuid
+from werkzeug.security import safe_join
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # only needed for STORAGE_BACKEND = 's3'
+    boto3 = None
+
+DEFAULT_UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'uploads')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def _copy_atomic(source, destination):
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    tmp_path = f"{destination}.{uuid.uuid4().hex}.tmp"
+    try:
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, destination)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+class LocalStorage:
+    is_local = True
+
+    def __init__(self, root, base_url='/static/uploads'):
+        self.root = root
+        self.base_url = base_url
+
+    def local_path(self, key):
+        """Filesystem path of a key; raises ValueError for keys escaping the root"""
+        path = safe_join(self.root, key)
+        if path is None:
+            raise ValueError(f"Invalid storage key {key}")
+        return path
+
+    def put_file(self, key, path, immutable=False):
+        """Store the local file at ``path`` under ``key``; the local file is left in place"""
+        destination = self.local_path(key)
+        if os.path.abspath(path) != os.path.abspath(destination):
+            _copy_atomic(path, destination)
+
+    def save(self, key, fileobj, immutable=False):
+        destination = self.local_path(key)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        tmp_path = f"{destination}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'wb') as out:
+                shutil.copyfileobj(fileobj, out)
+            os.replace(tmp_path, destination)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def open(self, key):
+        return open(self.local_path(key), 'rb')
+
+    def fetch(self, key, path):
+        """Copy a stored key to a local path"""
+        source = self.local_path(key)
+        if os.path.abspath(path) != os.path.abspath(source):
+            _copy_atomic(source, path)
+
+    def delete(self, key):
+        path = self.local_path(key)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+    def exists(self, key):
+        return os.path.exists(self.local_path(key))
+
+    def url(self, key, download_name=None):
+        return f"{self.base_url}/{key}"
+
+class S3Storage:
+    """S3-compatible driver.
+
+    One boto3 client per process is shared by all threads; its urllib3 pool
+    keeps up to max_pool_connections connections alive. Transfers go through
+    boto3's managed transfer, which switches to parallel multipart uploads
+    and ranged downloads above multipart_threshold.
+    """
+    is_local = False
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, access_key=None, secret_key=None,
+                 public_url=None, max_pool_connections=20, multipart_threshold=8 * 1024 * 1024,
+                 multipart_chunksize=8 * 1024 * 1024, max_concurrency=4, url_expires=3600):
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND = 's3' requires boto3 to be installed")
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.public_url = public_url.rstrip('/') if public_url else None
+        self.max_pool_connections = max_pool_connections
+        self.url_expires = url_expires
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=True
+        )
+        self._client = None
+        self._client_pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # Created lazily and per process: gunicorn forks workers, and a pooled client must not cross a fork
+        with self._lock:
+            if self._client is None or self._client_pid != os.getpid():
+                self._client = boto3.client(
+                    's3',
+                    endpoint_url=self.endpoint_url,
+                    region_name=self.region,
+                    aws_access_key_id=self.access_key,
+                    aws_secret_access_key=self.secret_key,
+                    config=BotoConfig(
+                        max_pool_connections=self.max_pool_connections,
+                        retries={'max_attempts': 5, 'mode': 'standard'},
+                        # MinIO and moto serve buckets by path rather than virtual host
+                        s3={'addressing_style': 'path'} if self.endpoint_url else None
+                    )
+                )
+                self._client_pid = os.getpid()
+            return self._client
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def _extra_args(self, key, immutable):
+        extra = {'ContentType': mimetypes.guess_type(key)[0] or 'application/octet-stream'}
+        if immutable:
+            extra['CacheControl'] = IMMUTABLE_CACHE_CONTROL
+        return extra
+
+    def local_path(self, key):
+        return None
+
+    def put_file(self, key, path, immutable=False):
+        """Upload the local file at ``path`` (multipart above the threshold); the local file is left in place"""
+        self.client.upload_file(
+            path, self.bucket, self._key(key),
+            ExtraArgs=self._extra_args(key, immutable), Config=self.transfer_config
+        )
+
+    def save(self, key, fileobj, immutable=False):
+        self.client.upload_fileobj(
+            fileobj, self.bucket, self._key(key),
+            ExtraArgs=self._extra_args(key, immutable), Config=self.transfer_config
+        )
+
+    def open(self, key):
+        """Streaming body of a stored object"""
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                raise FileNotFoundError(key)
+            raise
+
+    def fetch(self, key, path):
+        """Download a stored key to a local path"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            self.client.download_file(self.bucket, self._key(key), tmp_path, Config=self.transfer_config)
+            os.replace(tmp_path, path)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                raise FileNotFoundError(key)
+            raise
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        return True
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404', 'NotFound'):
+                return False
+            raise
+
+    def url(self, key, download_name=None):
+        """Public URL when S3_PUBLIC_URL is set, otherwise a presigned GET"""
+        if self.public_url and not download_name:
+            return f"{self.public_url}/{self._key(key)}"
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if download_name:
+            params['ResponseContentDisposition'] = f'attachment; filename="{download_name}"'
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.url_expires)
+
+class Storage:
+    """The configured backend plus the node-local working folder"""
+
+    def __init__(self, upload_folder=DEFAULT_UPLOAD_FOLDER):
+        self.upload_folder = upload_folder
+        self.backend = LocalStorage(upload_folder)
+
+    def init_app(self, app, upload_folder=DEFAULT_UPLOAD_FOLDER):
+        """Select the backend from STORAGE_BACKEND and S3_* settings"""
+        self.upload_folder = upload_folder
+        backend = app.config.get('STORAGE_BACKEND', 'local')
+        if backend == 'local':
+            self.backend = LocalStorage(upload_folder)
+        elif backend == 's3':
+            self.backend = S3Storage(
+                bucket=app.config['S3_BUCKET'],
+                prefix=app.config.get('S3_PREFIX', ''),
+                endpoint_url=app.config.get('S3_ENDPOINT_URL'),
+                region=app.config.get('S3_REGION'),
+                access_key=app.config.get('S3_ACCESS_KEY_ID'),
+                secret_key=app.config.get('S3_SECRET_ACCESS_KEY'),
+                public_url=app.config.get('S3_PUBLIC_URL'),
+                max_pool_connections=app.config.get('S3_MAX_POOL_CONNECTIONS', 20),
+                multipart_threshold=app.config.get('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024),
+                multipart_chunksize=app.config.get('S3_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024),
+                url_expires=app.config.get('S3_URL_EXPIRES', 3600)
+            )
+        else:
+            raise ValueError(f'Unknown storage backend {backend}')
+
+    @property
+    def is_local(self):
+        return self.backend.is_local
+
+    def cache_path(self, key):
+        """Path of a key in the node-local working folder"""
+        path = safe_join(self.upload_folder, key)
+        if path is None:
+            raise ValueError(f"Invalid storage key {key}")
+        return path
+
+    def ensure_local(self, key):
+        """Local path of a stored key, downloading it into the working folder if needed"""
+        path = self.cache_path(key)
+        if not os.path.exists(path):
+            self.backend.fetch(key, path)
+        return path
+
+    def put_file(self, key, path, immutable=False):
+        self.backend.put_file(key, path, immutable)
+
+    def save(self, key, fileobj, immutable=False):
+        self.backend.save(key, fileobj, immutable)
+
+    def open(self, key):
+        return self.backend.open(key)
+
+    def exists(self, key):
+        return self.backend.exists(key)
+
+    def url(self, key, download_name=None):
+        return self.backend.url(key, download_name)
+
+    def delete(self, key):
+        """Delete a stored key and any cached local copy"""
+        try:
+            deleted = self.backend.delete(key)
+            if not self.is_local:
+                path = self.cache_path(key)
+                if os.path.exists(path):
+                    os.remove(path)
+            return deleted
+        except Exception as e:
+            print(f"Error deleting {key}: {e}")
+            return False
+
+storage = Storage()
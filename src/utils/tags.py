@@ -0,0 +1,140 @@
+"""
+Helpers for the normalized tag tables, plus a backfill from the legacy JSON tags column
+"""
+import os
+import sys
+import json
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from src.models.user import db
+from src.models.wallpaper import Wallpaper
+from src.models.tag import Tag, wallpaper_tags
+
+MAX_TAG_LENGTH = 50
+
+def normalize_tag(name):
+    """Normalize a tag name for storage and lookup"""
+    return name.strip().lower()[:MAX_TAG_LENGTH]
+
+def parse_tags(raw):
+    """Parse tags from a JSON list string, a list, or a comma separated string"""
+    if not raw:
+        return []
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            raw = raw.split(',')
+    if not isinstance(raw, list):
+        return []
+
+    names = []
+    for item in raw:
+        name = normalize_tag(str(item))
+        if name and name not in names:
+            names.append(name)
+    return names
+
+def _insert_tags(names):
+    """Insert tag rows for names that have none; a concurrent insert of the same name is not an error"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql_insert if dialect == 'postgresql' else sqlite_insert
+        db.session.execute(
+            insert(Tag).values([{'name': name} for name in names]).on_conflict_do_nothing(index_elements=['name'])
+        )
+        return
+    for name in names:
+        try:
+            with db.session.begin_nested():
+                db.session.add(Tag(name=name))
+        except IntegrityError:
+            pass
+
+def get_or_create_tags(names, cache=None):
+    """Return Tag rows for the given normalized names, creating missing ones"""
+    cache = cache if cache is not None else {}
+    missing = list(dict.fromkeys(n for n in names if n not in cache))
+    if missing:
+        for tag in Tag.query.filter(Tag.name.in_(missing)).all():
+            cache[tag.name] = tag
+        created = [n for n in missing if n not in cache]
+        if created:
+            # Insert-or-ignore then re-select, so two requests adding the same new tag both succeed
+            _insert_tags(created)
+            for tag in Tag.query.filter(Tag.name.in_(created)).all():
+                cache[tag.name] = tag
+    return [cache[n] for n in names]
+
+def sync_wallpaper_tags(wallpaper, cache=None):
+    """Make the wallpaper's tag rows match its JSON tags column"""
+    wallpaper.tag_set = get_or_create_tags(parse_tags(wallpaper.tags), cache)
+
+def filter_by_tags(query, names, match_all=False):
+    """Restrict a wallpaper query to wallpapers carrying any (or all) of the tags"""
+    names = [normalize_tag(n) for n in names if normalize_tag(n)]
+    if not names:
+        return query
+
+    matching = (
+        select(wallpaper_tags.c.wallpaper_id)
+        .join(Tag, Tag.id == wallpaper_tags.c.tag_id)
+        .where(Tag.name.in_(names))
+    )
+    if match_all:
+        matching = (
+            matching.group_by(wallpaper_tags.c.wallpaper_id)
+            .having(func.count(wallpaper_tags.c.tag_id) == len(set(names)))
+        )
+    return query.filter(Wallpaper.id.in_(matching))
+
+def tag_counts(status=None, limit=50):
+    """Return (name, wallpaper count) pairs, most used first"""
+    count = func.count(wallpaper_tags.c.wallpaper_id)
+    query = (
+        db.session.query(Tag.name, count)
+        .join(wallpaper_tags, wallpaper_tags.c.tag_id == Tag.id)
+    )
+    if status:
+        query = query.join(Wallpaper, Wallpaper.id == wallpaper_tags.c.wallpaper_id).filter(Wallpaper.status == status)
+    return query.group_by(Tag.id, Tag.name).order_by(count.desc(), Tag.name).limit(limit).all()
+
+def backfill_tags(batch_size=500):
+    """Populate tag rows from the JSON tags column of every wallpaper"""
+    cache = {}
+    last_id = 0
+    processed = 0
+    while True:
+        batch = (
+            Wallpaper.query.filter(Wallpaper.id > last_id)
+            .order_by(Wallpaper.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+        for wallpaper in batch:
+            sync_wallpaper_tags(wallpaper, cache)
+        db.session.commit()
+        processed += len(batch)
+        last_id = batch[-1].id
+    return processed
+
+if __name__ == '__main__':
+    from flask import Flask
+    
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), '..', 'database', 'app.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    db.init_app(app)
+    
+    with app.app_context():
+        db.create_all()
+        print(f"Backfilled tags for {backfill_tags()} wallpapers")
@@ -0,0 +1,263 @@
+"""
+Time-decayed trending leaderboard of wallpapers, overall and per category.
+
+A view, like or download adds its weight (TRENDING_WEIGHTS) to the
+wallpaper's score, and each contribution loses half its value every
+TRENDING_HALF_LIFE_HOURS. Instead of decaying every score as time passes,
+an event at time t adds weight * 2 ** ((t - landmark) / half_life) (forward
+decay). Later events count for more, which ranks wallpapers exactly as
+decaying all scores would, but scores only ever grow: an event is one
+addition, and the contributions of several workers simply sum. To keep the
+numbers finite the landmark moves forward every EPOCH_HALF_LIVES
+half-lives, and a score from the previous epoch is scaled down by
+2 ** -EPOCH_HALF_LIVES when it is next written or read.
+
+Each worker keeps the TRENDING_CAPACITY best scores per scope ('' for all
+wallpapers, else a category) in memory, plus a buffer of increments not yet
+written. Every TRENDING_FLUSH_INTERVAL seconds a background thread adds the
+buffer to trending_score (write-behind, like utils/counters.py), deletes
+scores that have decayed to nothing and reloads the best TRENDING_CAPACITY
+rows per scope, which now include every worker's events. Reads are served
+from the board sorted at most once a second after it changes, so
+/api/wallpapers/trending costs the same however many events or wallpapers
+there are. A restart resumes from the table.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import bindparam, case, func, select
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db
+from src.models.trending import TrendingScore
+from src.models.wallpaper import Wallpaper
+from src.utils.background import BackgroundFlusher
+
+ALL_CATEGORIES = ''
+DEFAULT_WEIGHTS = {'view': 1.0, 'like': 3.0, 'download': 5.0}
+EPOCH_HALF_LIVES = 64
+# Scores worth less than this many views today are deleted (a single view after ~7 half-lives)
+PRUNE_BELOW = 0.01
+# A changed board is re-sorted for reads at most this often (seconds)
+RANKING_INTERVAL = 1.0
+
+def _normalized(table, epoch):
+    """SQL expression for a stored score in the units of epoch"""
+    return case(
+        (table.c.epoch == epoch, table.c.score),
+        (table.c.epoch == epoch - 1, table.c.score * 2.0 ** -EPOCH_HALF_LIVES),
+        else_=0.0
+    )
+
+class TrendingLeaderboard:
+    def __init__(self, half_life_hours=24.0, capacity=500, flush_interval=15.0, weights=None):
+        self.half_life = half_life_hours * 3600
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.app = None
+        self._epoch = None
+        self._scores = defaultdict(dict)  # scope -> {wallpaper_id: score in the units of _epoch}
+        self._lowest = {}  # scope -> wallpaper_id of the lowest score while its board is full
+        self._pending = defaultdict(float)  # (scope, wallpaper_id) -> unflushed increment
+        self._rankings = {}  # scope -> [(wallpaper_id, score)], best first
+        self._ranked_at = {}  # scope -> time.monotonic() of its last ranking
+        self._stale = set()  # scopes whose board changed since they were ranked
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher = BackgroundFlusher(self.flush, 'trending-flusher', 'flushing trending scores')
+
+    def init_app(self, app):
+        """Load the stored scores, start the flusher thread and flush on interpreter exit"""
+        self.app = app
+        self.half_life = app.config.get('TRENDING_HALF_LIFE_HOURS', self.half_life / 3600) * 3600
+        self.capacity = app.config.get('TRENDING_CAPACITY', self.capacity)
+        self.flush_interval = app.config.get('TRENDING_FLUSH_INTERVAL', self.flush_interval)
+        self.weights = dict(app.config.get('TRENDING_WEIGHTS', self.weights))
+        self._flusher.start(app, self.flush_interval)
+        self._flusher.flush_in_app()
+
+    def _clock(self):
+        """(epoch, multiplier of an event happening now in that epoch's units)"""
+        position = time.time() / self.half_life
+        epoch = int(position // EPOCH_HALF_LIVES)
+        return epoch, 2.0 ** (position - epoch * EPOCH_HALF_LIVES)
+
+    def _rescale(self, epoch):
+        # Caller holds _lock
+        if self._epoch is not None:
+            factor = 2.0 ** (-EPOCH_HALF_LIVES * (epoch - self._epoch))
+            for board in self._scores.values():
+                for wallpaper_id in board:
+                    board[wallpaper_id] *= factor
+            for key in self._pending:
+                self._pending[key] *= factor
+        self._epoch = epoch
+        self._rankings = {}
+        self._stale = set(self._scores)
+
+    def record(self, event_type, wallpaper_id, category=None):
+        """Count an event towards the wallpaper's score overall and in its category"""
+        weight = self.weights.get(event_type)
+        if not weight:
+            return
+        epoch, multiplier = self._clock()
+        value = weight * multiplier
+        with self._lock:
+            if epoch != self._epoch:
+                self._rescale(epoch)
+            for scope in (ALL_CATEGORIES, category) if category else (ALL_CATEGORIES,):
+                self._pending[(scope, wallpaper_id)] += value
+                self._bump(scope, wallpaper_id, value)
+                self._stale.add(scope)
+
+    def _bump(self, scope, wallpaper_id, value):
+        # Caller holds _lock. The board keeps at most capacity scores (Space-Saving):
+        # once full, a newcomer takes the place of the lowest score and inherits it,
+        # an upper bound on its own, so a wallpaper rising fast between flushes
+        # still reaches the board. The next flush replaces it with the stored score.
+        board = self._scores[scope]
+        if wallpaper_id in board:
+            board[wallpaper_id] += value
+            if self._lowest.get(scope) == wallpaper_id:
+                del self._lowest[scope]
+            return
+        if len(board) < self.capacity:
+            board[wallpaper_id] = value
+            self._lowest.pop(scope, None)
+            return
+        lowest = self._lowest.get(scope)
+        if lowest is None:
+            lowest = self._lowest[scope] = min(board, key=board.get)
+        board[wallpaper_id] = board.pop(lowest) + value
+        del self._lowest[scope]
+
+    def _rank(self, scope):
+        # Caller holds _lock
+        board = self._scores.get(scope, {})
+        self._rankings[scope] = sorted(board.items(), key=lambda item: item[1], reverse=True)
+        self._ranked_at[scope] = time.monotonic()
+        self._stale.discard(scope)
+
+    def top(self, category=None, limit=20):
+        """[(wallpaper_id, score)] best first; a score is the number of views it is worth today"""
+        scope = category or ALL_CATEGORIES
+        epoch, multiplier = self._clock()
+        with self._lock:
+            if scope in self._stale and (
+                scope not in self._rankings or time.monotonic() - self._ranked_at[scope] >= RANKING_INTERVAL
+            ):
+                self._rank(scope)
+            ranking = self._rankings.get(scope, [])
+            # Scores are relative to the landmark; dividing by now's multiplier decays them to the present
+            scale = 2.0 ** (-EPOCH_HALF_LIVES * (epoch - (epoch if self._epoch is None else self._epoch))) / multiplier
+        return [(wallpaper_id, score * scale) for wallpaper_id, score in ranking[:limit]]
+
+    def flush(self):
+        """Write buffered increments, then reload the best stored scores; returns increments written"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, defaultdict(float)
+                epoch = self._epoch
+            if pending:
+                try:
+                    self._write(pending, epoch)
+                except Exception:
+                    self._restore(pending, epoch)
+                    raise
+            self._reload()
+            return len(pending)
+
+    def _write(self, pending, epoch):
+        table = TrendingScore.__table__
+        now = datetime.utcnow()
+        by_scope = defaultdict(list)
+        for scope, wallpaper_id in pending:
+            by_scope[scope].append(wallpaper_id)
+        for attempt in range(2):
+            try:
+                with db.engine.begin() as conn:
+                    # Increments of wallpapers deleted since they were recorded would
+                    # violate the foreign key and fail the whole batch on every flush
+                    live = set()
+                    ids = list({wallpaper_id for _, wallpaper_id in pending})
+                    for i in range(0, len(ids), 500):
+                        live.update(conn.execute(
+                            select(Wallpaper.id).where(Wallpaper.id.in_(ids[i:i + 500]))
+                        ).scalars())
+                    pending = {key: value for key, value in pending.items() if key[1] in live}
+                    existing = set()
+                    for scope, wallpaper_ids in by_scope.items():
+                        for i in range(0, len(wallpaper_ids), 500):
+                            existing.update(
+                                (scope, wallpaper_id) for (wallpaper_id,) in conn.execute(
+                                    select(table.c.wallpaper_id).where(
+                                        table.c.category == scope,
+                                        table.c.wallpaper_id.in_(wallpaper_ids[i:i + 500])
+                                    )
+                                )
+                            )
+                    updates = [
+                        {'b_category': scope, 'b_wallpaper_id': wallpaper_id, 'b_increment': value}
+                        for (scope, wallpaper_id), value in pending.items() if (scope, wallpaper_id) in existing
+                    ]
+                    if updates:
+                        conn.execute(
+                            table.update()
+                            .where(table.c.category == bindparam('b_category'), table.c.wallpaper_id == bindparam('b_wallpaper_id'))
+                            .values(score=_normalized(table, epoch) + bindparam('b_increment'), epoch=epoch, updated_at=now),
+                            updates
+                        )
+                    inserts = [
+                        {'category': scope, 'wallpaper_id': wallpaper_id, 'score': value, 'epoch': epoch, 'updated_at': now}
+                        for (scope, wallpaper_id), value in pending.items() if (scope, wallpaper_id) not in existing
+                    ]
+                    if inserts:
+                        conn.execute(table.insert(), inserts)
+                return
+            except IntegrityError:
+                # Another worker inserted one of the rows first, or a wallpaper was deleted
+                # meanwhile; the retry updates or drops it instead
+                if attempt:
+                    raise
+
+    def _restore(self, pending, epoch):
+        with self._lock:
+            factor = 2.0 ** (-EPOCH_HALF_LIVES * (self._epoch - epoch))
+            for key, value in pending.items():
+                self._pending[key] += value * factor
+
+    def _reload(self):
+        table = TrendingScore.__table__
+        epoch, multiplier = self._clock()
+        score = _normalized(table, epoch)
+        ranked = select(
+            table.c.category, table.c.wallpaper_id, score.label('score'),
+            func.row_number().over(partition_by=table.c.category, order_by=score.desc()).label('rank')
+        ).subquery()
+        with db.engine.begin() as conn:
+            conn.execute(table.delete().where(score < PRUNE_BELOW * multiplier))
+            rows = conn.execute(
+                select(ranked.c.category, ranked.c.wallpaper_id, ranked.c.score).where(ranked.c.rank <= self.capacity)
+            ).all()
+
+        boards = defaultdict(dict)
+        for category, wallpaper_id, value in rows:
+            boards[category][wallpaper_id] = value
+        with self._lock:
+            if epoch != self._epoch:
+                self._rescale(epoch)
+            # Events recorded since the write above are not in the table yet
+            for (scope, wallpaper_id), value in self._pending.items():
+                boards[scope][wallpaper_id] = boards[scope].get(wallpaper_id, 0.0) + value
+            self._scores = boards
+            self._lowest = {}
+            self._rankings = {}
+            for scope in boards:
+                self._rank(scope)
+
+    def shutdown(self):
+        """Stop the flusher thread and write out whatever is still pending"""
+        self._flusher.shutdown()
+
+trending = TrendingLeaderboard()
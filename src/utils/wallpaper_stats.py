@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func, case
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db
+from src.models.wallpaper import Wallpaper, WallpaperStats, STATS_ROW_ID
+
+RECENT_UPLOAD_DAYS = 7
+
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+def compute_stats():
+    """Compute every catalog counter in one conditional-aggregation pass"""
+    row = db.session.query(
+        func.count(Wallpaper.id),
+        _count_if(Wallpaper.status == 'pending'),
+        _count_if(Wallpaper.status == 'approved'),
+        _count_if(Wallpaper.featured.is_(True))
+    ).one()
+    return {
+        'total_wallpapers': row[0],
+        'pending_wallpapers': row[1],
+        'approved_wallpapers': row[2],
+        'featured_wallpapers': row[3]
+    }
+
+def count_recent_uploads(days=RECENT_UPLOAD_DAYS):
+    """Count uploads in the trailing window (a range scan on the created_at index)"""
+    since = datetime.utcnow() - timedelta(days=days)
+    return db.session.query(func.count(Wallpaper.id)).filter(Wallpaper.created_at >= since).scalar()
+
+def rebuild_stats_row():
+    """Recompute the materialized stats row from the wallpaper table"""
+    stats = compute_stats()
+    row = db.session.get(WallpaperStats, STATS_ROW_ID)
+    if row is None:
+        row = WallpaperStats(id=STATS_ROW_ID)
+        db.session.add(row)
+    for key, value in stats.items():
+        setattr(row, key, value)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker created the row first; update it instead
+        db.session.rollback()
+        return rebuild_stats_row()
+    return row
+
+def get_stats():
+    """Read the materialized stats row, falling back to a single aggregate query"""
+    row = db.session.get(WallpaperStats, STATS_ROW_ID)
+    stats = row.to_dict() if row else compute_stats()
+    stats['recent_uploads'] = count_recent_uploads()
+    return stats
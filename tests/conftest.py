@@ -0,0 +1,84 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+# Add the repository root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from src.models.user import db, User
+from src.models.wallpaper import Wallpaper
+from src.models.report import Report
+from src.models.analytics import AnalyticsEvent, AdPerformance
+from src.models.tag import Tag
+from src.models.blob import ImageBlob
+from src.models.color import WallpaperColor
+from src.models.rollup import AnalyticsRollupHourly, AnalyticsRollupDaily
+from src.models.trending import TrendingScore
+from src.routes.wallpapers_enhanced import wallpapers_enhanced_bp
+from src.utils.migrations import run_migrations
+from src.utils.response_cache import invalidate_catalog
+from src.utils.pagination import _count_cache
+from src.utils.storage import storage, LocalStorage
+
+@pytest.fixture
+def app(tmp_path):
+    """The catalog blueprint on a fresh SQLite database with one user (id 1)"""
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY='test',
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'app.db'}",
+        SQLALCHEMY_TRACK_MODIFICATIONS=False
+    )
+    app.register_blueprint(wallpapers_enhanced_bp)
+    db.init_app(app)
+    with app.app_context():
+        run_migrations(db.engine)
+        db.session.add(User(username='tester', email='tester@example.com', password_hash='x'))
+        db.session.commit()
+    # Process-wide caches keyed by request, not by database
+    invalidate_catalog()
+    _count_cache.clear()
+    yield app
+    invalidate_catalog()
+    _count_cache.clear()
+    with app.app_context():
+        db.engine.dispose()
+
+@pytest.fixture
+def upload_folder(tmp_path, monkeypatch):
+    """A temporary upload folder (with thumbnails/) backing the storage singleton"""
+    folder = tmp_path / 'uploads'
+    (folder / 'thumbnails').mkdir(parents=True)
+    monkeypatch.setattr(storage, 'upload_folder', str(folder))
+    monkeypatch.setattr(storage, 'backend', LocalStorage(str(folder)))
+    return str(folder)
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def add_wallpapers(app):
+    """add_wallpapers(count, **fields) inserts approved wallpapers an hour apart; returns their ids"""
+    def add(count, **fields):
+        with app.app_context():
+            wallpapers = []
+            for i in range(count):
+                values = {
+                    'title': f'Wallpaper {i}',
+                    'filename': f'{i}.jpg',
+                    'category': 'Nature',
+                    'uploaded_by': 1,
+                    'status': 'approved',
+                    'created_at': datetime(2024, 1, 1) + timedelta(hours=i)
+                }
+                values.update(fields)
+                wallpapers.append(Wallpaper(**values))
+            db.session.add_all(wallpapers)
+            db.session.commit()
+            return [wallpaper.id for wallpaper in wallpapers]
+    return add
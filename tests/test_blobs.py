@@ -0,0 +1,109 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+import src.routes.wallpapers_enhanced as wallpaper_routes
+from src.models.user import db
+from src.models.blob import ImageBlob
+from src.utils.blobs import register_blob, release_blob
+
+@pytest.fixture
+def uploads(upload_folder, monkeypatch):
+    monkeypatch.setattr(wallpaper_routes, 'UPLOAD_FOLDER', upload_folder)
+    return upload_folder
+
+@pytest.fixture
+def user_client(client):
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+    return client
+
+def image_bytes(color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+def upload(client, data, title='Red'):
+    return client.post('/api/wallpapers', data={
+        'file': (io.BytesIO(data), 'red.jpg'),
+        'title': title,
+        'category': 'Nature'
+    }, content_type='multipart/form-data')
+
+def stored_files(folder):
+    return sorted(
+        os.path.relpath(os.path.join(root, name), folder)
+        for root, _, names in os.walk(folder) for name in names
+    )
+
+def blobs(app):
+    with app.app_context():
+        return [(blob.filename, blob.ref_count) for blob in ImageBlob.query.order_by(ImageBlob.id)]
+
+def test_identical_uploads_share_one_blob(app, user_client, uploads):
+    data = image_bytes()
+    first = upload(user_client, data)
+    second = upload(user_client, data, title='Red again')
+    assert first.status_code == second.status_code == 201
+    assert not first.get_json()['deduplicated'] and second.get_json()['deduplicated']
+
+    filename = first.get_json()['wallpaper']['filename']
+    assert second.get_json()['wallpaper']['filename'] == filename
+    assert blobs(app) == [(filename, 2)]
+    assert stored_files(uploads) == [filename, os.path.join('thumbnails', first.get_json()['wallpaper']['thumbnail_filename'])]
+
+def test_files_are_deleted_with_the_last_reference(app, user_client, uploads):
+    data = image_bytes()
+    first = upload(user_client, data).get_json()['wallpaper']
+    second = upload(user_client, data).get_json()['wallpaper']
+
+    assert user_client.delete(f"/api/wallpapers/{first['id']}").status_code == 200
+    assert blobs(app) == [(first['filename'], 1)]
+    assert first['filename'] in stored_files(uploads)
+
+    assert user_client.delete(f"/api/wallpapers/{second['id']}").status_code == 200
+    assert blobs(app) == []
+    assert stored_files(uploads) == []
+
+def test_legacy_wallpaper_owns_its_files(app, user_client, uploads, add_wallpapers):
+    with open(os.path.join(uploads, 'legacy.jpg'), 'wb') as f:
+        f.write(image_bytes())
+    wallpaper_id, = add_wallpapers(1, filename='legacy.jpg')
+
+    assert user_client.delete(f'/api/wallpapers/{wallpaper_id}').status_code == 200
+    assert stored_files(uploads) == []
+
+def test_failed_insert_leaves_no_orphan_files(app, user_client, uploads, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('tag index unavailable')
+    monkeypatch.setattr(wallpaper_routes, 'sync_wallpaper_tags', fail)
+
+    assert upload(user_client, image_bytes()).status_code == 500
+    assert blobs(app) == []
+    assert stored_files(uploads) == []
+
+def test_duplicate_of_a_blob_without_thumbnail_gets_one(app, user_client, uploads):
+    data = image_bytes()
+    first = upload(user_client, data).get_json()['wallpaper']
+    with app.app_context():
+        ImageBlob.query.update({ImageBlob.thumbnail_filename: None})
+        db.session.commit()
+    os.remove(os.path.join(uploads, 'thumbnails', first['thumbnail_filename']))
+
+    second = upload(user_client, data).get_json()['wallpaper']
+    assert second['thumbnail_filename'] == first['thumbnail_filename']
+    assert os.path.exists(os.path.join(uploads, 'thumbnails', second['thumbnail_filename']))
+
+def test_register_race_takes_a_reference(app):
+    info = {'content_hash': 'a' * 64, 'filename': 'a.jpg'}
+    with app.app_context():
+        register_blob(info)
+        # A second upload that also missed blob_exists() before the first committed
+        assert register_blob(info).ref_count == 2
+        db.session.commit()
+        assert release_blob('a.jpg') is False
+        assert release_blob('a.jpg') is True
+        db.session.commit()
+        assert ImageBlob.query.count() == 0
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.models.user import db
+from src.models.analytics import AnalyticsEvent
+from src.models.rollup import RollupState
+from src.utils.event_archive import EventArchive, LeaseLost, LEASE_NAME, LEASE_SECONDS
+
+@pytest.fixture
+def archive(tmp_path):
+    return EventArchive(root=str(tmp_path / 'archive'), archive_after_days=30)
+
+def add_events(app, days_ago, count):
+    with app.app_context():
+        created_at = datetime.utcnow() - timedelta(days=days_ago)
+        db.session.add_all(AnalyticsEvent(event_type='view', session_id='s', created_at=created_at) for _ in range(count))
+        db.session.commit()
+        return db.session.query(db.func.max(AnalyticsEvent.id)).scalar()
+
+def set_watermark(app, event_id):
+    with app.app_context():
+        state = db.session.get(RollupState, 'analytics_event')
+        if state is None:
+            state = RollupState(name='analytics_event')
+            db.session.add(state)
+        state.last_event_id = event_id
+        state.updated_at = datetime.utcnow()
+        db.session.commit()
+
+def take_over_lease(app):
+    # What another worker's claim does once the lease looks expired
+    with app.app_context():
+        db.session.get(RollupState, LEASE_NAME).updated_at = datetime.utcnow() + timedelta(seconds=1)
+        db.session.commit()
+
+def test_archives_merged_aged_events(app, archive):
+    add_events(app, 40, 5)
+    set_watermark(app, add_events(app, 1, 3))
+    with app.app_context():
+        assert archive.archive() == {'events': 5, 'days': 1, 'locked': False}
+        assert db.session.query(AnalyticsEvent).count() == 3
+        assert sum(len(rows) for rows in archive.scan(['id'])) == 5
+
+def test_second_worker_is_locked_out(app, archive):
+    other = EventArchive(root=archive.root)
+    with app.app_context():
+        assert archive.lock()
+        assert not other.lock()
+        assert other.archive(30)['locked']
+        archive.unlock()
+        assert other.lock()
+        other.unlock()
+
+def test_lost_lease_stops_before_deleting(app, archive):
+    set_watermark(app, add_events(app, 40, 5))
+    with app.app_context():
+        assert archive.lock()
+    take_over_lease(app)
+    with app.app_context():
+        with pytest.raises(LeaseLost):
+            archive._archive_day(datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=40), 5)
+        assert db.session.query(AnalyticsEvent).count() == 5
+
+def test_unlock_leaves_a_taken_over_lease_alone(app, archive):
+    with app.app_context():
+        assert archive.lock()
+    take_over_lease(app)
+    with app.app_context():
+        archive.unlock()
+        lease = db.session.get(RollupState, LEASE_NAME)
+        assert lease.updated_at > datetime.utcnow() - timedelta(seconds=LEASE_SECONDS)
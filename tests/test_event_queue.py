@@ -0,0 +1,51 @@
+from sqlalchemy.exc import OperationalError
+
+from src.models.user import db
+from src.models.analytics import AnalyticsEvent
+from src.utils.event_queue import EventQueue
+
+def stored_types(app):
+    with app.app_context():
+        return [event_type for (event_type,) in db.session.query(AnalyticsEvent.event_type).order_by(AnalyticsEvent.id)]
+
+def test_flush_writes_in_batches(app):
+    queue = EventQueue(batch_size=4)
+    for i in range(10):
+        queue.enqueue('view', session_id=f's{i}')
+    with app.app_context():
+        assert queue.flush() == 10
+    assert len(stored_types(app)) == 10
+    metrics = queue.metrics()
+    assert metrics['written'] == 10 and metrics['flushes'] == 3 and metrics['queue_depth'] == 0
+
+def test_bad_event_drops_only_itself(app):
+    queue = EventQueue(batch_size=10)
+    queue.enqueue('view')
+    queue.enqueue('like')
+    # event_type is NOT NULL
+    queue.enqueue(None)
+    queue.enqueue('download')
+    with app.app_context():
+        assert queue.flush() == 3
+    assert stored_types(app) == ['view', 'like', 'download']
+    metrics = queue.metrics()
+    assert metrics['written'] == 3 and metrics['failed'] == 1
+
+def test_failed_batch_is_requeued_in_order(app, monkeypatch):
+    queue = EventQueue(batch_size=10)
+    for event_type in ('view', 'like'):
+        queue.enqueue(event_type)
+
+    def locked(*args, **kwargs):
+        raise OperationalError('INSERT', {}, Exception('database is locked'))
+    with app.app_context():
+        monkeypatch.setattr(db.engine, 'begin', locked)
+        try:
+            queue.flush()
+        except OperationalError:
+            pass
+        monkeypatch.undo()
+        queue.enqueue('download')
+        assert queue.flush() == 3
+    assert stored_types(app) == ['view', 'like', 'download']
+    assert queue.metrics()['requeued'] == 2
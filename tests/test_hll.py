@@ -0,0 +1,64 @@
+import os
+import sys
+
+import pytest
+
+# Add the repository root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.hll import HyperLogLog, relative_error
+
+def sketch_of(values, precision=12):
+    sketch = HyperLogLog(precision)
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+@pytest.mark.parametrize('true_count', [10, 1000, 20000, 200000])
+def test_estimate_within_three_standard_errors(true_count):
+    sketch = sketch_of(f'user:{i}' for i in range(true_count))
+    assert abs(sketch.count() - true_count) <= 3 * relative_error() * true_count
+
+def test_small_counts_are_nearly_exact():
+    assert HyperLogLog().count() == 0
+    assert sketch_of(['a', 'b', 'c']).count() == 3
+
+def test_duplicates_are_counted_once():
+    once = sketch_of(f's:{i}' for i in range(500))
+    twice = sketch_of([f's:{i}' for i in range(500)] * 2)
+    assert once.registers == twice.registers
+
+def test_merge_is_the_sketch_of_the_union():
+    left = sketch_of(f'v:{i}' for i in range(0, 6000))
+    right = sketch_of(f'v:{i}' for i in range(4000, 10000))
+    union = sketch_of(f'v:{i}' for i in range(0, 10000))
+    assert HyperLogLog.union([left, right]).registers == union.registers
+
+def test_merge_is_idempotent():
+    left = sketch_of(f'a:{i}' for i in range(3000))
+    right = sketch_of(f'b:{i}' for i in range(3000))
+    merged = HyperLogLog.union([left, right])
+    again = HyperLogLog.union([merged, left, right, merged])
+    assert again.registers == merged.registers
+    assert HyperLogLog.union([left, left]).registers == left.registers
+
+def test_union_of_nothing_is_empty():
+    assert HyperLogLog.union([]).count() == 0
+
+def test_merge_rejects_different_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(12).merge(HyperLogLog(10))
+
+@pytest.mark.parametrize('precision', [4, 12, 16])
+def test_bytes_round_trip(precision):
+    sketch = sketch_of((f'x:{i}' for i in range(5000)), precision)
+    restored = HyperLogLog.from_bytes(sketch.to_bytes())
+    assert restored.precision == precision
+    assert restored.registers == sketch.registers
+    assert restored.count() == sketch.count()
+
+def test_invalid_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(3)
+    with pytest.raises(ValueError):
+        HyperLogLog(12, bytes(100))
@@ -0,0 +1,83 @@
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from PIL import Image
+
+from src.models.user import db
+from src.models.wallpaper import Wallpaper
+from src.utils.image_tasks import ImageProcessor
+from src.utils.storage import storage
+
+@pytest.fixture
+def processor(app, upload_folder):
+    processor = ImageProcessor(max_workers=1, retry_delay=0.01)
+    processor.app = app
+    processor.upload_folder = upload_folder
+    yield processor
+    processor.shutdown()
+
+def wait_for_status(app, wallpaper_id, status, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        with app.app_context():
+            wallpaper = db.session.get(Wallpaper, wallpaper_id)
+            if wallpaper.processing_status == status or time.monotonic() > deadline:
+                return wallpaper
+        time.sleep(0.05)
+
+def test_broken_pool_is_replaced(app, add_wallpapers, processor, upload_folder):
+    Image.new('RGB', (64, 48), 'blue').save(os.path.join(upload_folder, 'blue.jpg'))
+    wallpaper_id, = add_wallpapers(1, filename='blue.jpg', processing_status='processing')
+
+    # A child process dying (crash, OOM kill) breaks the whole pool
+    crashed = processor._get_executor().submit(os._exit, 1)
+    with pytest.raises(BrokenProcessPool):
+        crashed.result(timeout=60)
+
+    processor.submit(wallpaper_id, 'blue.jpg').result(timeout=60)
+    wallpaper = wait_for_status(app, wallpaper_id, 'ready')
+    assert wallpaper.processing_status == 'ready'
+    assert wallpaper.resolution == '64x48'
+
+def test_failed_jobs_are_retried_up_to_max_attempts(app, add_wallpapers, processor, upload_folder):
+    processor.max_attempts = 2
+    with open(os.path.join(upload_folder, 'broken.jpg'), 'wb') as f:
+        f.write(b'not an image')
+    wallpaper_id, = add_wallpapers(1, filename='broken.jpg', processing_status='processing')
+
+    processor.submit(wallpaper_id, 'broken.jpg')
+    wallpaper = wait_for_status(app, wallpaper_id, 'failed')
+    assert wallpaper.processing_status == 'failed'
+    assert wallpaper.processing_attempts == 2
+    assert 'Invalid image file' in wallpaper.processing_error
+
+def test_retry_that_cannot_be_queued_marks_the_row_failed(app, add_wallpapers, processor, upload_folder, monkeypatch):
+    with open(os.path.join(upload_folder, 'broken.jpg'), 'wb') as f:
+        f.write(b'not an image')
+    wallpaper_id, = add_wallpapers(1, filename='broken.jpg', processing_status='processing')
+
+    # The first attempt runs; the original can't be fetched again for the retry
+    ensure_local = storage.ensure_local
+    calls = []
+    def flaky_ensure_local(key):
+        calls.append(key)
+        if len(calls) > 1:
+            raise OSError('storage unavailable')
+        return ensure_local(key)
+    monkeypatch.setattr(storage, 'ensure_local', flaky_ensure_local)
+
+    processor.submit(wallpaper_id, 'broken.jpg')
+    wallpaper = wait_for_status(app, wallpaper_id, 'failed')
+    assert wallpaper.processing_status == 'failed'
+    assert wallpaper.processing_attempts == 1
+    assert wallpaper.processing_error == 'Could not resubmit: storage unavailable'
+
+def test_retry_after_shutdown_leaves_the_job_to_another_worker(app, add_wallpapers, processor):
+    wallpaper_id, = add_wallpapers(1, filename='gone.jpg', processing_status='processing')
+
+    processor.shutdown()
+    processor._retry(wallpaper_id, 'gone.jpg')
+    with app.app_context():
+        assert db.session.get(Wallpaper, wallpaper_id).processing_status == 'processing'
@@ -0,0 +1,75 @@
+from datetime import datetime
+
+import pytest
+
+from src.models.user import db
+from src.models.wallpaper import Wallpaper
+from src.utils.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+def walk(client, url):
+    """Follow next_cursor from the first page; returns the ids in order and the number of pages"""
+    ids, cursor, pages = [], '', 0
+    while cursor is not None:
+        separator = '&' if '?' in url else '?'
+        page = client.get(f'{url}{separator}cursor={cursor}').get_json()
+        ids.extend(w['id'] for w in page['wallpapers'])
+        cursor = page['next_cursor']
+        pages += 1
+    return ids, pages
+
+def test_cursor_round_trip():
+    moment = datetime(2024, 5, 1, 12, 30, 15, 250)
+    cursor = encode_cursor('created_at', 'desc', moment, 42)
+    assert decode_cursor(cursor, 'created_at', 'desc') == (moment, 42)
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, 'created_at', 'asc')
+    with pytest.raises(InvalidCursor):
+        decode_cursor('not a cursor', 'created_at', 'desc')
+
+def test_walks_every_row_once_with_ties(client, add_wallpapers):
+    # Three rows per timestamp, so pages split inside groups of equal sort values
+    ids = []
+    for hour in range(10):
+        ids += add_wallpapers(3, created_at=datetime(2024, 1, 1, hour))
+
+    walked, pages = walk(client, '/api/wallpapers?per_page=7')
+    expected = sorted(ids, key=lambda i: ((i - 1) // 3, i), reverse=True)
+    assert walked == expected
+    assert pages == 5
+
+def test_ascending_sort_puts_null_values_last(app, client, add_wallpapers):
+    ids = add_wallpapers(9)
+    with app.app_context():
+        for i, wallpaper_id in enumerate(ids):
+            db.session.get(Wallpaper, wallpaper_id).file_size = None if i % 3 == 0 else 1000 - i
+        db.session.commit()
+
+    walked, _ = walk(client, '/api/wallpapers?per_page=2&sort_by=file_size&order=asc')
+    sized = [i for n, i in enumerate(ids) if n % 3]
+    unsized = [i for n, i in enumerate(ids) if n % 3 == 0]
+    assert walked == sorted(sized, reverse=True) + unsized
+
+def test_new_rows_do_not_shift_later_pages(client, add_wallpapers):
+    ids = add_wallpapers(10)
+
+    first = client.get('/api/wallpapers?per_page=4&cursor=').get_json()
+    add_wallpapers(3, created_at=datetime(2030, 1, 1))
+    second = client.get(f"/api/wallpapers?per_page=4&cursor={first['next_cursor']}").get_json()
+    assert [w['id'] for w in first['wallpapers'] + second['wallpapers']] == ids[::-1][:8]
+
+def test_filters_and_total(client, add_wallpapers):
+    add_wallpapers(5, category='City')
+    add_wallpapers(4, category='Nature')
+
+    page = client.get('/api/wallpapers?category=City&per_page=2&include_total=true&cursor=').get_json()
+    assert page['total'] == 5
+    walked, _ = walk(client, '/api/wallpapers?category=City&per_page=2')
+    assert len(walked) == 5
+
+def test_bad_cursors_are_rejected(client, add_wallpapers):
+    add_wallpapers(3)
+    cursor = client.get('/api/wallpapers?per_page=1&cursor=').get_json()['next_cursor']
+
+    assert client.get('/api/wallpapers?cursor=garbage').status_code == 400
+    assert client.get(f'/api/wallpapers?cursor={cursor}&order=asc').status_code == 400
+    assert client.get('/api/wallpapers?cursor=&sort_by=tags').status_code == 400
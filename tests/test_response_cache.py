@@ -0,0 +1,31 @@
+from werkzeug.datastructures import MultiDict
+
+from src.utils.response_cache import cache_key
+
+def test_key_ignores_parameter_order():
+    assert cache_key('list', MultiDict([('a', '1'), ('b', '2')])) == cache_key('list', MultiDict([('b', '2'), ('a', '1')]))
+
+def test_empty_cursor_is_its_own_entry():
+    assert cache_key('list', MultiDict([('cursor', '')])) != cache_key('list', MultiDict())
+
+def test_page_and_first_cursor_page_are_cached_separately(client, add_wallpapers):
+    add_wallpapers(30)
+
+    page = client.get('/api/wallpapers').get_json()
+    first = client.get('/api/wallpapers?cursor=').get_json()
+    assert 'pages' in page and 'next_cursor' not in page
+    assert first['next_cursor'] is not None
+    assert [w['id'] for w in first['wallpapers']] == [w['id'] for w in page['wallpapers']]
+
+def test_first_cursor_page_does_not_shadow_page_mode(client, add_wallpapers):
+    add_wallpapers(30)
+
+    assert client.get('/api/wallpapers?cursor=').get_json()['next_cursor'] is not None
+    assert 'next_cursor' not in client.get('/api/wallpapers').get_json()
+
+def test_etag_revalidation(client, add_wallpapers):
+    add_wallpapers(3)
+
+    response = client.get('/api/wallpapers')
+    assert response.status_code == 200 and response.headers['ETag']
+    assert client.get('/api/wallpapers', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.models.user import db
+from src.models.analytics import AnalyticsEvent
+from src.models.rollup import AnalyticsRollupDaily, AnalyticsRollupHourly, AnalyticsSketch, RollupState
+from src.utils import rollups
+from src.utils.event_archive import event_archive
+
+NO_LAG = timedelta(0)
+
+@pytest.fixture
+def run(app, tmp_path, monkeypatch):
+    """run(**kwargs) runs run_rollups in an app context after a first run has set the watermark"""
+    monkeypatch.setattr(event_archive, 'root', str(tmp_path / 'archive'))
+    def run(**kwargs):
+        with app.app_context():
+            return rollups.run_rollups(**kwargs)
+    run(safe_lag=NO_LAG)
+    return run
+
+def add_event(app, created_at, received_at=None, **fields):
+    with app.app_context():
+        values = {'event_type': 'view', 'session_id': 's', 'created_at': created_at,
+                  'received_at': received_at or created_at}
+        values.update(fields)
+        event = AnalyticsEvent(**values)
+        db.session.add(event)
+        db.session.commit()
+        return event.id
+
+def total(app, model=AnalyticsRollupDaily):
+    with app.app_context():
+        return db.session.query(db.func.coalesce(db.func.sum(model.count), 0)).filter(
+            model.dimension == 'all', model.event_type == rollups.ALL_EVENTS
+        ).scalar()
+
+def snapshot(app):
+    with app.app_context():
+        return (
+            sorted((r.dimension, r.dimension_key, r.event_type, r.period_start, r.count, r.unique_actors)
+                   for r in AnalyticsRollupDaily.query),
+            sorted((r.dimension, r.dimension_key, r.event_type, r.period_start, r.count)
+                   for r in AnalyticsRollupHourly.query),
+            sorted((s.metric, s.dimension, s.dimension_key, s.day, s.registers) for s in AnalyticsSketch.query)
+        )
+
+def test_recent_events_wait_for_the_safe_lag(app, run):
+    now = datetime.utcnow()
+    add_event(app, now - timedelta(hours=1))
+    add_event(app, now)
+    # Received before the recent one but with a higher id, as a slow commit would be
+    add_event(app, now - timedelta(hours=1))
+
+    stats = run()
+    assert stats['events'] == 1
+    assert total(app) == 1
+    assert run(safe_lag=NO_LAG)['events'] == 2
+    assert total(app) == 3
+
+def test_stalled_scheduler_still_merges_on_time_events(app, run):
+    created_at = datetime.utcnow() - timedelta(days=5)
+    add_event(app, created_at, received_at=created_at + timedelta(minutes=5))
+
+    stats = run(safe_lag=NO_LAG)
+    assert (stats['events'], stats['late_events']) == (1, 0)
+    assert total(app) == total(app, AnalyticsRollupHourly) == 1
+
+def test_events_received_after_the_late_window_are_skipped(app, run):
+    add_event(app, datetime.utcnow() - timedelta(days=5), received_at=datetime.utcnow())
+
+    stats = run(safe_lag=NO_LAG)
+    assert (stats['events'], stats['late_events']) == (1, 1)
+    assert total(app) == 0
+
+def test_legacy_events_fall_back_to_their_event_time(app, run):
+    event_id = add_event(app, datetime.utcnow() - timedelta(days=5))
+    with app.app_context():
+        AnalyticsEvent.query.filter_by(id=event_id).update({AnalyticsEvent.received_at: None})
+        db.session.commit()
+
+    stats = run()
+    assert (stats['events'], stats['late_events']) == (1, 0)
+    assert total(app) == 1
+
+def test_rebuild_matches_the_incremental_run(app, run, add_wallpapers):
+    wallpaper_id, = add_wallpapers(1)
+    start = datetime.utcnow() - timedelta(days=3)
+    for i in range(40):
+        add_event(app, start + timedelta(hours=i), event_type=('view', 'download')[i % 2],
+                  wallpaper_id=wallpaper_id if i % 3 else None, user_id=1 if i % 4 == 0 else None,
+                  session_id=f's{i % 7}')
+    run(safe_lag=NO_LAG)
+    incremental = snapshot(app)
+
+    assert run(rebuild=True, safe_lag=NO_LAG)['rebuild']
+    assert snapshot(app) == incremental
+    assert total(app) == 40
+
+def test_watermark_conflict_merges_nothing(app, run, monkeypatch):
+    event_id = add_event(app, datetime.utcnow() - timedelta(hours=1))
+    claim = rollups._claim
+
+    def claimed_by_another_run(old, new):
+        # Another worker merges the same batch between our read and our claim
+        db.session.execute(RollupState.__table__.update().values(last_event_id=new))
+        db.session.commit()
+        return claim(old, new)
+    monkeypatch.setattr(rollups, '_claim', claimed_by_another_run)
+
+    stats = run(safe_lag=NO_LAG)
+    assert stats['conflict'] and stats['events'] == 0
+    assert total(app) == 0
+    with app.app_context():
+        assert db.session.get(RollupState, rollups.STATE_NAME).last_event_id == event_id
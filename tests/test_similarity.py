@@ -0,0 +1,61 @@
+from src.models.user import db
+from src.models.wallpaper import Wallpaper
+from src.utils.similarity import SimilarityIndex
+
+HASH = 'ffff0000ffff0000'
+NEAR = 'ffff0000ffff0001'
+
+def set_hash(app, wallpaper_id, phash, status='ready'):
+    with app.app_context():
+        wallpaper = db.session.get(Wallpaper, wallpaper_id)
+        wallpaper.phash = phash
+        wallpaper.processing_status = status
+        db.session.commit()
+
+def test_finds_near_duplicates_and_skips_excluded(app, add_wallpapers):
+    first, second = add_wallpapers(2, phash=HASH)
+    index = SimilarityIndex(catch_up_interval=0)
+    with app.app_context():
+        assert index.find(NEAR) == [(1, first), (1, second)]
+        assert index.find(HASH, exclude_id=first) == [(0, second)]
+
+def test_stuck_upload_does_not_hold_back_newer_rows(app, add_wallpapers):
+    stuck, = add_wallpapers(1, processing_status='processing')
+    index = SimilarityIndex(catch_up_interval=0)
+    with app.app_context():
+        assert index.find(HASH) == []
+
+    later, = add_wallpapers(1, phash=HASH)
+    with app.app_context():
+        assert index.find(HASH) == [(0, later)]
+        assert index._max_id == later
+        assert index._pending == {stuck}
+
+    # Hashed by another worker: picked up from the pending set, then dropped from it
+    set_hash(app, stuck, NEAR)
+    with app.app_context():
+        assert index.find(HASH) == [(0, later), (1, stuck)]
+        assert index._pending == set()
+
+def test_failed_upload_leaves_the_pending_set(app, add_wallpapers):
+    failed, = add_wallpapers(1, processing_status='processing')
+    index = SimilarityIndex(catch_up_interval=0)
+    with app.app_context():
+        index.find(HASH)
+    set_hash(app, failed, None, status='failed')
+    with app.app_context():
+        index.find(HASH)
+        assert index._pending == set()
+
+def test_searches_within_the_interval_do_not_query(app, add_wallpapers):
+    index = SimilarityIndex(catch_up_interval=3600)
+    with app.app_context():
+        assert index.find(HASH) == []
+    add_wallpapers(1, phash=HASH)
+    with app.app_context():
+        assert index.find(HASH) == []
+
+    # Hashes set on this worker are added without waiting for a catch-up
+    index.add(99, HASH)
+    with app.app_context():
+        assert index.find(HASH) == [(0, 99)]
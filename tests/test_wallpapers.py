@@ -0,0 +1,47 @@
+from src.models.user import db
+from src.models.wallpaper import Wallpaper
+
+def log_in(client, user_id=1, role='user'):
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['role'] = role
+
+def test_all_means_no_filter(client, add_wallpapers):
+    add_wallpapers(3, category='Nature')
+    add_wallpapers(2, category='City', status='pending')
+
+    assert client.get('/api/wallpapers?status=all&category=all').get_json()['total'] == 5
+    assert client.get('/api/wallpapers?status=pending').get_json()['total'] == 2
+    assert client.get('/api/wallpapers?category=City&status=all').get_json()['total'] == 2
+
+def test_moderation_reaches_the_listing(app, client, add_wallpapers):
+    wallpaper_id, = add_wallpapers(1, status='pending')
+    assert client.get('/api/wallpapers?status=approved').get_json()['total'] == 0
+
+    log_in(client)
+    assert client.put(f'/api/wallpapers/{wallpaper_id}/status', json={'status': 'approved'}).status_code == 403
+    log_in(client, role='moderator')
+    assert client.put(f'/api/wallpapers/{wallpaper_id}/status', json={'status': 'gone'}).status_code == 400
+    response = client.put(f'/api/wallpapers/{wallpaper_id}/status', json={'status': 'approved'})
+    assert response.status_code == 200
+    assert response.get_json()['wallpaper']['status'] == 'approved'
+
+    listing = client.get('/api/wallpapers?status=approved').get_json()
+    assert [w['id'] for w in listing['wallpapers']] == [wallpaper_id]
+
+def test_tag_edits_are_stored(app, client, add_wallpapers):
+    wallpaper_id, = add_wallpapers(1)
+
+    log_in(client, user_id=1)
+    response = client.put(f'/api/wallpapers/{wallpaper_id}/tags', json={'tags': ['sea', 'blue']})
+    assert response.status_code == 200
+    assert client.get('/api/wallpapers?tags=sea').get_json()['total'] == 1
+    with app.app_context():
+        assert db.session.get(Wallpaper, wallpaper_id).tags == '["sea", "blue"]'
+
+def test_recent_reads_the_database(client, add_wallpapers):
+    ids = add_wallpapers(12)
+
+    recent = client.get('/api/wallpapers/recent').get_json()
+    assert recent['count'] == 10
+    assert [w['id'] for w in recent['wallpapers']] == ids[::-1][:10]